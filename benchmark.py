@@ -0,0 +1,274 @@
+"""Benchmark move generation, region assignment, scoring and search on fixed positions; prints JSON
+
+	python benchmark.py > bench.json
+	python benchmark.py --layouts bl_5x5_3v3 bl_3x3_2v2 --baseline bench.json
+	python benchmark.py --quick
+
+Each layout in engine.py is measured at the opening, middlegame and endgame. The later positions come from a
+seeded random game (moves sorted by hex, so engine changes to move order don't change them).
+
+Perft counts (leaf nodes of the full move tree to a fixed depth) double as correctness checks:
+GameState and BitboardGameState must agree, and so must --baseline. Mismatches are listed under
+"errors" and the exit status is 1.
+
+PVS (minimax.PVS, and SearchTimedPVS against SearchTimed) searches the same positions to the same depth
+as minimax; compare the node counts. Its scores must match minimax's to within PVS rounding.
+"""
+
+from __future__ import annotations
+
+import argparse
+import copy
+import json
+import platform
+import random
+import sys
+import time
+from typing import *
+
+from engine import Board, GameState, BitboardGameState, Move, RegionType, Side, MpNameLayout
+from minimax import *
+
+
+# Fraction of hexes covered by stones at each phase
+s_mpPhaseFracStone = {"opening": 0.0, "middlegame": 0.2, "endgame": 0.4}
+
+# Deep enough to take up to a few seconds per engine at the opening; a full run takes about a minute
+s_mpLayoutPerftDepth = {"bl_Standard": 2, "bl_5x5_3v3": 2, "bl_4x4_2v2": 2, "bl_3x4_2v2": 3, "bl_3x3_2v2": 3, "bl_3x3_1v1": 3,
+						"bl_2x2_1v1": 5, "bl_2x3_1v1": 4}
+s_mpLayoutLookahead = {"bl_Standard": 2, "bl_5x5_3v3": 2, "bl_4x4_2v2": 3, "bl_3x4_2v2": 3, "bl_3x3_2v2": 3, "bl_3x3_1v1": 4,
+					   "bl_2x2_1v1": 6, "bl_2x3_1v1": 5}
+
+s_aClsState = (GameState, BitboardGameState)
+
+
+def MpPhaseGs(board:Board, seed:str) -> Dict[str, GameState]:
+	"""Position for each phase, reached by the same seeded random game"""
+
+	rng = random.Random(seed)
+	gs = GameState(board)
+	mpPhaseGs = {}
+	for phase,frac in sorted(s_mpPhaseFracStone.items(), key=lambda item: item[1]):
+		cStone = round(frac * len(board.Hexes()))
+		while gs.maskStone.bit_count() < cStone:
+			gsNext = gs.DoMove(rng.choice(sorted(gs.Moves(), key=Move.Pack)))
+			if gsNext.sideToPlay == None:
+				break # keep a position that still has moves
+			gs = gsNext
+		mpPhaseGs[phase] = gs
+	return mpPhaseGs
+
+def StateFromGs(clsState:type, gs:GameState) -> AbstractGameState:
+	return gs if clsState == GameState else clsState(gs=gs)
+
+def Perft(gs:AbstractGameState, depth:int) -> int:
+	"""Count of positions depth moves from gs. Finished games before depth count as none"""
+
+	if depth == 0:
+		return 1
+	moves = list(gs.Moves())
+	if depth == 1:
+		return len(moves)
+
+	cLeaf = 0
+	for move in moves:
+		gsChild = gs.DoMove(move)
+		try:
+			cLeaf += Perft(gsChild, depth - 1)
+		finally:
+			if gs.fInPlace:
+				gs.UndoMove(move)
+	return cLeaf
+
+def SecPerCall(fn:Callable[[], None], secMin:float) -> float:
+	"""Average time per call to fn, calling it repeatedly for at least secMin"""
+
+	cCall = 0
+	timeStart = time.perf_counter()
+	while True:
+		fn()
+		cCall += 1
+		sec = time.perf_counter() - timeStart
+		if sec >= secMin:
+			return sec / cCall
+
+def AssignRegionsFn(gs:AbstractGameState) -> Callable[[], None]:
+	"""Function that redoes gs's region assignment from scratch, leaving gs as it was"""
+
+	if isinstance(gs, BitboardGameState):
+		maskOpen = gs.board.maskAll & ~gs.maskStone
+		return lambda: gs.AssignRegions(maskOpen, ())
+
+	mpIHexType = [RegionType.Stone if type == RegionType.Stone else RegionType.Contested for type in gs.mpIHexType]
+	gsScratch = copy.copy(gs)
+	def AssignRegions():
+		gsScratch.mpIHexType = list(mpIHexType)
+		gsScratch.regions = []
+		gsScratch.AssignRegions()
+	return AssignRegions
+
+def MpKeyResult(gsPhase:GameState, depthPerft:int, lookahead:int, secMin:float) -> Dict[str, object]:
+	"""Measurements for one position, with one entry per engine under each benchmark"""
+
+	mpKeyResult = {
+		"stones": gsPhase.maskStone.bit_count(),
+		"zobrist": f"{gsPhase.zobrist:016x}",
+		"moves": len(list(gsPhase.Moves())),
+		"perft": {"depth": depthPerft},
+		"assignRegions": {},
+		"scoreEstimate": {},
+		"minimax": {"lookahead": lookahead},
+		"pvs": {"lookahead": lookahead},
+		"deepening": {"lookahead": lookahead},
+	}
+
+	fMax = gsPhase.sideToPlay == Side.Red
+	for clsState in s_aClsState:
+		name = clsState.__name__
+
+		gs = StateFromGs(clsState, gsPhase)
+		timeStart = time.perf_counter()
+		cLeaf = Perft(gs, depthPerft)
+		sec = time.perf_counter() - timeStart
+		mpKeyResult["perft"][name] = {"nodes": cLeaf, "sec": sec, "nodesPerSec": cLeaf / sec if sec > 0 else None}
+
+		mpKeyResult["assignRegions"][name] = {"usec": SecPerCall(AssignRegionsFn(gs), secMin) * 1e6}
+		mpKeyResult["scoreEstimate"][name] = {"usec": SecPerCall(gs.ScoreEstimate, secMin) * 1e6}
+
+		ctx = SearchContext(TranspositionTable(), orderer=MoveOrderer(), stats=SearchStats())
+		timeStart = time.perf_counter()
+		move,score = MinimaxRecursive(gs, fMax, lookahead, -sys.float_info.max, sys.float_info.max, ctx)
+		sec = time.perf_counter() - timeStart
+		mpKeyResult["minimax"][name] = {
+			"nodes": ctx.cNode,
+			"sec": sec,
+			"nodesPerSec": ctx.cNode / sec if sec > 0 else None,
+			"move": None if move == None else [move.iHexFrom, move.iHexTo, move.iHexStone],
+			"score": score,
+			"stats": ctx.stats.ToDict(),
+		}
+
+		# PVS at the same depth, alone and iteratively deepened against SearchTimed; node counts are what to compare
+
+		stats = SearchStats()
+		timeStart = time.perf_counter()
+		move,score = PVS(gs, fMax, lookahead, tt=TranspositionTable(), stats=stats)
+		sec = time.perf_counter() - timeStart
+		mpKeyResult["pvs"][name] = {
+			"nodes": stats.CNode(),
+			"sec": sec,
+			"nodesVsMinimax": stats.CNode() / ctx.cNode,
+			"move": None if move == None else [move.iHexFrom, move.iHexTo, move.iHexStone],
+			"score": score,
+			"stats": stats.ToDict(),
+		}
+
+		mpKeyResult["deepening"][name] = {}
+		for nameSearch,fnSearch in (("minimax", SearchTimed), ("pvs", SearchTimedPVS)):
+			move,score,info = fnSearch(gs, fMax, None, tt=TranspositionTable(), lookaheadMax=lookahead, stats=SearchStats())
+			mpKeyResult["deepening"][name][nameSearch] = {"nodes": info.cNode, "sec": info.sec, "score": score, "stats": info.stats.ToDict()}
+
+	return mpKeyResult
+
+def AErrorCrossCheck(nameLayout:str, phase:str, mpKeyResult:Dict[str, object]) -> List[str]:
+	"""Disagreements between the engines on the same position"""
+
+	aError = []
+	for key,keySub in (("perft", "nodes"), ("minimax", "score"), ("minimax", "move")):
+		aValue = [mpKeyResult[key][clsState.__name__][keySub] for clsState in s_aClsState]
+		if any(value != aValue[0] for value in aValue):
+			aError.append(f"{nameLayout} {phase}: {key} {keySub} differs between engines: {aValue}")
+
+	# PVS rounds leaf scores to PVS units, so its score can differ from Minimax's by that much (and its move on a near tie)
+
+	for clsState in s_aClsState:
+		name = clsState.__name__
+		scoreMinimax = mpKeyResult["minimax"][name]["score"]
+		aScore = [mpKeyResult["pvs"][name]["score"]] + [mpKeyResult["deepening"][name][nameSearch]["score"] for nameSearch in ("minimax", "pvs")]
+		if any(abs(score - scoreMinimax) > 1 / s_scorePvsScale for score in aScore):
+			aError.append(f"{nameLayout} {phase}: {name} pvs/deepening scores {aScore} differ from minimax {scoreMinimax}")
+	return aError
+
+def AErrorBaseline(results:Dict[str, object], resultsBaseline:Dict[str, object]) -> List[str]:
+	"""Compares against an earlier run; prints timing ratios to stderr and returns correctness mismatches"""
+
+	aError = []
+	for nameLayout,mpPhaseResult in results["layouts"].items():
+		mpPhaseBaseline = resultsBaseline["layouts"].get(nameLayout, {})
+		for phase,mpKeyResult in mpPhaseResult.items():
+			mpKeyBaseline = mpPhaseBaseline.get(phase)
+			if mpKeyBaseline == None:
+				continue
+			if mpKeyBaseline["zobrist"] != mpKeyResult["zobrist"]:
+				aError.append(f"{nameLayout} {phase}: position differs from baseline (seed or layout changed?)")
+				continue
+
+			for clsState in s_aClsState:
+				name = clsState.__name__
+				if mpKeyBaseline["perft"]["depth"] == mpKeyResult["perft"]["depth"]:
+					cLeaf = mpKeyResult["perft"][name]["nodes"]
+					cLeafBaseline = mpKeyBaseline["perft"][name]["nodes"]
+					if cLeaf != cLeafBaseline:
+						aError.append(f"{nameLayout} {phase}: {name} perft {cLeaf}, baseline {cLeafBaseline}")
+
+				aRatio = []
+				for key,keyTime in (("perft", "sec"), ("assignRegions", "usec"), ("scoreEstimate", "usec"), ("minimax", "sec")):
+					aRatio.append(f"{key} {mpKeyResult[key][name][keyTime] / mpKeyBaseline[key][name][keyTime]:.2f}x")
+				print(f"{nameLayout:<12} {phase:<10} {name:<17} " + ", ".join(aRatio), file=sys.stderr)
+
+	return aError
+
+
+def Main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--layouts", nargs="+", default=None, help="layout names (default all)")
+	parser.add_argument("--phases", nargs="+", default=list(s_mpPhaseFracStone), choices=list(s_mpPhaseFracStone))
+	parser.add_argument("--seed", default="0", help="seed for the random games that reach later phases")
+	parser.add_argument("--quick", action="store_true", help="one less ply of perft and search, shorter timing loops")
+	parser.add_argument("--baseline", default=None, help="earlier JSON output to check perft counts and compare times against")
+	parser.add_argument("--output", default=None, help="write JSON here instead of stdout")
+	args = parser.parse_args()
+
+	mpNameLayout = MpNameLayout()
+	aNameLayout = args.layouts if args.layouts != None else list(mpNameLayout)
+	dPly = 1 if args.quick else 0
+	secMin = 0.05 if args.quick else 0.25
+
+	results = {
+		"python": platform.python_version(),
+		"seed": args.seed,
+		"quick": args.quick,
+		"layouts": {},
+		"errors": [],
+	}
+
+	for nameLayout in aNameLayout:
+		board = Board(mpNameLayout[nameLayout])
+		depthPerft = max(1, s_mpLayoutPerftDepth.get(nameLayout, 2) - dPly)
+		lookahead = max(1, s_mpLayoutLookahead.get(nameLayout, 2) - dPly)
+
+		mpPhaseGs = MpPhaseGs(board, f"{nameLayout}/{args.seed}")
+		mpPhaseResult = results["layouts"][nameLayout] = {}
+		for phase in args.phases:
+			print(f"{nameLayout} {phase}", file=sys.stderr)
+			mpKeyResult = mpPhaseResult[phase] = MpKeyResult(mpPhaseGs[phase], depthPerft, lookahead, secMin)
+			results["errors"] += AErrorCrossCheck(nameLayout, phase, mpKeyResult)
+
+	if args.baseline != None:
+		with open(args.baseline) as file:
+			results["errors"] += AErrorBaseline(results, json.load(file))
+
+	strJson = json.dumps(results, indent=1)
+	if args.output != None:
+		with open(args.output, "w") as file:
+			file.write(strJson + "\n")
+	else:
+		print(strJson)
+
+	for error in results["errors"]:
+		print(f"error: {error}", file=sys.stderr)
+	sys.exit(1 if results["errors"] else 0)
+
+
+if __name__ == "__main__":
+	Main()
@@ -0,0 +1,61 @@
+"""Benchmark ParallelSearch speedup versus worker count
+
+	python benchparallel.py
+	python benchparallel.py --workers 1 2 4 8 --layouts bl_5x5_3v3 --lookahead 3
+"""
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import time
+
+from engine import Board, BitboardGameState, MpNameLayout
+from minimax import *
+
+
+# Deep enough that each root move is real work, shallow enough to finish in a minute or so serially
+s_mpLayoutLookahead = {"bl_Standard": 2, "bl_5x5_3v3": 3}
+
+
+def Main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--layouts", nargs="+", default=list(s_mpLayoutLookahead))
+	parser.add_argument("--workers", nargs="+", type=int, default=None, help="worker counts (default 1, 2, 4 ... cpu count)")
+	parser.add_argument("--lookahead", type=int, default=None, help="override per-layout lookahead")
+	args = parser.parse_args()
+
+	cWorkers = args.workers
+	if cWorkers == None:
+		cWorkers = [1]
+		while cWorkers[-1] * 2 <= multiprocessing.cpu_count():
+			cWorkers.append(cWorkers[-1] * 2)
+		if cWorkers[-1] != multiprocessing.cpu_count():
+			cWorkers.append(multiprocessing.cpu_count())
+
+	print(f"{'layout':<12} {'workers':>7} {'lookahead':>9} {'sec':>8} {'speedup':>7} {'nodes':>9}  move, score")
+
+	for name in args.layouts:
+		gs = BitboardGameState(board=Board(MpNameLayout()[name]))
+		lookahead = args.lookahead if args.lookahead != None else s_mpLayoutLookahead.get(name, 2)
+
+		timeStart = time.perf_counter()
+		ctx = SearchContext(TranspositionTable(), orderer=MoveOrderer())
+		move,score = MinimaxRecursive(gs, True, lookahead, -sys.float_info.max, sys.float_info.max, ctx)
+		secSerial = time.perf_counter() - timeStart
+		print(f"{name:<12} {'serial':>7} {lookahead:>9} {secSerial:>8.2f} {1.0:>7.2f} {ctx.cNode:>9}  {move}, {score:.3f}")
+
+		for cWorker in cWorkers:
+			with ParallelSearch(cWorker) as search:
+				# Get the workers started before timing
+				list(search.executor.map(abs, range(cWorker * 4)))
+
+				timeStart = time.perf_counter()
+				move,score = search.Search(gs, True, lookahead)
+				sec = time.perf_counter() - timeStart
+
+			print(f"{name:<12} {cWorker:>7} {lookahead:>9} {sec:>8.2f} {secSerial / sec:>7.2f} {search.cNode:>9}  {move}, {score:.3f}")
+
+
+if __name__ == "__main__":
+	Main()
@@ -0,0 +1,230 @@
+"""Exact endgame solver: splits the position into its contested regions and searches their sum
+
+Contested regions are separated by stones, so a move in one can't change what's visible in another;
+each is an independent subgame. A region's moves and what they leave behind (the smaller regions a
+stone splits it into, and the hexes that become settled) depend only on the region's hexes and the
+vikings in it, so they're worked out once per region contents and shared by every position containing
+that region. The regions are then combined by an exact alpha-beta search over their sum, memoized on
+(regions, side to play), since which region to play in and when is what the game is about.
+
+Values are the final settled hexes (Red minus White) still to be won from the contested regions. As in
+selfplay.PlayGame, a side to play with no moves ends the game, and contested hexes then count for no one.
+
+	solver = EndgameSolver(board)
+	if solver.FSolvable(gs):
+		move,score = solver.Solve(gs, msBudget) # final MpSideScore difference with perfect play; may raise SearchTimeout
+"""
+
+from __future__ import annotations
+
+from typing import *
+
+import time
+
+from engine import *
+from minimax import SearchTimeout
+
+
+# A region is (maskRegion, maskRed, maskWhite): its hexes and the vikings of each side in it
+
+RegionKey = Tuple[int, int, int]
+
+
+class EndgameSolver:
+	"""Memoized exact search for one Board; reuse it across moves, since regions recur as the game goes on"""
+
+	def __init__(self:EndgameSolver, board:Board, cHexMax:int = 14):
+		self.board = board
+		self.cHexMax = cHexMax # FSolvable limit on contested hexes
+
+		# (region, side) -> [(dScore, (child regions), (iHexFrom, iHexTo, iHexStone)), ...] for each distinct outcome
+
+		self.mpRegionSideAOutcome:Dict[Tuple[RegionKey, Side], List[Tuple[int, Tuple[RegionKey], Tuple[int,int,int]]]] = {}
+
+		# (sorted regions, side) -> (lower bound, upper bound) on the value
+
+		self.mpPositionBounds:Dict[Tuple[Tuple[RegionKey], Side], Tuple[int, int]] = {}
+
+		self.cNode = 0
+		self.timeEnd:float = None # perf_counter deadline for Solve
+		self.eventCancel = None # threading.Event that stops Solve when set
+
+	def Clear(self:EndgameSolver):
+		self.mpRegionSideAOutcome.clear()
+		self.mpPositionBounds.clear()
+
+	@staticmethod
+	def ARegion(gs:AbstractGameState) -> List[RegionKey]:
+		"""Contested regions of a GameState or BitboardGameState"""
+
+		if isinstance(gs, BitboardGameState):
+			aMaskRegion = gs.aMaskContested
+			maskRed,maskWhite = gs.mpSideMaskVik
+		else:
+			aMaskRegion = [region.mask for region in gs.regions if region.type == RegionType.Contested]
+			maskRed = sum(1 << iHex for iHex,vik in gs.mpIHexVik.items() if vik.side == Side.Red)
+			maskWhite = gs.maskVik & ~maskRed
+		return [(maskRegion, maskRegion & maskRed, maskRegion & maskWhite) for maskRegion in aMaskRegion]
+
+	def FSolvable(self:EndgameSolver, gs:AbstractGameState) -> bool:
+		"""Game still going, with few enough contested hexes to solve quickly"""
+
+		if gs.sideToPlay == None:
+			return False
+		return sum(maskRegion.bit_count() for maskRegion,_,_ in EndgameSolver.ARegion(gs)) <= self.cHexMax
+
+	def AOutcome(self:EndgameSolver, region:RegionKey, side:Side) -> List[Tuple[int, Tuple[RegionKey], Tuple[int,int,int]]]:
+		"""Moves for side within region, as (settled hexes won, Red minus White; regions left contested; hexes of one move).
+		   Moves with the same outcome are merged"""
+
+		aOutcome = self.mpRegionSideAOutcome.get((region, side))
+		if aOutcome != None:
+			return aOutcome
+
+		board = self.board
+		maskRegion,maskRed,maskWhite = region
+		maskBlock = (board.maskAll & ~maskRegion) | maskRed | maskWhite
+		maskSide = maskRed if side == Side.Red else maskWhite
+
+		mpResultOutcome = {}
+		while maskSide:
+			bitFrom = maskSide & -maskSide
+			maskSide ^= bitFrom
+			iHexFrom = bitFrom.bit_length() - 1
+
+			maskTo = board.MaskVisible(iHexFrom, maskBlock)
+			while maskTo:
+				bitTo = maskTo & -maskTo
+				maskTo ^= bitTo
+				iHexTo = bitTo.bit_length() - 1
+
+				maskRedTo,maskWhiteTo = maskRed,maskWhite
+				if side == Side.Red:
+					maskRedTo = (maskRed & ~bitFrom) | bitTo
+				else:
+					maskWhiteTo = (maskWhite & ~bitFrom) | bitTo
+
+				maskStone = board.MaskVisible(iHexTo, maskBlock & ~bitFrom)
+				while maskStone:
+					bitStone = maskStone & -maskStone
+					maskStone ^= bitStone
+
+					result = self.Split(maskRegion & ~bitStone, maskRedTo, maskWhiteTo)
+					if result not in mpResultOutcome:
+						mpResultOutcome[result] = (result[0], result[1], (iHexFrom, iHexTo, bitStone.bit_length() - 1))
+
+		# Best immediate gain for side first, so alpha-beta cuts off sooner
+
+		aOutcome = sorted(mpResultOutcome.values(), key=lambda outcome: -outcome[0] if side == Side.Red else outcome[0])
+		self.mpRegionSideAOutcome[(region, side)] = aOutcome
+		return aOutcome
+
+	def Split(self:EndgameSolver, maskOpen:int, maskRed:int, maskWhite:int) -> Tuple[int, Tuple[RegionKey]]:
+		"""Settled hexes won (Red minus White) and the regions still contested, once maskOpen splits apart"""
+
+		dScore = 0
+		aRegion = []
+		while maskOpen:
+			bit = maskOpen & -maskOpen
+			maskPiece = self.board.MaskConnected(bit.bit_length() - 1, maskOpen)
+			maskOpen &= ~maskPiece
+
+			maskRedPiece = maskPiece & maskRed
+			maskWhitePiece = maskPiece & maskWhite
+			if maskRedPiece and maskWhitePiece:
+				aRegion.append((maskPiece, maskRedPiece, maskWhitePiece))
+			elif maskRedPiece:
+				dScore += maskPiece.bit_count()
+			elif maskWhitePiece:
+				dScore -= maskPiece.bit_count()
+		return dScore, tuple(aRegion)
+
+	def Value(self:EndgameSolver, aRegion:Tuple[RegionKey], side:Side, alpha:int, beta:int) -> int:
+		"""Exact value of the sum of aRegion (sorted) with side to play, if it's within (alpha, beta);
+		   otherwise a bound on the far side of the window, as usual for alpha-beta"""
+
+		if not aRegion:
+			return 0
+
+		key = (aRegion, side)
+		lower,upper = self.mpPositionBounds.get(key, (-1 << 30, 1 << 30))
+		if lower >= beta:
+			return lower
+		if upper <= alpha:
+			return upper
+		if lower == upper:
+			return lower
+		alpha = max(alpha, lower)
+		beta = min(beta, upper)
+
+		self.cNode += 1
+		if (self.cNode & 0x3ff) == 0 and ((self.timeEnd != None and time.perf_counter() > self.timeEnd) or
+										  (self.eventCancel != None and self.eventCancel.is_set())):
+			raise SearchTimeout() # bounds stored so far are still right, so a later Solve can pick up from here
+		fMax = side == Side.Red
+		sideNext = side.Opposite()
+		alphaOrig,betaOrig = alpha,beta
+
+		valueBest = None
+		for iRegion,region in enumerate(aRegion):
+			aRegionRest = aRegion[:iRegion] + aRegion[iRegion + 1:]
+			for dScore,aRegionChild,_ in self.AOutcome(region, side):
+				value = dScore + self.Value(tuple(sorted(aRegionRest + aRegionChild)), sideNext, alpha - dScore, beta - dScore)
+				if fMax:
+					if valueBest == None or value > valueBest:
+						valueBest = value
+					alpha = max(alpha, value)
+				else:
+					if valueBest == None or value < valueBest:
+						valueBest = value
+					beta = min(beta, value)
+				if alpha >= beta:
+					break
+			if alpha >= beta:
+				break
+
+		if valueBest == None:
+			valueBest = 0 # side to play is stuck; game over
+
+		if valueBest <= alphaOrig:
+			upper = valueBest
+		elif valueBest >= betaOrig:
+			lower = valueBest
+		else:
+			lower = upper = valueBest
+		self.mpPositionBounds[key] = (lower, upper)
+		return valueBest
+
+	def Solve(self:EndgameSolver, gs:AbstractGameState, msBudget:int = None, eventCancel = None) -> Tuple[Move, int]:
+		"""Best move for gs.sideToPlay (None if it has none) and the final score, Red minus White settled hexes,
+		   with perfect play by both sides. Raises SearchTimeout if it takes longer than msBudget,
+		   or once eventCancel (a threading.Event) is set"""
+
+		self.timeEnd = time.perf_counter() + msBudget / 1000 if msBudget != None else None
+		self.eventCancel = eventCancel
+		try:
+			return self.SolveInner(gs)
+		finally:
+			self.timeEnd = None
+			self.eventCancel = None
+
+	def SolveInner(self:EndgameSolver, gs:AbstractGameState) -> Tuple[Move, int]:
+
+		cHexRed,cHexWhite = gs.MpSideScore()
+		side = gs.sideToPlay
+		if side == None:
+			return None, cHexRed - cHexWhite
+
+		aRegion = tuple(sorted(EndgameSolver.ARegion(gs)))
+		value = self.Value(aRegion, side, -1 << 30, 1 << 30)
+
+		# Find a move that achieves it; every test is a null window around a value already searched
+
+		for iRegion,region in enumerate(aRegion):
+			aRegionRest = aRegion[:iRegion] + aRegion[iRegion + 1:]
+			for dScore,aRegionChild,hexes in self.AOutcome(region, side):
+				valueChild = value - dScore
+				if self.Value(tuple(sorted(aRegionRest + aRegionChild)), side.Opposite(), valueChild - 1, valueChild + 1) == valueChild:
+					return Move(*hexes), cHexRed - cHexWhite + value
+
+		return None, cHexRed - cHexWhite # stuck
@@ -0,0 +1,1222 @@
+"""Ragnarocks rules engine: board geometry, game states and layouts. No GUI; safe to import headless"""
+
+from __future__ import annotations
+
+from collections import defaultdict
+from typing import *
+import math
+import copy
+import random
+
+from enum import Enum,IntEnum
+
+from minimax import *
+
+try:
+	import batcheval # needs NumPy; used for ScoreEstimateChildren if present
+except ImportError:
+	batcheval = None
+
+
+
+class KeyDependentDefaultDict(defaultdict):
+	"""Like DefaultDict, but default_factory takes key as argument"""
+
+	def __missing__(self, key):
+		if self.default_factory is None:
+			raise KeyError(key)
+		else:
+			# BB Do I really want to put new one in dict?
+			#  Is this how a regular defaultdict behaves?
+
+			ret = self[key] = self.default_factory(key)
+			return ret
+		
+def Lerp(a:float, b:float, alpha:float):
+	return (1-alpha) * a + alpha * b
+
+
+
+class Dir(IntEnum):
+	NW = 0
+	NE = 1
+	E = 2
+	SE = 3
+	SW = 4
+	W = 5
+
+
+class Hex:
+	__slots__ = ('x', 'y')
+
+	s_mpDirDxDy = [(0,1), (1,1), (1,0), (0,-1), (-1,-1), (-1,0)]
+
+	def __init__(self, x, y):
+		self.x = x  # E from lower left
+		self.y = y  # NW from lower left
+
+	def __repr__(self):
+		return f"Hex{(self.x,self.y)}"
+
+	def __eq__(self, other):
+		if isinstance(other, Hex):
+			return self.x == other.x and self.y == other.y
+		return NotImplemented
+	
+	def __hash__(self):
+		return hash((self.x, self.y))
+
+
+class Side(IntEnum):
+	Red = 0
+	White = 1 # "Ivory" in official rules. Save the elephants!
+
+	def Opposite(self:Side) -> Side:
+		return Side.Red if self==Side.White else Side.White
+
+
+class Viking:
+	__slots__ = ('side',)
+
+	def __init__(self, side):
+		self.side = side
+
+
+class BoardLayout():
+	def __init__(self, rowdefs, startingPositions):
+		self.rowdefs:List[Tuple[int]] = rowdefs # for each Y, starting X, number of hexes in row
+		self.startingPositions:List[List[Tuple[int]]] = startingPositions # for each side, list of starting viking coords
+
+	def Pack(self) -> Tuple:
+		"""Layout as nested tuples: hashable, picklable, and usable with Board.FromPacked"""
+		return (tuple(tuple(rowdef) for rowdef in self.rowdefs),
+				tuple(tuple(tuple(pos) for pos in positions) for positions in self.startingPositions))
+
+
+class Board:
+	s_dirsUp = (Dir.NW, Dir.NE, Dir.E)
+
+	s_mpLayoutPackedBoard:Dict[Tuple, Board] = {} # for FromPacked
+
+	# For each 6-bit pattern of closed (stone or off board) neighbors, in Dir order (which goes around the hex),
+	#  whether the open neighbors form more than one run -- i.e. a stone here may split its region
+	s_mpClosedFSplit = [sum(1 for dir in Dir if not (closed >> dir) & 1 and (closed >> ((dir - 1) % 6)) & 1) >= 2
+						for closed in range(64)]
+
+	def __init__(self:Board, boardlayout:BoardLayout):
+
+		self.boardlayout = boardlayout
+
+		self.mpHexI:Dict[Hex,int] = {}
+		self.hexes:List[Hex] = []
+
+		for y,(xMic,c) in enumerate(boardlayout.rowdefs):
+			for x in range(xMic, xMic + c):
+				hex = Hex(x,y)
+				self.mpHexI[hex] = len(self.hexes)
+				self.hexes.append(hex)
+
+		assert(len(self.hexes) <= 256) # see Move.Pack
+
+		self.mpIHexIDirNeighbor:List[List[int]] = []
+		self.mpIHexNeighbors:List[List[int]] = []
+		for hex in self.hexes:
+			mpIDirN = []
+			ns = []
+			for dir in Dir:
+				dX,dY = Hex.s_mpDirDxDy[dir]
+				hexOther = Hex(hex.x + dX, hex.y + dY)
+				if hexOther in self.mpHexI:
+					iHexOther = self.mpHexI[hexOther]
+					ns.append(iHexOther)
+					mpIDirN.append(iHexOther)
+				else:
+					mpIDirN.append(None)
+
+			self.mpIHexNeighbors.append(ns)
+			self.mpIHexIDirNeighbor.append(mpIDirN)
+
+		# Bitboard versions (bit iHex set = hex iHex) for BitboardGameState
+
+		self.maskAll:int = (1 << len(self.hexes)) - 1
+		self.mpIHexMaskNeighbors:List[int] = [sum(1 << iHexOther for iHexOther in ns) for ns in self.mpIHexNeighbors]
+
+		# For each hex and dir, the hexes walking that way to the edge (nearest first) and the same as a mask.
+		#  Hexes are numbered by row then x, so rays in s_dirsUp run to higher iHex: the first blocker
+		#  on those is the lowest set bit of maskRay & maskBlock, on the others it's the highest
+
+		self.mpIHexDirRay:List[List[List[int]]] = []
+		self.mpIHexDirMaskRay:List[List[int]] = []
+		for iHex in range(len(self.hexes)):
+			rays = []
+			for dir in Dir:
+				ray = []
+				iHexNew = self.Neighbor(iHex, dir)
+				while iHexNew != None:
+					ray.append(iHexNew)
+					iHexNew = self.Neighbor(iHexNew, dir)
+				assert(all((iHexRay > iHex) == (dir in Board.s_dirsUp) for iHexRay in ray))
+				rays.append(ray)
+			self.mpIHexDirRay.append(rays)
+			self.mpIHexDirMaskRay.append([sum(1 << iHexRay for iHexRay in ray) for ray in rays])
+
+		self.mpIHexMaskRaysUp:List[List[int]] = [[masks[dir] for dir in Board.s_dirsUp] for masks in self.mpIHexDirMaskRay]
+		self.mpIHexMaskRaysDown:List[List[int]] = [[masks[dir] for dir in Dir if dir not in Board.s_dirsUp] for masks in self.mpIHexDirMaskRay]
+
+		# Zobrist keys for hashing positions (see GameState.Key). Fixed seed, so keys are the same every run
+
+		rand = random.Random(0x52A6)
+		self.mpIHexZobristStone:List[int] = [rand.getrandbits(64) for _ in self.hexes]
+		self.mpIHexSideZobristVik:List[List[int]] = [[rand.getrandbits(64) for side in Side] for _ in self.hexes]
+		self.zobristWhiteToPlay:int = rand.getrandbits(64)
+
+		# Symmetries: permutations of iHex that map the board onto itself, identity first (see ASymmetry).
+		#  Positions that are images of each other under one have the same value, so GameState.KeyCanonical
+		#  gives them all one key. For each symmetry, Zobrist tables indexed by the original hex give the
+		#  key of the position's image, so it can be kept up to date move by move like the key itself
+
+		self.aSym:List[List[int]] = self.ASymmetry()
+		self.mpSymSymInverse:List[int] = [self.aSym.index(sorted(range(len(perm)), key=perm.__getitem__)) for perm in self.aSym]
+		self.aSymZobrist:List[Tuple[List[int], List[List[int]]]] = [
+			([self.mpIHexZobristStone[iHexSym] for iHexSym in perm], [self.mpIHexSideZobristVik[iHexSym] for iHexSym in perm])
+			for perm in self.aSym[1:]]
+
+	@staticmethod
+	def FromPacked(layoutPacked:Tuple) -> Board:
+		"""Returns a Board for a BoardLayout.Pack() tuple, shared by everyone in this process asking for the same layout"""
+
+		board = Board.s_mpLayoutPackedBoard.get(layoutPacked)
+		if board == None:
+			rowdefs,startingPositions = layoutPacked
+			board = Board.s_mpLayoutPackedBoard[layoutPacked] = Board(BoardLayout(list(rowdefs), [list(positions) for positions in startingPositions]))
+		return board
+
+	def Hexes(self) -> List[Hex]:
+		return self.hexes
+
+	def Hex(self, iHex:int) -> Hex:
+		return self.hexes[iHex]
+	
+	def IHex(self, hex:Hex) -> int:
+		return self.mpHexI[hex]
+
+	def Neighbor(self, iHex:int, dir:Dir):
+		return self.mpIHexIDirNeighbor[iHex][dir]
+
+	def Neighbors(self, iHex:int):
+		return self.mpIHexNeighbors[iHex]
+
+	def ZobristSide(self, sideToPlay:Side) -> int:
+		return self.zobristWhiteToPlay if sideToPlay == Side.White else 0
+
+	def ZobristMove(self, side:Side, iHexFrom:int, iHexTo:int, iHexStone:int) -> int:
+		"""Returns the change in Zobrist key from moving side's viking and placing a stone, not counting side to play"""
+		return (self.mpIHexSideZobristVik[iHexFrom][side] ^ self.mpIHexSideZobristVik[iHexTo][side] ^
+				self.mpIHexZobristStone[iHexStone])
+
+	def ASymmetry(self) -> List[List[int]]:
+		"""Permutations of iHex that map the board onto itself, keeping lines straight; identity first.
+		   Built from the 60 degree rotation (x,y) -> (y, y-x) and the reflection (x,y) -> (y,x), then translated"""
+
+		aXY = [(hex.x, hex.y) for hex in self.hexes]
+		setXY = set(aXY)
+		xyMin = min(aXY)
+
+		aSym = []
+		for fReflect in (False, True):
+			for cRotate in range(6):
+				aXYSym = []
+				for x,y in aXY:
+					if fReflect:
+						x,y = y,x
+					for _ in range(cRotate):
+						x,y = y,y - x
+					aXYSym.append((x, y))
+
+				xySymMin = min(aXYSym)
+				dX,dY = xyMin[0] - xySymMin[0],xyMin[1] - xySymMin[1]
+				aXYSym = [(x + dX, y + dY) for x,y in aXYSym]
+				if set(aXYSym) == setXY:
+					perm = [self.mpHexI[Hex(x, y)] for x,y in aXYSym]
+					if perm not in aSym:
+						aSym.append(perm)
+
+		return aSym
+
+	def AZobristSym(self, zobrist:int, aIHexSide:Iterable[Tuple[int,Side]], maskStone:int) -> Tuple[int]:
+		"""Keys of a position's images under aSym[1:], given its own key (which holds the side to play), vikings and stones"""
+
+		if not self.aSymZobrist:
+			return ()
+		aIHexSide = list(aIHexSide)
+		aIHexStone = [iHex for iHex in range(len(self.hexes)) if (maskStone >> iHex) & 1]
+		zobristSide = zobrist
+		for iHex,side in aIHexSide:
+			zobristSide ^= self.mpIHexSideZobristVik[iHex][side]
+		for iHex in aIHexStone:
+			zobristSide ^= self.mpIHexZobristStone[iHex]
+
+		aZobristSym = []
+		for mpIHexZobristStone,mpIHexSideZobristVik in self.aSymZobrist:
+			zobristSym = zobristSide
+			for iHex,side in aIHexSide:
+				zobristSym ^= mpIHexSideZobristVik[iHex][side]
+			for iHex in aIHexStone:
+				zobristSym ^= mpIHexZobristStone[iHex]
+			aZobristSym.append(zobristSym)
+		return tuple(aZobristSym)
+
+	def AZobristSymMove(self, aZobristSym:Tuple[int], zobristSide:int, side:Side, move:Move) -> Tuple[int]:
+		"""aZobristSym after side plays move; zobristSide is the change from side to play, as in ZobristSide"""
+
+		if not aZobristSym:
+			return aZobristSym
+		iHexFrom,iHexTo,iHexStone = move.iHexFrom,move.iHexTo,move.iHexStone
+		return tuple(zobrist ^ zobristSide ^ mpIHexSideZobristVik[iHexFrom][side] ^ mpIHexSideZobristVik[iHexTo][side] ^ mpIHexZobristStone[iHexStone]
+					 for zobrist,(mpIHexZobristStone,mpIHexSideZobristVik) in zip(aZobristSym, self.aSymZobrist))
+
+	def KeyCanonical(self, zobrist:int, aZobristSym:Tuple[int]) -> Tuple[int,int]:
+		"""Smallest of a position's key and its images' keys, and the index in aSym of the symmetry that gives it"""
+
+		key,iSym = zobrist,0
+		for iSymOther,zobristSym in enumerate(aZobristSym, 1):
+			if zobristSym < key:
+				key,iSym = zobristSym,iSymOther
+		return key,iSym
+
+	def MoveSym(self, move:Move, iSym:int) -> Move:
+		"""move's image under aSym[iSym]; mpSymSymInverse[iSym] maps it back"""
+
+		if iSym == 0:
+			return move
+		perm = self.aSym[iSym]
+		return Move(perm[move.iHexFrom], perm[move.iHexTo], perm[move.iHexStone])
+
+	def MaskVisible(self, iHex:int, maskBlock:int) -> int:
+		"""Returns mask of hexes visible from iHex, looking along each ray up to the first hex in maskBlock"""
+
+		maskVis = 0
+		for maskRay in self.mpIHexMaskRaysUp[iHex]:
+			maskHit = maskRay & maskBlock
+			maskVis |= maskRay & ((maskHit & -maskHit) - 1) # below lowest hit; all of ray if none
+		for maskRay in self.mpIHexMaskRaysDown[iHex]:
+			maskHit = maskRay & maskBlock
+			maskVis |= maskRay & -(1 << maskHit.bit_length()) # above highest hit; all of ray if none
+		return maskVis
+
+	def MaskSeen(self, iHex:int, maskBlock:int) -> int:
+		"""MaskVisible plus the first hex in maskBlock on each ray. What iHex sees can only change when a blocker
+		   comes or goes on one of these, and MaskVisible is this & ~maskBlock"""
+
+		maskSeen = 0
+		for maskRay in self.mpIHexMaskRaysUp[iHex]:
+			maskHit = maskRay & maskBlock
+			maskSeen |= maskRay & (((maskHit & -maskHit) << 1) - 1) # up to lowest hit; all of ray if none
+		for maskRay in self.mpIHexMaskRaysDown[iHex]:
+			maskHit = maskRay & maskBlock
+			maskSeen |= maskRay & -(1 << max(maskHit.bit_length() - 1, 0)) # down to highest hit; all of ray if none
+		return maskSeen
+
+	def CHexVisible(self, iHex:int, maskBlock:int) -> int:
+		return self.MaskVisible(iHex, maskBlock).bit_count()
+
+	def AIHexVisible(self, iHex:int, maskBlock:int) -> List[int]:
+		"""Returns hexes visible from iHex in Dir order, nearest first along each ray"""
+
+		return self.AIHexInRays(iHex, self.MaskVisible(iHex, maskBlock))
+
+	def AIHexInRays(self, iHex:int, maskVis:int) -> List[int]:
+		"""Hexes of maskVis, a MaskVisible result for iHex, in AIHexVisible order"""
+
+		aiHex = []
+		for ray,maskRay in zip(self.mpIHexDirRay[iHex], self.mpIHexDirMaskRay[iHex]):
+			aiHex += ray[:(maskRay & maskVis).bit_count()]
+		return aiHex
+
+	def MpIHexMaskSeenMove(self, mpIHexMaskSeen:Dict[int, int], move:Move) -> Dict[int, int]:
+		"""The entries of a viking sight cache (iHex -> MaskSeen) still right after move: those that don't see
+		   iHexFrom, iHexTo or iHexStone. The moved viking's own entry goes too, since it saw iHexTo"""
+
+		# A snapshot of the items, in case another thread is filling in the cache meanwhile
+
+		maskChanged = (1 << move.iHexFrom) | (1 << move.iHexTo) | (1 << move.iHexStone)
+		return {iHex:maskSeen for iHex,maskSeen in list(mpIHexMaskSeen.items()) if not maskSeen & maskChanged}
+
+	def MoveRandom(self, rng:random.Random, aIHexFrom:List[int], maskBlock:int, fnMaskVisible:Callable[[int], int]) -> Optional[Move]:
+		"""A random legal move for a viking at one of aIHexFrom, choosing the viking, then where it goes,
+		   then the stone; None if none of them can move. For playouts, so it never lists every move.
+		   fnMaskVisible(iHexFrom) is what the viking sees, e.g. GameState.MaskVisibleVik"""
+
+		aIHexFrom = list(aIHexFrom)
+		rng.shuffle(aIHexFrom)
+		for iHexFrom in aIHexFrom:
+			aIHexTo = self.AIHexInRays(iHexFrom, fnMaskVisible(iHexFrom))
+			if aIHexTo:
+				iHexTo = rng.choice(aIHexTo)
+				return Move(iHexFrom, iHexTo, rng.choice(self.AIHexVisible(iHexTo, maskBlock & ~(1 << iHexFrom))))
+		return None
+
+	def FMoveVisible(self, move:Move, maskBlock:int, maskVisFrom:int = None) -> bool:
+		"""Whether move's viking can see iHexTo and then, no longer blocking iHexFrom, iHexStone.
+		   maskVisFrom is MaskVisible from iHexFrom, if the caller has it"""
+		if maskVisFrom == None:
+			maskVisFrom = self.MaskVisible(move.iHexFrom, maskBlock)
+		return (bool((maskVisFrom >> move.iHexTo) & 1) and
+				bool((self.MaskVisible(move.iHexTo, maskBlock & ~(1 << move.iHexFrom)) >> move.iHexStone) & 1))
+
+	def FStoneMaySplit(self, iHex:int, maskStone:int) -> bool:
+		"""Cheap local test: could a stone at iHex split the region around it?"""
+
+		closed = 0
+		for dir,iHexOther in enumerate(self.mpIHexIDirNeighbor[iHex]):
+			if iHexOther == None or (maskStone >> iHexOther) & 1:
+				closed |= 1 << dir
+		return Board.s_mpClosedFSplit[closed]
+
+	def MaskConnected(self, iHex:int, maskOpen:int) -> int:
+		"""Returns mask of hexes in maskOpen connected to iHex (which must be in maskOpen)"""
+
+		maskPiece = maskFrontier = 1 << iHex
+		while maskFrontier:
+			maskGrow = 0
+			while maskFrontier:
+				bit = maskFrontier & -maskFrontier
+				maskGrow |= self.mpIHexMaskNeighbors[bit.bit_length() - 1]
+				maskFrontier ^= bit
+			maskFrontier = maskGrow & maskOpen & ~maskPiece
+			maskPiece |= maskFrontier
+		return maskPiece
+
+
+class Move:
+	"""Viking at iHexFrom moves to iHexTo and places a stone at iHexStone. The viking isn't stored;
+	   it's whichever one is at iHexFrom (see Vik). The UI leaves later parts None while choosing"""
+
+	__slots__ = ('iHexFrom', 'iHexTo', 'iHexStone')
+
+	def __init__(self, iHexFrom, iHexTo, iHexStone):
+		self.iHexFrom = iHexFrom
+		self.iHexTo = iHexTo
+		self.iHexStone = iHexStone
+
+	def __repr__(self):
+		return f"Move{(self.iHexFrom, self.iHexTo, self.iHexStone)}"
+
+	# Equal if same hexes, so moves found in a transposition table match ones from Moves()
+
+	def __eq__(self, other):
+		if isinstance(other, Move):
+			return self.iHexFrom == other.iHexFrom and self.iHexTo == other.iHexTo and self.iHexStone == other.iHexStone
+		return NotImplemented
+
+	def __hash__(self):
+		return hash((self.iHexFrom, self.iHexTo, self.iHexStone))
+
+	def Vik(self, gs:GameState) -> Viking:
+		return gs.mpIHexVik[self.iHexFrom]
+
+	def Pack(self) -> int:
+		"""Move as one int, 8 bits per hex (Board has at most 256 hexes)"""
+		return self.iHexFrom | (self.iHexTo << 8) | (self.iHexStone << 16)
+
+	@staticmethod
+	def Unpack(movePacked:int) -> Move:
+		return Move(movePacked & 0xff, (movePacked >> 8) & 0xff, movePacked >> 16)
+
+
+class RegionType(IntEnum):
+	Contested = 0
+	Wild = 1
+	SettledRed = 2
+	SettledWhite = 3
+	Stone = 4
+
+class Region():
+	__slots__ = ('type', 'mask', 'cHex', 'mpSideCVik')
+
+	def __init__(self, mask:int = 0):
+		self.type = RegionType.Contested
+		self.mask = mask # bit iHex set for each hex in region
+		self.cHex = mask.bit_count()
+		self.mpSideCVik = [0,0]
+
+	@property
+	def aiHex(self) -> List[int]:
+		"""Hexes in region, lowest first"""
+
+		aiHex = []
+		mask = self.mask
+		while mask:
+			bit = mask & -mask
+			aiHex.append(bit.bit_length() - 1)
+			mask ^= bit
+		return aiHex
+
+	def AssignType(self:Region):
+		"""Set type from which sides have vikings here"""
+
+		if self.mpSideCVik[Side.Red] == 0:
+			if self.mpSideCVik[Side.White] == 0:
+				self.type = RegionType.Wild
+			else:
+				self.type = RegionType.SettledWhite
+		else:
+			if self.mpSideCVik[Side.White] == 0:
+				self.type = RegionType.SettledRed
+			else:
+				assert(self.type == RegionType.Contested)
+
+
+class GameState(AbstractGameState):
+
+	def __init__(self:GameState, board:Board = None, gsPrev:GameState = None, move:Move = None):
+
+		self.regions: List[Region] = []
+	
+		if board != None:
+			# Set up initial board state
+
+			assert(gsPrev == None)
+			assert(move == None)
+
+			self.board = board
+
+			self.mpIHexVik: Dict[int, Viking] = {}
+
+			for side in Side:
+				for x,y in board.boardlayout.startingPositions[side]:
+					self.mpIHexVik[board.IHex(Hex(x,y))] = Viking(side)
+
+			self.mpIHexType: List[int, RegionType] = [RegionType.Contested] * len(board.Hexes())
+
+			# Blockers as bitboards, for Board.MaskVisible
+			self.maskStone:int = 0
+			self.maskVik:int = sum(1 << iHex for iHex in self.mpIHexVik)
+
+			self.sideToPlay:Side = Side.Red # Make this a parameter? Or like chess, red always starts
+
+			self.zobrist:int = 0
+			for iHex,vik in self.mpIHexVik.items():
+				self.zobrist ^= board.mpIHexSideZobristVik[iHex][vik.side]
+			self.aZobristSym:Tuple[int] = board.AZobristSym(self.zobrist, ((iHex, vik.side) for iHex,vik in self.mpIHexVik.items()), 0)
+
+			# Board.MaskSeen for each viking, by its hex; filled in by MaskVisibleVik as needed
+			self.mpIHexMaskSeen:Dict[int, int] = {}
+
+		elif gsPrev:
+			# Set up from previous board state + move
+
+			assert(move != None)
+
+			# Copy state
+			# BB better to alter, then undo?
+			self.board = gsPrev.board
+			self.mpIHexVik = copy.copy(gsPrev.mpIHexVik)
+			self.mpIHexType = copy.copy(gsPrev.mpIHexType)
+
+			# Move viking
+			vik = self.mpIHexVik.pop(move.iHexFrom)
+			assert(vik.side == gsPrev.sideToPlay)
+			self.mpIHexVik[move.iHexTo] = vik
+			self.maskVik = (gsPrev.maskVik & ~(1 << move.iHexFrom)) | (1 << move.iHexTo)
+
+			# Place stone
+			self.mpIHexType[move.iHexStone] = RegionType.Stone
+			self.maskStone = gsPrev.maskStone | (1 << move.iHexStone)
+
+			# Keep what gsPrev worked out about vikings the move can't have changed the view of
+			self.mpIHexMaskSeen = self.board.MpIHexMaskSeenMove(gsPrev.mpIHexMaskSeen, move)
+
+			# Alternate sides
+			self.sideToPlay = gsPrev.sideToPlay.Opposite()
+
+			# Update regions and score; only the region the stone landed in can change
+			self.SplitRegion(gsPrev, move.iHexStone)
+
+			zobristSide = self.board.ZobristSide(gsPrev.sideToPlay) ^ self.board.ZobristSide(self.sideToPlay)
+			self.zobrist = gsPrev.zobrist ^ zobristSide ^ self.board.ZobristMove(vik.side, move.iHexFrom, move.iHexTo, move.iHexStone)
+			self.aZobristSym = self.board.AZobristSymMove(gsPrev.aZobristSym, zobristSide, vik.side, move)
+			return
+
+		# Update regions and score
+		self.AssignRegions()
+	
+	@staticmethod
+	def IHexRoot(mpIHexIHexParent:DefaultDict[int, int], iHex:int) -> int:
+		iHexParent = mpIHexIHexParent[iHex]
+		if iHexParent != iHex:
+			iHexParent = GameState.IHexRoot(mpIHexIHexParent, iHexParent)
+			mpIHexIHexParent[iHex] = iHexParent
+		return iHexParent
+
+	def AssignRegions(self:GameState):
+		"""Update mpIHexType and regions based on connected regions"""
+
+		# Build connectivity graph
+
+		mpIHexIHexParent:DefaultDict[int, int] = KeyDependentDefaultDict(lambda iHex : iHex)
+		for iHex in range(len(self.board.Hexes())):
+			if self.mpIHexType[iHex] != RegionType.Contested:
+				continue
+
+			iHexRoot = GameState.IHexRoot(mpIHexIHexParent, iHex)
+		
+			for iHexOther in self.board.Neighbors(iHex):
+				if self.mpIHexType[iHexOther] != RegionType.Contested:
+					assert(self.mpIHexType[iHexOther] == RegionType.Stone)
+					continue
+				iHexRootOther = GameState.IHexRoot(mpIHexIHexParent, iHexOther)
+				mpIHexIHexParent[iHexRootOther] = iHexRoot
+
+		mpIHexRootRegion:DefaultDict[int,Region] = defaultdict(lambda : Region())
+
+		for iHex,type in enumerate(self.mpIHexType):
+			if type != RegionType.Contested:
+				continue
+			iHexRoot = GameState.IHexRoot(mpIHexIHexParent, iHex)
+
+			region = mpIHexRootRegion[iHexRoot]
+			region.mask |= 1 << iHex
+			region.cHex += 1
+			
+			if iHex in self.mpIHexVik:
+				vik = self.mpIHexVik[iHex]
+				region.mpSideCVik[vik.side] += 1
+
+		for region in mpIHexRootRegion.values():
+
+			region.AssignType()
+			
+			if region.type != RegionType.Contested:
+				for iHex in region.aiHex:
+					self.mpIHexType[iHex] = region.type
+
+			self.regions.append(region)
+
+		self.mpTypeCHex = [0,0,0,0,0]
+		
+		for region in self.regions:
+			self.mpTypeCHex[region.type] += region.cHex
+
+		if self.mpTypeCHex[RegionType.Contested] == 0:
+			self.sideToPlay = None # done
+
+	def SplitRegion(self:GameState, gsPrev:GameState, iHexStone:int):
+		"""Update mpIHexType, regions and mpTypeCHex from gsPrev after a stone is placed at iHexStone,
+		   re-flooding only the contested region the stone landed in"""
+
+		bitStone = 1 << iHexStone
+
+		self.regions = []
+		regionSplit = None
+		for region in gsPrev.regions:
+			if regionSplit == None and region.type == RegionType.Contested and region.mask & bitStone:
+				regionSplit = region
+				iRegionSplit = len(self.regions)
+			else:
+				self.regions.append(region) # unchanged, so shared with gsPrev
+		assert(regionSplit != None)
+
+		self.mpTypeCHex = copy.copy(gsPrev.mpTypeCHex)
+
+		# Usually the stone can't split the region (see Board.FStoneMaySplit); then it just loses the stone's hex.
+		#  The vikings in it are the same, since the one that moved saw where it went, so it stays contested
+
+		if not self.board.FStoneMaySplit(iHexStone, gsPrev.maskStone):
+			region = Region(regionSplit.mask & ~bitStone)
+			region.mpSideCVik = list(regionSplit.mpSideCVik)
+			self.regions.insert(iRegionSplit, region)
+			self.mpTypeCHex[RegionType.Contested] -= 1
+			if bitStone == regionSplit.mask & -regionSplit.mask:
+				self.regions.sort(key=lambda region: region.mask & -region.mask) # its lowest hex changed
+			return
+
+		# Otherwise flood what's left of regionSplit into pieces
+
+		self.mpTypeCHex[RegionType.Contested] -= regionSplit.cHex
+		fNewContested = False
+		maskOpen = regionSplit.mask & ~bitStone
+		while maskOpen:
+			bit = maskOpen & -maskOpen
+			region = Region(self.board.MaskConnected(bit.bit_length() - 1, maskOpen))
+			maskOpen &= ~region.mask
+
+			for iHex,vik in self.mpIHexVik.items():
+				if (region.mask >> iHex) & 1:
+					region.mpSideCVik[vik.side] += 1
+
+			region.AssignType()
+
+			if region.type == RegionType.Contested:
+				fNewContested = True
+			else:
+				for iHex in region.aiHex:
+					self.mpIHexType[iHex] = region.type
+
+			self.regions.append(region)
+			self.mpTypeCHex[region.type] += region.cHex
+
+		# Keep contested regions ordered by lowest hex, as AssignRegions does, so ScoreEstimate sums them in the same order
+		if fNewContested:
+			self.regions.sort(key=lambda region: region.mask & -region.mask)
+
+		if self.mpTypeCHex[RegionType.Contested] == 0:
+			self.sideToPlay = None # done
+
+	def DoMove(self:GameState, move:Move) -> GameState:
+		"""Returns a new game state which is result of making the given move"""
+
+		return GameState(gsPrev=self, move=move)
+
+	def Copy(self:GameState) -> GameState:
+		"""The same position with its own sight cache, for handing to another thread: MaskVisibleVik
+		   fills in the cache, so two threads mustn't share one state"""
+
+		gs = copy.copy(self)
+		gs.mpIHexMaskSeen = dict(self.mpIHexMaskSeen)
+		return gs
+
+	def Key(self:GameState) -> int:
+		"""Zobrist key of stones, vikings and side to play, maintained incrementally"""
+		return self.zobrist
+
+	def KeyCanonical(self:GameState) -> Tuple[int,int]:
+		"""Key shared by every image of this position under the board's symmetries, and the index in
+		   board.aSym of the symmetry that maps this position to the image it's the Key() of"""
+		return self.board.KeyCanonical(self.zobrist, self.aZobristSym)
+
+	def MoveSym(self:GameState, move:Move, iSym:int, fInverse:bool = False) -> Move:
+		return self.board.MoveSym(move, self.board.mpSymSymInverse[iSym] if fInverse else iSym)
+
+	def MoveHistoryKey(self:GameState, move:Move) -> Tuple[int,int]:
+		return (move.iHexTo, move.iHexStone)
+
+	def Snapshot(self:GameState) -> Tuple:
+		"""Compact, picklable copy of this position for FromSnapshot; no Board, Region or Viking objects"""
+		return (self.board.boardlayout.Pack(),
+				tuple((iHex, int(vik.side)) for iHex,vik in self.mpIHexVik.items()),
+				self.maskStone,
+				None if self.sideToPlay == None else int(self.sideToPlay))
+
+	@staticmethod
+	def FromSnapshot(snapshot:Tuple) -> GameState:
+		layoutPacked, aIHexSide, maskStone, sideToPlay = snapshot
+
+		gs = GameState(Board.FromPacked(layoutPacked))
+
+		gs.mpIHexVik = {iHex:Viking(Side(side)) for iHex,side in aIHexSide}
+		gs.mpIHexType = [RegionType.Stone if (maskStone >> iHex) & 1 else RegionType.Contested for iHex in range(len(gs.board.Hexes()))]
+		gs.maskStone = maskStone
+		gs.maskVik = sum(1 << iHex for iHex in gs.mpIHexVik)
+		gs.mpIHexMaskSeen = {}
+		gs.sideToPlay = None if sideToPlay == None else Side(sideToPlay)
+
+		gs.zobrist = gs.board.ZobristSide(gs.sideToPlay)
+		for iHex,vik in gs.mpIHexVik.items():
+			gs.zobrist ^= gs.board.mpIHexSideZobristVik[iHex][vik.side]
+		for iHex in range(len(gs.board.Hexes())):
+			if (maskStone >> iHex) & 1:
+				gs.zobrist ^= gs.board.mpIHexZobristStone[iHex]
+		gs.aZobristSym = gs.board.AZobristSym(gs.zobrist, ((iHex, vik.side) for iHex,vik in gs.mpIHexVik.items()), maskStone)
+
+		gs.regions = []
+		gs.AssignRegions()
+		return gs
+
+	def PackMove(self:GameState, move:Move) -> int:
+		return move.Pack()
+
+	def UnpackMove(self:GameState, movePacked:int) -> Move:
+		return Move.Unpack(movePacked)
+
+	def MoveScoreStatic(self:GameState, move:Move) -> float:
+		"""Prefer stones that may split a region, then stones next to enemy vikings"""
+
+		cAdjacent = 0
+		for iHex in self.board.Neighbors(move.iHexStone):
+			vik = self.mpIHexVik.get(iHex)
+			if vik != None and vik.side != self.sideToPlay:
+				cAdjacent += 1
+		return 2 * self.board.FStoneMaySplit(move.iHexStone, self.maskStone) + cAdjacent
+	
+	def MaskVisibleVik(self:GameState, iHex:int) -> int:
+		"""Mask of hexes the viking at iHex sees. Worked out once per state, and kept from the state
+		   before when the last move didn't change its view (see Board.MpIHexMaskSeenMove)"""
+
+		maskBlock = self.maskStone | self.maskVik
+		maskSeen = self.mpIHexMaskSeen.get(iHex)
+		if maskSeen == None:
+			maskSeen = self.mpIHexMaskSeen[iHex] = self.board.MaskSeen(iHex, maskBlock)
+		return maskSeen & ~maskBlock
+
+	def HexesVisibleFrom(self:GameState, iHex:int, vikIgnore:Viking=None) -> Iterator[Hex]:
+		"""Yields all hexes visible from the given hex"""
+
+		vik = self.mpIHexVik.get(iHex)
+		if vik != None and vikIgnore in (None, vik):
+			yield from self.board.AIHexInRays(iHex, self.MaskVisibleVik(iHex))
+			return
+
+		maskBlock = self.maskStone | self.maskVik
+		if vikIgnore != None:
+			for iHexVik,vik in self.mpIHexVik.items():
+				if vik == vikIgnore:
+					maskBlock &= ~(1 << iHexVik)
+
+		yield from self.board.AIHexVisible(iHex, maskBlock)
+
+	def Moves(self:GameState) -> Iterator[Move]:
+		"""Yields all legal moves from current state"""
+
+		# BB alpha-beta minimax works faster if better moves are yielded first
+		#  My instinct is that moving further is usually better -- sort
+
+		maskBlock = self.maskStone | self.maskVik
+
+		for iHexFrom,vik in self.mpIHexVik.items():
+			# BB consider other structures for keeping track of vikings
+			if vik.side != self.sideToPlay:
+				continue
+			if self.mpIHexType[iHexFrom] != RegionType.Contested:
+				continue
+			
+			maskBlockStone = maskBlock & ~(1 << iHexFrom) # moving viking no longer blocks
+			for iHexTo in self.board.AIHexInRays(iHexFrom, self.MaskVisibleVik(iHexFrom)):
+				for iHexStone in self.board.AIHexVisible(iHexTo, maskBlockStone):
+					yield Move(iHexFrom, iHexTo, iHexStone)
+
+	# Staged generation (see AbstractGameState.MovePrefixes): prefixes are (iHexFrom, iHexTo), and the
+	#  stones for one are only listed when it's searched
+
+	def MovePrefixes(self:GameState) -> List[Tuple[int,int]]:
+		"""(iHexFrom, iHexTo) of each legal viking move, in Moves order"""
+
+		return [(iHexFrom, iHexTo)
+				for iHexFrom,vik in self.mpIHexVik.items() if vik.side == self.sideToPlay and self.mpIHexType[iHexFrom] == RegionType.Contested
+				for iHexTo in self.board.AIHexInRays(iHexFrom, self.MaskVisibleVik(iHexFrom))]
+
+	def MovesFromPrefix(self:GameState, prefix:Tuple[int,int]) -> List[Move]:
+		iHexFrom,iHexTo = prefix
+		maskBlockStone = (self.maskStone | self.maskVik) & ~(1 << iHexFrom)
+		return [Move(iHexFrom, iHexTo, iHexStone) for iHexStone in self.board.AIHexVisible(iHexTo, maskBlockStone)]
+
+	def MovePrefix(self:GameState, move:Move) -> Tuple[int,int]:
+		return (move.iHexFrom, move.iHexTo)
+
+	def MoveRandom(self:GameState, rng:random.Random) -> Optional[Move]:
+		aIHexFrom = [iHex for iHex,vik in self.mpIHexVik.items() if vik.side == self.sideToPlay and self.mpIHexType[iHex] == RegionType.Contested]
+		return self.board.MoveRandom(rng, aIHexFrom, self.maskStone | self.maskVik, self.MaskVisibleVik)
+
+	def FMoveLegal(self:GameState, move:Move) -> bool:
+		vik = self.mpIHexVik.get(move.iHexFrom)
+		if vik == None or vik.side != self.sideToPlay or self.mpIHexType[move.iHexFrom] != RegionType.Contested:
+			return False
+		return self.board.FMoveVisible(move, self.maskStone | self.maskVik, self.MaskVisibleVik(move.iHexFrom))
+
+	def ScoreEstimate(self:GameState, gameOver:bool=False) -> float:
+		"""Return a heuristic value of this board position with higher scores being better for Red"""
+
+		cHexRed = self.mpTypeCHex[RegionType.SettledRed]
+		cHexWhite = self.mpTypeCHex[RegionType.SettledWhite]
+
+		if gameOver or self.mpTypeCHex[RegionType.Contested] == 0:
+			# game is over
+			# BB This counts win as better than possible larger win,
+			#  and treats all wins as equal. Could tweak to prefer larger wins
+
+			# if cHexMine > cHexTheirs:
+			# 	return sys.float_info.max # win = best possible score
+			# elif cHexTheirs > cHexMine:
+			# 	return -sys.float_info.max # lose = worst possible score
+			# else:
+			# 	return 0 # tie
+
+			return (cHexRed - cHexWhite) * 100000
+
+		# check total number of open positions each side can move to. Same for every region, so count once
+		mpSideCHexVis = [0,0]
+		for iHex,vik in self.mpIHexVik.items():
+			mpSideCHexVis[vik.side] += self.MaskVisibleVik(iHex).bit_count()
+
+		cHexMaybe = 0 # + for Red, - for White
+		if sum(mpSideCHexVis) > 0: # else neither has any moves?
+			frac = mpSideCHexVis[Side.Red] / sum(mpSideCHexVis)
+			for region in self.regions:
+				if region.type == RegionType.Contested:
+					# frac = region.mpSideCVik[Side.Red] / sum(region.mpSideCVik)
+
+					# Assign contested hexes based on fraction of open moves
+					# Should maybe make cHex smaller because each following
+					#  move will reduce total possible area by one
+					cHex = region.cHex - 1
+					cHexMaybe += Lerp(-cHex, cHex, frac)
+
+		return cHexRed - cHexWhite + cHexMaybe
+
+	def ScoreEstimateNoMoves(self:GameState) -> float:
+		return self.ScoreEstimate(gameOver=True)
+
+	def ScoreFinal(self:GameState) -> Optional[float]:
+		return self.ScoreEstimate(gameOver=True) if self.sideToPlay == None else None
+
+	def ScoreTerms(self:GameState) -> Tuple:
+		"""What ScoreEstimate works from, for batcheval: (maskBlock, [(iHex, side)], cHexRed, cHexWhite, cHexContested, [cHex of each contested region])"""
+		return (self.maskStone | self.maskVik,
+				[(iHex, vik.side) for iHex,vik in self.mpIHexVik.items()],
+				self.mpTypeCHex[RegionType.SettledRed],
+				self.mpTypeCHex[RegionType.SettledWhite],
+				self.mpTypeCHex[RegionType.Contested],
+				[region.cHex for region in self.regions if region.type == RegionType.Contested])
+
+	def ScoreEstimateChildren(self:GameState, moves:List[Move]) -> List[float]:
+		"""Scores after each move, evaluated as one NumPy batch if batcheval is available"""
+		if batcheval == None:
+			return super().ScoreEstimateChildren(moves)
+		return batcheval.ScoreEstimateMany([self.DoMove(move) for move in moves])
+
+	def MpSideScore(self:GameState) -> List[int]:
+		return [self.mpTypeCHex[RegionType.SettledRed], self.mpTypeCHex[RegionType.SettledWhite]]
+
+
+class BitboardGameState(AbstractGameState):
+	"""Same rules as GameState, but stones, vikings and region types are kept as integer
+	   bitboards (bit iHex set = hex iHex) and moves are applied and undone in place"""
+
+	fInPlace = True
+
+	def __init__(self:BitboardGameState, board:Board = None, gs:GameState = None):
+
+		if board != None:
+			# Set up initial board state
+
+			assert(gs == None)
+
+			self.board = board
+
+			mpIHexVik = {}
+			for side in Side:
+				for x,y in board.boardlayout.startingPositions[side]:
+					mpIHexVik[board.IHex(Hex(x,y))] = Viking(side)
+
+			self.maskStone:int = 0
+			self.sideToPlay:Side = Side.Red
+
+			self.zobrist:int = 0
+			for iHex,vik in mpIHexVik.items():
+				self.zobrist ^= board.mpIHexSideZobristVik[iHex][vik.side]
+			self.aZobristSym:Tuple[int] = board.AZobristSym(self.zobrist, ((iHex, vik.side) for iHex,vik in mpIHexVik.items()), 0)
+
+		else:
+			# Copy an existing GameState, sharing its vikings so moves are interchangeable
+
+			self.board = gs.board
+			mpIHexVik = gs.mpIHexVik
+
+			self.maskStone = sum(1 << iHex for iHex,type in enumerate(gs.mpIHexType) if type == RegionType.Stone)
+			self.sideToPlay = gs.sideToPlay
+			self.zobrist = gs.zobrist
+			self.aZobristSym = gs.aZobristSym
+
+		# For each side, (iHex, vik) in the order GameState.mpIHexVik would hold them,
+		#  so Moves() yields moves in the same order
+
+		self.mpSideAVik:Tuple[Tuple[Tuple[int,Viking]]] = tuple(
+			tuple((iHex,vik) for iHex,vik in mpIHexVik.items() if vik.side == side) for side in Side)
+		self.mpSideMaskVik:Tuple[int] = tuple(
+			sum(1 << iHex for iHex,_ in self.mpSideAVik[side]) for side in Side)
+
+		# Masks of each RegionType, plus mask of each contested region ordered by lowest hex like GameState.regions
+
+		self.mpTypeMask:Tuple[int] = (0, 0, 0, 0, self.maskStone)
+		self.aMaskContested:Tuple[int] = ()
+		self.AssignRegions(self.board.maskAll & ~self.maskStone, ())
+
+		if gs != None:
+			assert(self.mpTypeMask[RegionType.Contested] == 0 or self.sideToPlay != None)
+
+		# Same as GameState.mpIHexMaskSeen; copied, since this state changes in place
+		self.mpIHexMaskSeen:Dict[int, int] = dict(gs.mpIHexMaskSeen) if gs != None else {}
+
+		self.undoStack:List[Tuple] = []
+
+	def AssignRegions(self:BitboardGameState, maskOpen:int, aMaskContested:Tuple[int]):
+		"""Split maskOpen into connected regions and classify them; aMaskContested are untouched contested regions"""
+
+		mpTypeMask = list(self.mpTypeMask)
+		mpTypeMask[RegionType.Contested] &= ~(maskOpen | self.maskStone)
+		mpTypeMask[RegionType.Stone] = self.maskStone
+
+		maskRed,maskWhite = self.mpSideMaskVik
+		aMaskContested = list(aMaskContested)
+
+		while maskOpen:
+			bit = maskOpen & -maskOpen
+			maskRegion = self.board.MaskConnected(bit.bit_length() - 1, maskOpen)
+			maskOpen &= ~maskRegion
+
+			if maskRegion & maskRed:
+				if maskRegion & maskWhite:
+					type = RegionType.Contested
+					aMaskContested.append(maskRegion)
+				else:
+					type = RegionType.SettledRed
+			elif maskRegion & maskWhite:
+				type = RegionType.SettledWhite
+			else:
+				type = RegionType.Wild
+
+			mpTypeMask[type] |= maskRegion
+
+		aMaskContested.sort(key=lambda maskRegion: maskRegion & -maskRegion)
+
+		self.mpTypeMask = tuple(mpTypeMask)
+		self.aMaskContested = tuple(aMaskContested)
+
+		if self.mpTypeMask[RegionType.Contested] == 0:
+			self.sideToPlay = None # done
+
+	def DoMove(self:BitboardGameState, move:Move) -> BitboardGameState:
+		"""Applies the given move to this state in place; returns self"""
+
+		side = self.sideToPlay
+		assert((self.mpSideMaskVik[side] >> move.iHexFrom) & 1)
+
+		self.undoStack.append((self.maskStone, self.mpSideAVik, self.mpSideMaskVik, self.mpTypeMask, self.aMaskContested, side, self.zobrist,
+						   self.aZobristSym, self.mpIHexMaskSeen))
+		self.mpIHexMaskSeen = self.board.MpIHexMaskSeenMove(self.mpIHexMaskSeen, move)
+
+		iHexFrom = move.iHexFrom
+		bitFrom = 1 << iHexFrom
+		bitStone = 1 << move.iHexStone
+
+		# Move viking; it goes to the end of its side's list, as in GameState.mpIHexVik
+
+		aVik = self.mpSideAVik[side]
+		for iVik,(iHex,vik) in enumerate(aVik):
+			if iHex == iHexFrom:
+				break
+		aVik = aVik[:iVik] + aVik[iVik + 1:] + ((move.iHexTo, vik),)
+		maskRed,maskWhite = self.mpSideMaskVik
+		if side == Side.Red:
+			self.mpSideAVik = (aVik, self.mpSideAVik[Side.White])
+			self.mpSideMaskVik = ((maskRed & ~bitFrom) | (1 << move.iHexTo), maskWhite)
+		else:
+			self.mpSideAVik = (self.mpSideAVik[Side.Red], aVik)
+			self.mpSideMaskVik = (maskRed, (maskWhite & ~bitFrom) | (1 << move.iHexTo))
+
+		# Place stone; only the contested region it lands in can change
+
+		fMaySplit = self.board.FStoneMaySplit(move.iHexStone, self.maskStone)
+		self.maskStone |= bitStone
+
+		for iMask,maskRegion in enumerate(self.aMaskContested):
+			if maskRegion & bitStone:
+				break
+		else:
+			assert(False)
+
+		if fMaySplit:
+			self.AssignRegions(maskRegion & ~bitStone, self.aMaskContested[:iMask] + self.aMaskContested[iMask + 1:])
+		else:
+			# As in GameState.SplitRegion: the region just loses the stone's hex, and stays contested
+			mpTypeMask = self.mpTypeMask
+			self.mpTypeMask = (mpTypeMask[RegionType.Contested] & ~bitStone, mpTypeMask[RegionType.Wild],
+							   mpTypeMask[RegionType.SettledRed], mpTypeMask[RegionType.SettledWhite], self.maskStone)
+			aMaskContested = self.aMaskContested[:iMask] + (maskRegion & ~bitStone,) + self.aMaskContested[iMask + 1:]
+			if bitStone == maskRegion & -maskRegion:
+				aMaskContested = tuple(sorted(aMaskContested, key=lambda maskRegion: maskRegion & -maskRegion))
+			self.aMaskContested = aMaskContested
+
+		if self.sideToPlay != None:
+			self.sideToPlay = side.Opposite()
+
+		zobristSide = self.board.ZobristSide(side) ^ self.board.ZobristSide(self.sideToPlay)
+		self.zobrist ^= zobristSide ^ self.board.ZobristMove(side, move.iHexFrom, move.iHexTo, move.iHexStone)
+		self.aZobristSym = self.board.AZobristSymMove(self.aZobristSym, zobristSide, side, move)
+
+		return self
+
+	def UndoMove(self:BitboardGameState, move:Move):
+		"""Reverts the last move applied with DoMove"""
+
+		(self.maskStone, self.mpSideAVik, self.mpSideMaskVik, self.mpTypeMask, self.aMaskContested, self.sideToPlay, self.zobrist, self.aZobristSym,
+		 self.mpIHexMaskSeen) = self.undoStack.pop()
+
+	def Key(self:BitboardGameState) -> int:
+		"""Zobrist key of stones, vikings and side to play; same as GameState.Key for the same position"""
+		return self.zobrist
+
+	def KeyCanonical(self:BitboardGameState) -> Tuple[int,int]:
+		"""Same as GameState.KeyCanonical"""
+		return self.board.KeyCanonical(self.zobrist, self.aZobristSym)
+
+	def MoveSym(self:BitboardGameState, move:Move, iSym:int, fInverse:bool = False) -> Move:
+		return self.board.MoveSym(move, self.board.mpSymSymInverse[iSym] if fInverse else iSym)
+
+	def MoveHistoryKey(self:BitboardGameState, move:Move) -> Tuple[int,int]:
+		return (move.iHexTo, move.iHexStone)
+
+	def Snapshot(self:BitboardGameState) -> Tuple:
+		"""Same format as GameState.Snapshot"""
+		return (self.board.boardlayout.Pack(),
+				tuple((iHex, int(side)) for side in Side for iHex,_ in self.mpSideAVik[side]),
+				self.maskStone,
+				None if self.sideToPlay == None else int(self.sideToPlay))
+
+	@staticmethod
+	def FromSnapshot(snapshot:Tuple) -> BitboardGameState:
+		return BitboardGameState(gs=GameState.FromSnapshot(snapshot))
+
+	def PackMove(self:BitboardGameState, move:Move) -> int:
+		return move.Pack()
+
+	def UnpackMove(self:BitboardGameState, movePacked:int) -> Move:
+		return Move.Unpack(movePacked)
+
+	def MoveScoreStatic(self:BitboardGameState, move:Move) -> float:
+		"""Same as GameState.MoveScoreStatic"""
+
+		maskVikOpp = self.mpSideMaskVik[self.sideToPlay.Opposite()]
+		cAdjacent = (self.board.mpIHexMaskNeighbors[move.iHexStone] & maskVikOpp).bit_count()
+		return 2 * self.board.FStoneMaySplit(move.iHexStone, self.maskStone) + cAdjacent
+
+	def Moves(self:BitboardGameState) -> Iterator[Move]:
+		"""Yields all legal moves from current state, in the same order as GameState.Moves"""
+
+		# Only locals are used between yields, since the caller may DoMove/UndoMove while iterating
+
+		side = self.sideToPlay
+		if side == None:
+			return
+
+		maskBlock = self.maskStone | self.mpSideMaskVik[Side.Red] | self.mpSideMaskVik[Side.White]
+		maskContested = self.mpTypeMask[RegionType.Contested]
+		aIHexFromMaskVis = [(iHexFrom, self.MaskVisibleVik(iHexFrom)) for iHexFrom,_ in self.mpSideAVik[side] if (maskContested >> iHexFrom) & 1]
+
+		for iHexFrom,maskVis in aIHexFromMaskVis:
+			maskBlockStone = maskBlock & ~(1 << iHexFrom)
+			for iHexTo in self.board.AIHexInRays(iHexFrom, maskVis):
+				for iHexStone in self.board.AIHexVisible(iHexTo, maskBlockStone):
+					yield Move(iHexFrom, iHexTo, iHexStone)
+
+	def MovePrefixes(self:BitboardGameState) -> List[Tuple[int,int]]:
+		"""Same as GameState.MovePrefixes"""
+
+		side = self.sideToPlay
+		if side == None:
+			return []
+		maskContested = self.mpTypeMask[RegionType.Contested]
+		return [(iHexFrom, iHexTo)
+				for iHexFrom,_ in self.mpSideAVik[side] if (maskContested >> iHexFrom) & 1
+				for iHexTo in self.board.AIHexInRays(iHexFrom, self.MaskVisibleVik(iHexFrom))]
+
+	def MovesFromPrefix(self:BitboardGameState, prefix:Tuple[int,int]) -> List[Move]:
+		iHexFrom,iHexTo = prefix
+		maskBlockStone = (self.maskStone | self.mpSideMaskVik[Side.Red] | self.mpSideMaskVik[Side.White]) & ~(1 << iHexFrom)
+		return [Move(iHexFrom, iHexTo, iHexStone) for iHexStone in self.board.AIHexVisible(iHexTo, maskBlockStone)]
+
+	def MovePrefix(self:BitboardGameState, move:Move) -> Tuple[int,int]:
+		return (move.iHexFrom, move.iHexTo)
+
+	def MaskVisibleVik(self:BitboardGameState, iHex:int) -> int:
+		"""Same as GameState.MaskVisibleVik"""
+
+		maskBlock = self.maskStone | self.mpSideMaskVik[Side.Red] | self.mpSideMaskVik[Side.White]
+		maskSeen = self.mpIHexMaskSeen.get(iHex)
+		if maskSeen == None:
+			maskSeen = self.mpIHexMaskSeen[iHex] = self.board.MaskSeen(iHex, maskBlock)
+		return maskSeen & ~maskBlock
+
+	def MoveRandom(self:BitboardGameState, rng:random.Random) -> Optional[Move]:
+		side = self.sideToPlay
+		if side == None:
+			return None
+		maskContested = self.mpTypeMask[RegionType.Contested]
+		aIHexFrom = [iHex for iHex,_ in self.mpSideAVik[side] if (maskContested >> iHex) & 1]
+		return self.board.MoveRandom(rng, aIHexFrom, self.maskStone | self.mpSideMaskVik[Side.Red] | self.mpSideMaskVik[Side.White],
+									 self.MaskVisibleVik)
+
+	def FMoveLegal(self:BitboardGameState, move:Move) -> bool:
+		side = self.sideToPlay
+		if side == None or not (self.mpSideMaskVik[side] >> move.iHexFrom) & 1 or not (self.mpTypeMask[RegionType.Contested] >> move.iHexFrom) & 1:
+			return False
+		return self.board.FMoveVisible(move, self.maskStone | self.mpSideMaskVik[Side.Red] | self.mpSideMaskVik[Side.White],
+									   self.MaskVisibleVik(move.iHexFrom))
+
+	def ScoreEstimate(self:BitboardGameState, gameOver:bool=False) -> float:
+		"""Return a heuristic value of this board position with higher scores being better for Red; matches GameState"""
+
+		cHexRed = self.mpTypeMask[RegionType.SettledRed].bit_count()
+		cHexWhite = self.mpTypeMask[RegionType.SettledWhite].bit_count()
+
+		if gameOver or self.mpTypeMask[RegionType.Contested] == 0:
+			return (cHexRed - cHexWhite) * 100000
+
+		cHexMaybe = 0 # + for Red, - for White
+		if self.aMaskContested:
+			mpSideCHexVis = [0,0]
+			for side in Side:
+				for iHex,_ in self.mpSideAVik[side]:
+					mpSideCHexVis[side] += self.MaskVisibleVik(iHex).bit_count()
+
+			if sum(mpSideCHexVis) > 0:
+				frac = mpSideCHexVis[Side.Red] / sum(mpSideCHexVis)
+				for maskRegion in self.aMaskContested:
+					cHex = maskRegion.bit_count() - 1
+					cHexMaybe += Lerp(-cHex, cHex, frac)
+
+		return cHexRed - cHexWhite + cHexMaybe
+
+	def ScoreEstimateNoMoves(self:BitboardGameState) -> float:
+		return self.ScoreEstimate(gameOver=True)
+
+	def ScoreFinal(self:BitboardGameState) -> Optional[float]:
+		return self.ScoreEstimate(gameOver=True) if self.sideToPlay == None else None
+
+	def ScoreTerms(self:BitboardGameState) -> Tuple:
+		"""Same as GameState.ScoreTerms"""
+		return (self.maskStone | self.mpSideMaskVik[Side.Red] | self.mpSideMaskVik[Side.White],
+				[(iHex, side) for side in Side for iHex,_ in self.mpSideAVik[side]],
+				self.mpTypeMask[RegionType.SettledRed].bit_count(),
+				self.mpTypeMask[RegionType.SettledWhite].bit_count(),
+				self.mpTypeMask[RegionType.Contested].bit_count(),
+				[maskRegion.bit_count() for maskRegion in self.aMaskContested])
+
+	def ScoreEstimateChildren(self:BitboardGameState, moves:List[Move]) -> List[float]:
+		"""Scores after each move, evaluated as one NumPy batch if batcheval is available"""
+		if batcheval == None:
+			return super().ScoreEstimateChildren(moves)
+
+		aTerms = []
+		for move in moves:
+			self.DoMove(move)
+			aTerms.append(self.ScoreTerms())
+			self.UndoMove(move)
+		return batcheval.ScoreTermsMany(self.board, aTerms)
+
+	def MpSideScore(self:BitboardGameState) -> List[int]:
+		return [self.mpTypeMask[RegionType.SettledRed].bit_count(), self.mpTypeMask[RegionType.SettledWhite].bit_count()]
+
+
+bl_Standard = BoardLayout(
+				[(0,5), (0,6), (0,7), (0,8), (0,9), (0,10), (0,11), (0,11), (1,10), (2,9)],
+				[[(5,9), (6,9), (7,9)], [(1,0), (2,0), (3,0)]])
+
+bl_5x5_3v3 = BoardLayout([(0,4), (0,5), (0,6), (0,7), (0,8), (1,7), (2,6), (3,5), (4,4)], 
+						  [[(0,0),(7,4),(4,8)], [(3,0),(0,4),(7,8)]])
+
+# this one is nearly interesting, but starting move is devastating
+bl_4x4_2v2 = BoardLayout([(0,4), (0,5), (0,6), (0,7), (1,6), (2,5), (3,4)], [[(3,6), (6,6)], [(0,0),(3,0)]])
+# this version is much better
+bl_4x4_2v2 = BoardLayout([(0,4), (0,5), (0,6), (0,7), (1,6), (2,5), (3,4)], [[(3,6),(3,0)], [(0,0),(6,6)]])
+
+bl_3x4_2v2 = BoardLayout([(0,4), (0,5), (0,6), (1,5), (2,4)], [[(2,4), (5,4)], [(0,0),(3,0)]])
+bl_3x3_2v2 = BoardLayout([(0,3), (0,4), (0,5), (1,4), (2,3)], [[(2,4), (4,4)], [(0,0),(2,0)]])
+bl_3x3_1v1 = BoardLayout([(0,3), (0,4), (0,5), (1,4), (2,3)], [[(2,4)], [(0,0)]])
+bl_2x2_1v1 = BoardLayout([(0,2), (0,3), (1,2)], [[(2,2)], [(0,0)]])
+bl_2x3_1v1 = BoardLayout([(0,3), (0,4), (1,3)], [[(3,2)], [(0,0)]])
+
+
+def MpNameLayout() -> Dict[str, BoardLayout]:
+	"""Every layout above, by name"""
+	return {name:value for name,value in globals().items() if name.startswith("bl_") and isinstance(value, BoardLayout)}
@@ -0,0 +1,158 @@
+"""Game records: a layout plus the moves played, as compact text for files and the clipboard
+
+	# Ragnarocks game record
+	layout bl_5x5_3v3
+	moves 43-7@38 26-24@45 20-19@15
+
+Each move is from-to@stone in hex indexes (Board.IHex). Layouts with a name in MpNameLayout are
+written by name, others as their BoardLayout.Pack() tuple in JSON.
+
+A GameRecord keeps only the moves plus a GameState every s_cPlyCheckpoint plies; GsAt rebuilds any
+other ply by replaying from the checkpoint before it. That's what RagnarokWidget's undo and redo use.
+"""
+
+from __future__ import annotations
+
+import array
+import json
+import os
+from typing import *
+
+from engine import *
+
+
+class GameRecord:
+	"""Moves played from a Board's start position, with sparse checkpoints for rebuilding positions"""
+
+	s_cPlyCheckpoint = 16
+	s_header = "# Ragnarocks game record"
+
+	def __init__(self:GameRecord, board:Board, moves:Iterable[Move] = ()):
+		self.board = board
+		self.movesPacked = array.array("I")
+		self.mpPlyGs:Dict[int, GameState] = {0: GameState(board)} # checkpoints, plus the last state asked for
+		self.plyLast = 0
+		for move in moves:
+			self.Append(move)
+
+	def __len__(self):
+		return len(self.movesPacked)
+
+	def Move(self:GameRecord, ply:int) -> Move:
+		"""Move played from ply"""
+		return Move.Unpack(self.movesPacked[ply])
+
+	def Moves(self:GameRecord) -> List[Move]:
+		return [Move.Unpack(movePacked) for movePacked in self.movesPacked]
+
+	def Append(self:GameRecord, move:Move, gsNext:GameState = None) -> GameState:
+		"""Plays move after the last one; gsNext is the resulting state, if the caller already has it"""
+
+		if gsNext == None:
+			gsNext = self.GsAt(len(self)).DoMove(move)
+		self.movesPacked.append(move.Pack())
+		self.Remember(len(self), gsNext)
+		return gsNext
+
+	def Truncate(self:GameRecord, cPly:int):
+		"""Drops moves from ply cPly on"""
+
+		del self.movesPacked[cPly:]
+		for ply in [ply for ply in self.mpPlyGs if ply > cPly]:
+			del self.mpPlyGs[ply]
+
+	def Remember(self:GameRecord, ply:int, gs:GameState):
+		"""Keeps gs if it's a checkpoint or, replacing the previous one, as the last state asked for"""
+
+		if self.plyLast % GameRecord.s_cPlyCheckpoint != 0:
+			self.mpPlyGs.pop(self.plyLast, None)
+		self.mpPlyGs[ply] = gs
+		self.plyLast = ply
+
+	def GsAt(self:GameRecord, ply:int) -> GameState:
+		"""State after the first ply moves"""
+
+		assert(0 <= ply <= len(self))
+		gs = self.mpPlyGs.get(ply)
+		if gs != None:
+			return gs
+
+		# Replay from the latest checkpoint (or the last state asked for) at or before ply
+
+		plyStart = max(plyKnown for plyKnown in self.mpPlyGs if plyKnown <= ply)
+		gs = self.mpPlyGs[plyStart]
+		for plyReplay in range(plyStart, ply):
+			gs = gs.DoMove(self.Move(plyReplay))
+			if (plyReplay + 1) % GameRecord.s_cPlyCheckpoint == 0:
+				self.mpPlyGs[plyReplay + 1] = gs
+		self.Remember(ply, gs)
+		return gs
+
+	# Text form
+
+	def ToText(self:GameRecord) -> str:
+		layoutPacked = self.board.boardlayout.Pack()
+		aName = [name for name,layout in MpNameLayout().items() if layout.Pack() == layoutPacked]
+		strLayout = aName[0] if aName else json.dumps(layoutPacked)
+		strMoves = " ".join(f"{move.iHexFrom}-{move.iHexTo}@{move.iHexStone}" for move in self.Moves())
+		return f"{GameRecord.s_header}\nlayout {strLayout}\nmoves {strMoves}\n"
+
+	@staticmethod
+	def FromText(text:str, board:Board = None) -> GameRecord:
+		"""Parses ToText output, checking every move is legal. With board, the record must be for its layout
+		   and uses it; otherwise the Board comes from Board.FromPacked. Raises ValueError if anything's wrong"""
+
+		strLayout = None
+		aStrMove = []
+		for line in text.splitlines():
+			line = line.strip()
+			if not line or line.startswith("#"):
+				continue
+			key,_,value = line.partition(" ")
+			if key == "layout":
+				strLayout = value.strip()
+			elif key == "moves":
+				aStrMove += value.split()
+			else:
+				raise ValueError(f"unexpected line in game record: {line!r}")
+		if strLayout == None:
+			raise ValueError("game record has no layout")
+
+		mpNameLayout = MpNameLayout()
+		if strLayout in mpNameLayout:
+			layoutPacked = mpNameLayout[strLayout].Pack()
+		else:
+			try:
+				rowdefs,startingPositions = json.loads(strLayout)
+				layoutPacked = BoardLayout(rowdefs, startingPositions).Pack()
+			except (json.JSONDecodeError, TypeError, ValueError):
+				raise ValueError(f"unknown layout {strLayout!r}") from None
+
+		if board == None:
+			board = Board.FromPacked(layoutPacked)
+		elif board.boardlayout.Pack() != layoutPacked:
+			raise ValueError(f"game record is for layout {strLayout}, not this board's")
+
+		record = GameRecord(board)
+		for strMove in aStrMove:
+			try:
+				strFrom,_,strRest = strMove.partition("-")
+				strTo,_,strStone = strRest.partition("@")
+				move = Move(int(strFrom), int(strTo), int(strStone))
+			except ValueError:
+				raise ValueError(f"bad move {strMove!r} in game record") from None
+			gs = record.GsAt(len(record))
+			if move not in set(gs.Moves()):
+				raise ValueError(f"illegal move {strMove} at ply {len(record)} of game record")
+			record.Append(move)
+		return record
+
+	def Save(self:GameRecord, path:str):
+		with open(path + ".tmp", "w") as file:
+			file.write(self.ToText())
+		os.replace(path + ".tmp", path)
+
+	@staticmethod
+	def Load(path:str, board:Board = None) -> GameRecord:
+		with open(path) as file:
+			return GameRecord.FromText(file.read(), board)
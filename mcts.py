@@ -0,0 +1,286 @@
+"""Monte Carlo tree search: an alternative to minimax for big layouts, where thousands of moves per position
+keep alpha-beta shallow
+
+	mcts = MCTS(seed=0)
+	move,score,info = mcts.Search(gs, fMax, msBudget=2000) # score: expected result for the maximizing side, 0 to 1
+
+	with ParallelMCTS(cWorker=4) as mcts: # one tree per process, visit counts merged at the root
+		move,score,info = mcts.Search(gs, fMax, cPlayout=2000)
+
+Each playout descends the tree by UCT, adds one node, then plays on from there with
+AbstractGameState.MoveRandom (which picks a viking, a destination and a stone without listing every
+move) for at most cPlyPlayout plies. A finished game counts 1 for a win, 0.5 for a draw and 0 for a
+loss; a playout cut short is judged the same way by the sign of ScoreEstimate.
+
+With thousands of moves per position, trying each once before looking deeper would leave the tree one
+ply deep. So a node only gets a new child while it has fewer than cWiden * sqrt(visits) (progressive
+widening), and its moves are added best MoveScoreStatic first.
+
+An MCTS keeps its tree between searches; if the next position is one already in the tree (e.g. after
+our move and the reply), that subtree becomes the new root.
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+import math
+import multiprocessing
+import random
+import time
+from typing import *
+
+from minimax import AbstractGameState, SearchInfo
+
+
+def Reward(score:float) -> float:
+	"""Playout result for the maximizing side from a score for it (ScoreFinal, ScoreEstimate, ...)"""
+	return 1.0 if score > 0 else 0.0 if score < 0 else 0.5
+
+
+class MctsNode:
+	"""One position in the tree, reached from parent by move"""
+
+	__slots__ = ("move", "parent", "aChild", "movesUntried", "fMax", "key", "cVisit", "rewardMax")
+
+	def __init__(self, move, parent:MctsNode, fMax:bool, key:Optional[int]):
+		self.move = move
+		self.parent = parent
+		self.aChild:List[MctsNode] = []
+		self.movesUntried:List = None # generated on the first playout through this node, then popped as children are added
+		self.fMax = fMax # side to play here is the maximizing one
+		self.key = key # AbstractGameState.Key(), for finding the position again when the tree is reused
+		self.cVisit = 0
+		self.rewardMax = 0.0 # playout results summed, for the maximizing side
+
+	def ValueMax(self:MctsNode) -> float:
+		"""Mean playout result for the maximizing side"""
+		return self.rewardMax / self.cVisit if self.cVisit else 0.5
+
+	def ChildBest(self:MctsNode) -> Optional[MctsNode]:
+		"""Most visited child, that's the move to play; the better one for the side to play on a tie"""
+		fMax = self.fMax
+		return max(self.aChild, key=lambda child: (child.cVisit, child.ValueMax() if fMax else -child.ValueMax()), default=None)
+
+	def CNode(self:MctsNode) -> int:
+		"""Nodes in the subtree from here"""
+		return 1 + sum(child.CNode() for child in self.aChild)
+
+
+class MCTS:
+	"""UCT search with random playouts; see module docstring"""
+
+	s_cPlayoutDefault = 1000 # when neither msBudget nor cPlayout is given
+	s_cPlayoutProgress = 256 # playouts between fnProgress calls
+
+	def __init__(self:MCTS, cUct:float = math.sqrt(2), cPlyPlayout:Optional[int] = 16, cWiden:Optional[float] = 2.0, seed = None):
+		self.cUct = cUct # exploration weight in UCT
+		self.cPlyPlayout = cPlyPlayout # None plays every playout to the end
+		self.cWiden = cWiden # None tries every move at a node before going deeper
+		self.rng = random.Random(seed)
+		self.root:MctsNode = None
+
+	def RootFor(self:MCTS, gs:AbstractGameState, fMax:bool) -> MctsNode:
+		"""The existing node for gs within two plies of the last root, detached to be the new root; else a new one"""
+
+		key = gs.Key()
+		if key != None and self.root != None:
+			aNode = [self.root]
+			for _ in range(3):
+				for node in aNode:
+					if node.key == key and node.fMax == fMax:
+						node.parent = None
+						node.move = None
+						return node
+				aNode = [child for node in aNode for child in node.aChild]
+		return MctsNode(None, None, fMax, key)
+
+	def Search(self:MCTS, gs:AbstractGameState, fMax:bool, msBudget:Optional[float] = None, cPlayout:Optional[int] = None,
+			   eventCancel = None, fnProgress:Callable[[int, Any, float, int], None] = None) -> Tuple[Any, float, SearchInfo]:
+		"""Runs playouts from gs until msBudget or cPlayout (whichever comes first) runs out, or eventCancel (a
+		   threading.Event) is set. Returns the most visited move (None if there are none), its mean result for
+		   the maximizing side, and a SearchInfo whose depth is the deepest the tree got and cNode the playouts.
+		   fnProgress(depth, move, score, cPlayout) is called every s_cPlayoutProgress playouts, like
+		   SearchTimed's fnIteration"""
+
+		timeStart = time.perf_counter()
+		timeEnd = timeStart + msBudget / 1000 if msBudget != None else None
+		if msBudget == None and cPlayout == None:
+			cPlayout = MCTS.s_cPlayoutDefault
+
+		self.root = root = self.RootFor(gs, fMax)
+		cPlayoutDone = 0
+		depthMax = 0
+		while cPlayout == None or cPlayoutDone < cPlayout:
+			if timeEnd != None and cPlayoutDone > 0 and time.perf_counter() > timeEnd:
+				break
+			if eventCancel != None and eventCancel.is_set():
+				break
+			depthMax = max(depthMax, self.Playout(gs, root))
+			cPlayoutDone += 1
+			if root.movesUntried == [] and not root.aChild:
+				break # no moves; nothing to find out
+			if fnProgress != None and cPlayoutDone % MCTS.s_cPlayoutProgress == 0:
+				child = root.ChildBest()
+				fnProgress(depthMax, child.move, child.ValueMax(), cPlayoutDone)
+
+		child = root.ChildBest()
+		move,score = (child.move, child.ValueMax()) if child != None else (None, root.ValueMax())
+		return move,score,SearchInfo(depthMax, cPlayoutDone, time.perf_counter() - timeStart)
+
+	def Playout(self:MCTS, gs:AbstractGameState, root:MctsNode) -> int:
+		"""One playout from root, which is gs: select, expand, play on at random, back up. Returns the depth
+		   of the node added. gs is left as it was"""
+
+		aMoveDone = []
+		node = root
+		try:
+			# Select by UCT while every move here has a child, or as many as widening allows
+
+			while node.aChild and (node.movesUntried == [] or not self.FWiden(node)):
+				node = self.ChildUct(node)
+				gsPrev = gs
+				gs = gs.DoMove(node.move)
+				aMoveDone.append((gsPrev, node.move))
+
+			# Expand one untried move
+
+			if node.movesUntried == None:
+				movesUntried = list(gs.Moves()) if gs.ScoreFinal() == None else []
+				self.rng.shuffle(movesUntried) # so ties go either way
+				movesUntried.sort(key=gs.MoveScoreStatic) # best last, to pop first
+				node.movesUntried = movesUntried
+			if node.movesUntried:
+				move = node.movesUntried.pop()
+				gsPrev = gs
+				gs = gs.DoMove(move)
+				aMoveDone.append((gsPrev, move))
+				child = MctsNode(move, node, not node.fMax, gs.Key())
+				node.aChild.append(child)
+				node = child
+			depth = len(aMoveDone)
+
+			# Play on at random, then back the result up
+
+			cPly = 0
+			while True:
+				score = gs.ScoreFinal()
+				if score != None:
+					break
+				if self.cPlyPlayout != None and cPly >= self.cPlyPlayout:
+					score = gs.ScoreEstimate()
+					break
+				move = gs.MoveRandom(self.rng)
+				if move == None:
+					score = gs.ScoreEstimateNoMoves()
+					break
+				gsPrev = gs
+				gs = gs.DoMove(move)
+				aMoveDone.append((gsPrev, move))
+				cPly += 1
+
+			reward = Reward(score)
+			while node != None:
+				node.cVisit += 1
+				node.rewardMax += reward
+				node = node.parent
+			return depth
+		finally:
+			for gsPrev,move in reversed(aMoveDone):
+				if gsPrev.fInPlace:
+					gsPrev.UndoMove(move)
+
+	def FWiden(self:MCTS, node:MctsNode) -> bool:
+		"""Whether node, which has untried moves, may get another child"""
+		return self.cWiden == None or len(node.aChild) < self.cWiden * math.sqrt(node.cVisit)
+
+	def ChildUct(self:MCTS, node:MctsNode) -> MctsNode:
+		"""Child with the best upper confidence bound for the side to play at node"""
+
+		cLogVisit = math.log(node.cVisit)
+		cUct = self.cUct
+		fMax = node.fMax
+		childBest = None
+		uctBest = -1.0
+		for child in node.aChild:
+			value = child.rewardMax / child.cVisit
+			uct = (value if fMax else 1.0 - value) + cUct * math.sqrt(cLogVisit / child.cVisit)
+			if uct > uctBest:
+				childBest,uctBest = child,uct
+		return childBest
+
+
+# Worker process state for ParallelMCTS
+
+s_mctsWorker:MCTS = None # kept between searches, so the worker's tree can be reused
+
+def _SearchWorker(clsState:type, snapshot:Hashable, fMax:bool, msBudget:Optional[float], cPlayout:Optional[int], seed:str,
+				  cUct:float, cPlyPlayout:Optional[int], cWiden:Optional[float]) -> Tuple[Dict[Hashable, Tuple[int, float]], int, int]:
+	"""Worker side of ParallelMCTS: one search; returns each root move's (visits, reward), playouts and depth"""
+
+	global s_mctsWorker
+
+	if s_mctsWorker == None:
+		s_mctsWorker = MCTS()
+	s_mctsWorker.cUct = cUct
+	s_mctsWorker.cPlyPlayout = cPlyPlayout
+	s_mctsWorker.cWiden = cWiden
+	s_mctsWorker.rng.seed(seed)
+
+	gs = clsState.FromSnapshot(snapshot)
+	_, _, info = s_mctsWorker.Search(gs, fMax, msBudget, cPlayout)
+	mpMovePackedVisitReward = {gs.PackMove(child.move): (child.cVisit, child.rewardMax) for child in s_mctsWorker.root.aChild}
+	return mpMovePackedVisitReward, info.cNode, info.depth
+
+
+class ParallelMCTS:
+	"""Root-parallel MCTS: every worker process searches the same position with its own tree and seed, and
+	   the root's visit counts and results are summed over them before picking the most visited move.
+	   The budget is per worker. Like ParallelSearch, keep one around (or use with "with")"""
+
+	def __init__(self:ParallelMCTS, cWorker:int = None, cUct:float = math.sqrt(2), cPlyPlayout:Optional[int] = 16,
+				 cWiden:Optional[float] = 2.0, seed = 0):
+		self.cWorker = cWorker if cWorker != None else multiprocessing.cpu_count()
+		self.cUct = cUct
+		self.cPlyPlayout = cPlyPlayout
+		self.cWiden = cWiden
+		self.seed = seed
+		self.executor = ProcessPoolExecutor(self.cWorker)
+		self.iSearch = 0
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.Close()
+
+	def Close(self):
+		self.executor.shutdown()
+
+	def Search(self:ParallelMCTS, gs:AbstractGameState, fMax:bool, msBudget:Optional[float] = None,
+			   cPlayout:Optional[int] = None) -> Tuple[Any, float, SearchInfo]:
+		"""Same results as MCTS.Search, over all workers"""
+
+		timeStart = time.perf_counter()
+		self.iSearch += 1
+		snapshot = gs.Snapshot()
+		futures = [self.executor.submit(_SearchWorker, type(gs), snapshot, fMax, msBudget, cPlayout,
+										f"{self.seed}/{self.iSearch}/{iWorker}", self.cUct, self.cPlyPlayout, self.cWiden)
+				   for iWorker in range(self.cWorker)]
+
+		mpMovePackedVisitReward:Dict[Hashable, List] = {}
+		cPlayoutTotal = 0
+		depthMax = 0
+		for future in futures:
+			mpMovePackedVisitRewardWorker,cPlayoutWorker,depth = future.result()
+			for movePacked,(cVisit,reward) in mpMovePackedVisitRewardWorker.items():
+				visitReward = mpMovePackedVisitReward.setdefault(movePacked, [0, 0.0])
+				visitReward[0] += cVisit
+				visitReward[1] += reward
+			cPlayoutTotal += cPlayoutWorker
+			depthMax = max(depthMax, depth)
+
+		info = SearchInfo(depthMax, cPlayoutTotal, time.perf_counter() - timeStart)
+		if not mpMovePackedVisitReward:
+			return None, Reward(gs.ScoreEstimateNoMoves()), info
+		movePacked,(cVisit,reward) = max(mpMovePackedVisitReward.items(), key=lambda item: item[1][0])
+		return gs.UnpackMove(movePacked), reward / cVisit, info
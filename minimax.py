@@ -1,10 +1,22 @@
+from __future__ import annotations
+
 from typing import *
 from abc import ABC, abstractmethod
+from enum import IntEnum
+from collections import defaultdict, Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+import random
 import sys
+import time
 
 
 
 class AbstractGameState(ABC):
+	# True if DoMove alters this state in place (and returns it) and UndoMove reverts it,
+	#  so search can walk the tree without allocating a new state per node
+	fInPlace:bool = False
+
 	@abstractmethod
 	def Moves(self):
 		# BB how to hint that it returns new AbstractGameState subclass instances?
@@ -15,6 +27,10 @@ class AbstractGameState(ABC):
 		"""Apply the move to the current game state and returns a new game state"""
 		pass
 
+	def UndoMove(self, move):
+		"""Revert the given move, which must be the last one applied by DoMove. Only needed if fInPlace"""
+		raise NotImplementedError
+
 	@abstractmethod
 	def ScoreEstimate(self) -> float:
 		"""Return an estimate for "how good" this state is for the current player"""
@@ -27,25 +43,492 @@ class AbstractGameState(ABC):
 		"""Return score given that there are no possible moves"""
 		pass
 
-cScore = 0
+	def ScoreFinal(self) -> Optional[float]:
+		"""Return the score if the game is over, else None. PVSRecursive scores these as decided results,
+		   preferring bigger and sooner wins; the default leaves them to ScoreEstimate"""
+		return None
+
+	def ScoreEstimateChildren(self, moves:List) -> List[float]:
+		"""Return ScoreEstimate() of the state after each move; override to evaluate them as a batch"""
+
+		scores = []
+		for move in moves:
+			gsNext = self.DoMove(move)
+			scores.append(gsNext.ScoreEstimate())
+			if self.fInPlace:
+				self.UndoMove(move)
+		return scores
+
+	def Key(self) -> Optional[int]:
+		"""Return a hash of this position (including side to play) for transposition tables, or None if unsupported.
+		   Moves must compare equal (==) to the same move generated from a transposed position"""
+		return None
+
+	def KeyCanonical(self) -> Tuple[Optional[int], int]:
+		"""Return a key shared by every position equivalent to this one under a symmetry of the game, and which
+		   symmetry maps this position to the one it's the Key() of. Transposition tables store one entry per
+		   equivalence class this way, with moves mapped by MoveSym. The default knows no symmetries"""
+		return self.Key(), 0
+
+	def MoveSym(self, move, iSym:int, fInverse:bool = False):
+		"""Return move's image under symmetry iSym from KeyCanonical, or under its inverse"""
+		return move
+
+	# Hooks for MoveOrderer; the defaults work for any hashable move
+
+	def MoveHistoryKey(self, move) -> Hashable:
+		"""Return the key MoveOrderer's history heuristic files this move under"""
+		return move
+
+	def MoveScoreStatic(self, move) -> float:
+		"""Return a cheap guess at how good a move is, higher first, without making it"""
+		return 0
+
+	# Optional staged move generation, for MoveOrderer.OrderLazy. A game whose moves are built in parts
+	#  (e.g. which piece goes where, then a choice that depends on that) lists the first parts up front
+	#  and only generates the rest for the prefixes the search gets to
+
+	def MovePrefixes(self) -> Optional[List[Hashable]]:
+		"""Return the distinct first parts of the legal moves, or None if moves aren't generated in stages"""
+		return None
+
+	def MovesFromPrefix(self, prefix:Hashable) -> List:
+		"""Return the legal moves that start with prefix"""
+		raise NotImplementedError
+
+	def MovePrefix(self, move) -> Hashable:
+		"""Return the prefix move starts with"""
+		raise NotImplementedError
+
+	def FMoveLegal(self, move) -> bool:
+		"""Return whether move is legal here, e.g. a killer move from another position"""
+		return move in list(self.Moves())
+
+	def MoveRandom(self, rng:random.Random):
+		"""Return a legal move picked at random (not necessarily uniformly), or None if there are none.
+		   Used for MCTS playouts; override to pick one without generating every move"""
+		moves = list(self.Moves())
+		return rng.choice(moves) if moves else None
+
+	# Needed by ParallelSearch to ship positions and moves to worker processes
+
+	def Snapshot(self) -> Hashable:
+		"""Return a compact, picklable copy of this position that FromSnapshot can rebuild"""
+		raise NotImplementedError
+
+	@staticmethod
+	def FromSnapshot(snapshot:Hashable) -> AbstractGameState:
+		raise NotImplementedError
+
+	def PackMove(self, move) -> Hashable:
+		"""Return a compact, picklable form of move that UnpackMove on an equal position turns back into a move"""
+		raise NotImplementedError
+
+	def UnpackMove(self, movePacked:Hashable):
+		raise NotImplementedError
+
+
+class Bound(IntEnum):
+	Exact = 0
+	Lower = 1 # true score >= stored score
+	Upper = 2 # true score <= stored score
+
+
+class TranspositionTable:
+	"""Fixed-size table of search results keyed by AbstractGameState.KeyCanonical()
+
+	   Each slot holds one (key, depth, score, bound, move, generation) tuple. A new result replaces
+	   the old one in its slot unless the old one is from the current search and was searched deeper."""
+
+	def __init__(self, cEntryMax:int = 1 << 18):
+		self.cEntryMax = cEntryMax
+		self.entries:List[Optional[Tuple]] = [None] * cEntryMax
+		self.generation = 0
+
+		self.cHit = 0 # found, even if too shallow to use
+		self.cMiss = 0
+		self.cStore = 0
+		self.cOverwrite = 0 # stores that replaced a different position
+		self.cReject = 0 # stores dropped to keep a deeper entry
+
+	def NewSearch(self):
+		"""Call between searches so entries from earlier ones become preferred for replacement"""
+		self.generation += 1
+
+	def Lookup(self, key:int) -> Optional[Tuple]:
+		entry = self.entries[key % self.cEntryMax]
+		if entry != None and entry[0] == key:
+			self.cHit += 1
+			return entry
+		self.cMiss += 1
+		return None
+
+	def Store(self, key:int, depth:int, score:float, bound:Bound, move):
+		iEntry = key % self.cEntryMax
+		entry = self.entries[iEntry]
+		if entry != None and entry[0] != key:
+			if entry[5] == self.generation and entry[1] > depth:
+				self.cReject += 1
+				return
+			self.cOverwrite += 1
+		self.entries[iEntry] = (key, depth, score, bound, move, self.generation)
+		self.cStore += 1
+
+	def CEntryUsed(self) -> int:
+		return sum(1 for entry in self.entries if entry != None)
+
+	def CbEstimate(self) -> int:
+		"""Rough memory use in bytes if the table were full (slot list + entry tuples; moves are shared with the search)"""
+		cbEntry = sys.getsizeof((0,) * 6) + sys.getsizeof(1 << 63) + sys.getsizeof(0.5)
+		return sys.getsizeof(self.entries) + self.cEntryMax * cbEntry
+
+	def __repr__(self):
+		return (f"TranspositionTable(hit={self.cHit}, miss={self.cMiss}, store={self.cStore}, "
+				f"overwrite={self.cOverwrite}, reject={self.cReject}, used={self.CEntryUsed()}/{self.cEntryMax})")
+
+
+def MovesFirst(gs:AbstractGameState, moveFirst) -> Iterator:
+	"""Yields moveFirst (if any), then the rest of gs.Moves()"""
+
+	if moveFirst != None:
+		yield moveFirst
+	for move in gs.Moves():
+		if move != moveFirst:
+			yield move
+
+
+class MoveOrderer:
+	"""Orders moves for alpha-beta: the principal variation move (previous iteration / transposition
+	   table) first, then killer moves that caused cutoffs at the same ply, then the rest sorted by
+	   history score and AbstractGameState.MoveScoreStatic. Each heuristic can be switched off; to see
+	   what each one buys, pass the search a SearchStats, which counts the index of the move causing each cutoff"""
+
+	def __init__(self, fPV:bool = True, fKillers:bool = True, fHistory:bool = True, fStatic:bool = True, cKiller:int = 2,
+				 fStaged:bool = True):
+		self.fPV = fPV
+		self.fKillers = fKillers
+		self.fHistory = fHistory
+		self.fStatic = fStatic
+		self.cKiller = cKiller
+		self.fStaged = fStaged # OrderLazy generates moves prefix by prefix, if the game supports it
+
+		self.mpPlyKillers:DefaultDict[int, List] = defaultdict(list)
+		self.mpKeyHistory:DefaultDict[Hashable, int] = defaultdict(int)
+		self.mpPrefixHistory:DefaultDict[Hashable, int] = defaultdict(int) # same, by AbstractGameState.MovePrefix
+
+		self.cAllNode = 0 # nodes searched with no cutoff
+
+	def Order(self, gs:AbstractGameState, ply:int, movePV) -> List:
+		moves = list(gs.Moves())
+
+		if self.fHistory or self.fStatic:
+			mpKeyHistory = self.mpKeyHistory
+			fHistory,fStatic = self.fHistory,self.fStatic
+			moves.sort(key=lambda move: (mpKeyHistory.get(gs.MoveHistoryKey(move), 0) if fHistory else 0,
+										 gs.MoveScoreStatic(move) if fStatic else 0),
+					   reverse=True)
+
+		movesFirst = []
+		if self.fPV and movePV != None:
+			movesFirst.append(movePV)
+		if self.fKillers:
+			movesFirst += [move for move in self.mpPlyKillers[ply] if move not in movesFirst]
+
+		# Only moves legal here are moved to the front
 
-def MinimaxRecursive(gs:AbstractGameState, fMax:bool, lookahead:int, alpha:float, beta:float):
+		for move in reversed(movesFirst):
+			try:
+				moves.remove(move)
+			except ValueError:
+				continue
+			moves.insert(0, move)
+
+		return moves
+
+	def OrderLazy(self, gs:AbstractGameState, ply:int, movePV) -> Iterator:
+		"""Like Order, but yields moves as they're needed, so a cutoff early on skips generating the rest.
+		   The PV move and killers come first; then prefixes in history order, each prefix's moves sorted
+		   as in Order. Falls back to Order if fStaged is off or gs doesn't stage its moves"""
+
+		prefixes = gs.MovePrefixes() if self.fStaged else None
+		if prefixes == None:
+			yield from self.Order(gs, ply, movePV)
+			return
+
+		movesFirst = []
+		if self.fPV and movePV != None:
+			movesFirst.append(movePV)
+		if self.fKillers:
+			movesFirst += [move for move in self.mpPlyKillers[ply] if move not in movesFirst]
+		movesFirst = [move for move in movesFirst if gs.FMoveLegal(move)]
+		yield from movesFirst
+
+		if self.fHistory:
+			mpPrefixHistory = self.mpPrefixHistory
+			prefixes.sort(key=lambda prefix: mpPrefixHistory.get(prefix, 0), reverse=True)
+
+		mpKeyHistory = self.mpKeyHistory
+		fHistory,fStatic = self.fHistory,self.fStatic
+		for prefix in prefixes:
+			moves = gs.MovesFromPrefix(prefix)
+			if fHistory or fStatic:
+				moves.sort(key=lambda move: (mpKeyHistory.get(gs.MoveHistoryKey(move), 0) if fHistory else 0,
+											 gs.MoveScoreStatic(move) if fStatic else 0),
+						   reverse=True)
+			for move in moves:
+				if move not in movesFirst:
+					yield move
+
+	def Cutoff(self, gs:AbstractGameState, move, ply:int, lookahead:int, iMove:int):
+		"""Called when move, the iMove'th one Order returned, caused a beta cutoff"""
+
+		if self.fKillers:
+			killers = self.mpPlyKillers[ply]
+			if move not in killers:
+				killers.insert(0, move)
+				del killers[self.cKiller:]
+
+		if self.fHistory:
+			self.mpKeyHistory[gs.MoveHistoryKey(move)] += lookahead * lookahead
+			if self.fStaged and type(gs).MovePrefixes is not AbstractGameState.MovePrefixes:
+				self.mpPrefixHistory[gs.MovePrefix(move)] += lookahead * lookahead
+
+	def NoCutoff(self):
+		self.cAllNode += 1
+
+	def __repr__(self):
+		return f"MoveOrderer(all-nodes={self.cAllNode})"
+
+
+class SearchTimeout(Exception):
+	"""Raised inside MinimaxRecursive or PVSRecursive when SearchContext.timeEnd passes or eventCancel is set"""
+	pass
+
+
+class SearchStats:
+	"""What one search did, for tuning and profiling. Pass one to a search to have it count; without one,
+	   a search counts nothing (beyond SearchContext.cNode). fTiming adds time spent in Moves (including ordering), DoMove and ScoreEstimate; it costs two
+	   perf_counter calls around each, so leave it off unless profiling. fnNode(gs, ply, lookahead, alpha, beta),
+	   if given, is called on entry to every node. Both cost nothing when off"""
+
+	def __init__(self, fTiming:bool = False, fnNode:Callable[[AbstractGameState, int, int, float, float], None] = None):
+		self.fTiming = fTiming
+		self.fnNode = fnNode
+
+		self.mpPlyCNode:Counter[int] = Counter() # nodes entered at each ply from the root, over all iterations
+		self.mpPlyCNodeIter:Counter[int] = Counter() # the same for the last completed iteration alone, if deepening
+		self.mpPlyCNodeStart:Counter[int] = None # mpPlyCNode when the current iteration started
+		self.cLeaf = 0 # ScoreEstimate calls at the frontier
+		self.mpICutoffC:Counter[int] = Counter() # index of move causing cutoff -> count
+		self.cResearch = 0 # PVSRecursive null-window searches that beat alpha and were searched again
+		self.cAspirationFail = 0 # SearchTimedPVS root searches that fell outside their window
+
+		self.secMoves = 0.0
+		self.secDoMove = 0.0
+		self.secScore = 0.0
+
+	def CNode(self) -> int:
+		return sum(self.mpPlyCNode.values())
+
+	def CCutoff(self) -> int:
+		return sum(self.mpICutoffC.values())
+
+	def FracCutoffFirst(self) -> float:
+		"""Fraction of cutoffs caused by the first move tried"""
+		cCutoff = self.CCutoff()
+		return self.mpICutoffC[0] / cCutoff if cCutoff else 0.0
+
+	def IMoveCutoffMean(self) -> float:
+		"""Mean index of the move causing a cutoff"""
+		cCutoff = self.CCutoff()
+		return sum(iMove * c for iMove,c in self.mpICutoffC.items()) / cCutoff if cCutoff else 0.0
+
+	def StartIteration(self):
+		"""Called by SearchTimed and SearchTimedPVS before each iteration"""
+		self.mpPlyCNodeStart = Counter(self.mpPlyCNode)
+
+	def EndIteration(self):
+		"""Called after each completed iteration; keeps its nodes per ply for EBF"""
+		self.mpPlyCNodeIter = self.mpPlyCNode - self.mpPlyCNodeStart
+
+	def EBF(self) -> float:
+		"""Effective branching factor: geometric mean of the ratio of nodes at each ply to the ply before.
+		   With iterative deepening, of the last completed iteration, since earlier ones stop at other depths"""
+		mpPlyCNode = self.mpPlyCNodeIter if self.mpPlyCNodeIter else self.mpPlyCNode
+		if not mpPlyCNode:
+			return 0.0
+		plyMax = max(mpPlyCNode)
+		plyMin = min(mpPlyCNode)
+		if plyMax == plyMin:
+			return 0.0
+		return (mpPlyCNode[plyMax] / mpPlyCNode[plyMin]) ** (1 / (plyMax - plyMin))
+
+	def Merge(self, other:SearchStats):
+		"""Adds another search's counts (e.g. from a ParallelSearch worker) to these"""
+		self.mpPlyCNode.update(other.mpPlyCNode)
+		self.mpPlyCNodeIter.update(other.mpPlyCNodeIter)
+		self.cLeaf += other.cLeaf
+		self.mpICutoffC.update(other.mpICutoffC)
+		self.cResearch += other.cResearch
+		self.cAspirationFail += other.cAspirationFail
+		self.secMoves += other.secMoves
+		self.secDoMove += other.secDoMove
+		self.secScore += other.secScore
+
+	def ToDict(self) -> Dict[str, object]:
+		mpKeyValue = {
+			"nodes": self.CNode(),
+			"nodesPerPly": [self.mpPlyCNode[ply] for ply in range(max(self.mpPlyCNode, default=-1) + 1)],
+			"leaves": self.cLeaf,
+			"cutoffs": self.CCutoff(),
+			"cutoffFirst": self.FracCutoffFirst(),
+			"cutoffIndexMean": self.IMoveCutoffMean(),
+			"ebf": self.EBF(),
+			"researches": self.cResearch,
+			"aspirationFails": self.cAspirationFail,
+		}
+		if self.fTiming:
+			mpKeyValue.update(secMoves=self.secMoves, secDoMove=self.secDoMove, secScore=self.secScore)
+		return mpKeyValue
+
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		state["fnNode"] = None # callbacks stay in the process that made them
+		return state
+
+	def __repr__(self):
+		strTiming = f", Moves {self.secMoves:.3f}s, DoMove {self.secDoMove:.3f}s, ScoreEstimate {self.secScore:.3f}s" if self.fTiming else ""
+		return (f"SearchStats(nodes={self.CNode()}, leaves={self.cLeaf}, cutoffs={self.CCutoff()}, "
+				f"first={self.FracCutoffFirst():.2f}, mean index={self.IMoveCutoffMean():.1f}, ebf={self.EBF():.2f}{strTiming})")
+
+
+class SearchContext:
+	"""Things shared by every node of one search"""
+
+	def __init__(self, tt:TranspositionTable = None, timeEnd:float = None, moveRoot = None, orderer:MoveOrderer = None,
+				 fBatchLeaves:bool = False, eventCancel = None, stats:SearchStats = None):
+		self.tt = tt
+		self.orderer = orderer # None = Moves() order, apart from moveRoot/transposition table move
+		self.fBatchLeaves = fBatchLeaves # score all leaves below a node with one ScoreEstimateChildren call
+		self.timeEnd = timeEnd # time.perf_counter() deadline, or None
+		self.eventCancel = eventCancel # threading.Event another thread sets to stop the search, or None
+		self.moveRoot = moveRoot # tried first at the root, e.g. best move from previous iteration
+		self.cNode = 0
+		self.stats = stats # SearchStats to count in, or None to count nothing
+
+
+class SearchInfo:
+	"""What SearchTimed reports besides the move and score"""
+
+	def __init__(self, depth:int, cNode:int, sec:float, stats:SearchStats = None):
+		self.depth = depth # deepest completed iteration
+		self.cNode = cNode # over all iterations, including the abandoned one
+		self.sec = sec
+		self.stats = stats
+
+	def NodesPerSec(self) -> float:
+		return self.cNode / self.sec if self.sec > 0 else 0.0
+
+	def __repr__(self):
+		return f"SearchInfo(depth={self.depth}, nodes={self.cNode}, sec={self.sec:.3f}, nps={self.NodesPerSec():.0f})"
+
+
+def MinimaxRecursive(gs:AbstractGameState, fMax:bool, lookahead:int, alpha:float, beta:float, ctx:SearchContext, ply:int = 0):
 	"""Minimax with alpha-beta cutoff"""
 
-	global cScore
+	ctx.cNode += 1
+	if ctx.timeEnd != None and time.perf_counter() > ctx.timeEnd:
+		raise SearchTimeout()
+	if ctx.eventCancel != None and ctx.eventCancel.is_set():
+		raise SearchTimeout()
+
+	stats = ctx.stats
+	fTiming = False
+	if stats != None:
+		stats.mpPlyCNode[ply] += 1
+		if stats.fnNode != None:
+			stats.fnNode(gs, ply, lookahead, alpha, beta)
+		fTiming = stats.fTiming
 
 	if lookahead == 0:
-		cScore += 1
+		if stats != None:
+			stats.cLeaf += 1
+		if fTiming:
+			timeStart = time.perf_counter()
+			score = gs.ScoreEstimate()
+			stats.secScore += time.perf_counter() - timeStart
+			return None, score
 		return None, gs.ScoreEstimate()
 
+	# Check transposition table; a deep enough entry may settle this node or narrow the window
+
+	tt = ctx.tt
+	key,iSym = gs.KeyCanonical() if tt != None else (None, 0)
+	moveTT = None
+	if key != None:
+		entry = tt.Lookup(key)
+		if entry != None:
+			_, depth, score, bound, moveTT, _ = entry
+			if moveTT != None:
+				moveTT = gs.MoveSym(moveTT, iSym, fInverse=True) # entry's moves are for the canonical image
+			if depth >= lookahead and ply > 0:
+				if bound == Bound.Exact:
+					return moveTT,score
+				elif bound == Bound.Lower:
+					alpha = max(alpha, score)
+				else:
+					beta = min(beta, score)
+				if alpha >= beta:
+					return moveTT,score
+
+	moveFirst = ctx.moveRoot if ply == 0 and ctx.moveRoot != None else moveTT
+
+	orderer = ctx.orderer
+	if fTiming:
+		timeStart = time.perf_counter()
+	moves = orderer.OrderLazy(gs, ply, moveFirst) if orderer != None else MovesFirst(gs, moveFirst)
+	if fTiming:
+		moves = list(moves) # so generating them is timed here, not bit by bit in the loops below
+		stats.secMoves += time.perf_counter() - timeStart
+
+	# At the frontier, optionally score every child at once. This gives up cutoffs between
+	#  leaves, but the result is the same as scoring them one by one below
+
+	scoresLeaf = None
+	if lookahead == 1 and ctx.fBatchLeaves:
+		moves = list(moves)
+		if fTiming:
+			timeStart = time.perf_counter()
+		scoresLeaf = gs.ScoreEstimateChildren(moves)
+		if fTiming:
+			stats.secScore += time.perf_counter() - timeStart # includes its DoMove/UndoMove calls
+		ctx.cNode += len(moves)
+		if stats != None:
+			stats.mpPlyCNode[ply + 1] += len(moves)
+			stats.cLeaf += len(moves)
+
+	alphaOrig,betaOrig = alpha,beta
 	moveBest = None
+	fCutoff = False
 	
 	if fMax: # maximizing
 		scoreBest = -sys.float_info.max
-		for move in gs.Moves():
-			gsNext = gs.DoMove(move)
+		for iMove,move in enumerate(moves):
+			if scoresLeaf != None:
+				score = scoresLeaf[iMove]
+			else:
+				if fTiming:
+					timeStart = time.perf_counter()
+					gsNext = gs.DoMove(move)
+					stats.secDoMove += time.perf_counter() - timeStart
+				else:
+					gsNext = gs.DoMove(move)
 
-			moveNext,score = MinimaxRecursive(gsNext, False, lookahead - 1, alpha, beta)
+				try:
+					moveNext,score = MinimaxRecursive(gsNext, False, lookahead - 1, alpha, beta, ctx, ply + 1)
+				finally:
+					if gs.fInPlace:
+						gs.UndoMove(move)
 
 			if score > scoreBest:
 				scoreBest = score
@@ -53,13 +536,26 @@ def MinimaxRecursive(gs:AbstractGameState, fMax:bool, lookahead:int, alpha:float
 
 			alpha = max(alpha, score)
 			if alpha >= beta:
+				fCutoff = True
 				break
 	else: # minimizing
 		scoreBest = sys.float_info.max
-		for move in gs.Moves():
-			gsNext = gs.DoMove(move)
+		for iMove,move in enumerate(moves):
+			if scoresLeaf != None:
+				score = scoresLeaf[iMove]
+			else:
+				if fTiming:
+					timeStart = time.perf_counter()
+					gsNext = gs.DoMove(move)
+					stats.secDoMove += time.perf_counter() - timeStart
+				else:
+					gsNext = gs.DoMove(move)
 
-			moveNext,score = MinimaxRecursive(gsNext, True, lookahead - 1, alpha, beta)
+				try:
+					moveNext,score = MinimaxRecursive(gsNext, True, lookahead - 1, alpha, beta, ctx, ply + 1)
+				finally:
+					if gs.fInPlace:
+						gs.UndoMove(move)
 
 			if score < scoreBest:
 				scoreBest = score
@@ -67,15 +563,469 @@ def MinimaxRecursive(gs:AbstractGameState, fMax:bool, lookahead:int, alpha:float
 
 			beta = min(beta, score)
 			if alpha >= beta:
+				fCutoff = True
 				break
+
+	if fCutoff and stats != None:
+		stats.mpICutoffC[iMove] += 1
+	if orderer != None:
+		if fCutoff:
+			orderer.Cutoff(gs, move, ply, lookahead, iMove)
+		elif moveBest != None:
+			orderer.NoCutoff()
 	
 	if moveBest == None: # no possible moves -- score is for current game state
 		scoreBest = gs.ScoreEstimateNoMoves()
 
+	if key != None:
+		if moveBest == None:
+			bound = Bound.Exact
+		elif scoreBest <= alphaOrig:
+			bound = Bound.Upper
+		elif scoreBest >= betaOrig:
+			bound = Bound.Lower
+		else:
+			bound = Bound.Exact
+		tt.Store(key, lookahead, scoreBest, bound, None if moveBest == None else gs.MoveSym(moveBest, iSym))
+
+	return moveBest,scoreBest
+
+
+def Minimax(gs:AbstractGameState, fMax:bool, lookahead:int = 4, tt:TranspositionTable = None, orderer:MoveOrderer = None,
+			fBatchLeaves:bool = False, stats:SearchStats = None):
+	"""Returns the best move and estimated score for the game state after lookahead moves.
+	   Pass a TranspositionTable (sized with cEntryMax) to remember positions across move orders;
+	   it can be kept between calls, and its counters report hits, misses and stores.
+	   orderer defaults to a new MoveOrderer with every heuristic on.
+	   fBatchLeaves scores the frontier with ScoreEstimateChildren (see SearchContext).
+	   Pass a SearchStats to get the search's counts in it"""
+
+	if tt != None:
+		tt.NewSearch()
+
+	ctx = SearchContext(tt, orderer=orderer if orderer != None else MoveOrderer(), fBatchLeaves=fBatchLeaves, stats=stats)
+	return MinimaxRecursive(gs, fMax, lookahead, -sys.float_info.max, sys.float_info.max, ctx)
+
+
+def SearchTimed(gs:AbstractGameState, fMax:bool, msBudget:Optional[float], tt:TranspositionTable = None, lookaheadMax:int = 64,
+				orderer:MoveOrderer = None, fBatchLeaves:bool = False, eventCancel = None,
+				fnIteration:Callable[[int, Any, float, int], None] = None, stats:SearchStats = None):
+	"""Iterative deepening: searches lookahead 1, 2, ... until msBudget runs out, trying each
+	   iteration's best move first in the next. Returns the best move and score from the deepest
+	   completed iteration, plus a SearchInfo. Lookahead 1 always completes, even over budget.
+	   msBudget None searches until lookaheadMax. Setting eventCancel (a threading.Event) from another
+	   thread stops the search at once, even in lookahead 1. fnIteration(depth, move, score, cNode)
+	   is called after each completed iteration, e.g. to show progress. Pass a SearchStats to get the
+	   search's counts in it, and in SearchInfo.stats"""
+
+	timeStart = time.perf_counter()
+	ctx = SearchContext(tt, orderer=orderer if orderer != None else MoveOrderer(), fBatchLeaves=fBatchLeaves, eventCancel=eventCancel,
+						stats=stats)
+	moveBest,scoreBest = None,None
+	depth = 0
+
+	if tt != None:
+		tt.NewSearch()
+
+	for lookahead in range(1, lookaheadMax + 1):
+		if stats != None:
+			stats.StartIteration()
+		try:
+			move,score = MinimaxRecursive(gs, fMax, lookahead, -sys.float_info.max, sys.float_info.max, ctx)
+		except SearchTimeout:
+			break
+		if stats != None:
+			stats.EndIteration()
+
+		moveBest,scoreBest = move,score
+		depth = lookahead
+		if fnIteration != None:
+			fnIteration(depth, moveBest, scoreBest, ctx.cNode)
+
+		if moveBest == None: # no moves; deeper won't help
+			break
+
+		ctx.moveRoot = moveBest
+		if msBudget != None:
+			ctx.timeEnd = timeStart + msBudget / 1000
+
+	return moveBest,scoreBest,SearchInfo(depth, ctx.cNode, time.perf_counter() - timeStart, ctx.stats)
+
+
+# Principal variation search: negamax over integer scores. ScoreEstimate values are scaled by
+#  s_scorePvsScale and rounded, so a null window is (alpha, alpha + 1). Finished games (ScoreFinal, or no
+#  moves) score beyond s_scorePvsWin: by margin first, then by ply, so a bigger win beats a smaller one
+#  and among equal wins the sooner one is preferred (and the later loss).
+
+s_scorePvsScale = 1024 # PVS units per ScoreEstimate unit
+s_scorePvsWin = 1 << 48 # at least this for a finished game won by the side to play, at most -this for one lost
+s_scorePvsInf = 1 << 62 # beyond every score; the full window
+s_cPlyPvsMax = 1 << 10 # plies a finished game's score can count down by without reaching a smaller margin
+
+def ScorePvs(score:float) -> int:
+	"""ScoreEstimate value in PVS units, kept short of the finished-game range"""
+	return max(-s_scorePvsWin + 1, min(s_scorePvsWin - 1, round(score * s_scorePvsScale)))
+
+def ScorePvsFinal(score:float, ply:int) -> int:
+	"""Finished game's score (ScoreFinal or ScoreEstimateNoMoves) ply moves from the root, in PVS units"""
+
+	margin = round(abs(score) * s_scorePvsScale)
+	if margin == 0:
+		return 0
+	scorePvs = s_scorePvsWin + margin * s_cPlyPvsMax - min(ply, s_cPlyPvsMax - 1)
+	return scorePvs if score > 0 else -scorePvs
+
+def ScoreFromPvs(scorePvs:int) -> float:
+	"""PVS score back in ScoreEstimate units; a finished game gives its ScoreFinal value, whatever its ply"""
+
+	if abs(scorePvs) < s_scorePvsWin:
+		return scorePvs / s_scorePvsScale
+	margin = (abs(scorePvs) - s_scorePvsWin + s_cPlyPvsMax - 1) // s_cPlyPvsMax
+	return margin / s_scorePvsScale if scorePvs > 0 else -margin / s_scorePvsScale
+
+def ScorePvsToTT(scorePvs:int, ply:int) -> int:
+	"""Finished-game scores are stored counted from the node rather than the root, so they're right at any ply"""
+
+	if scorePvs >= s_scorePvsWin:
+		return scorePvs + ply
+	if scorePvs <= -s_scorePvsWin:
+		return scorePvs - ply
+	return scorePvs
+
+def ScorePvsFromTT(scorePvs:int, ply:int) -> int:
+	if scorePvs >= s_scorePvsWin:
+		return scorePvs - ply
+	if scorePvs <= -s_scorePvsWin:
+		return scorePvs + ply
+	return scorePvs
+
+
+def PVSRecursive(gs:AbstractGameState, lookahead:int, alpha:int, beta:int, color:int, ctx:SearchContext, ply:int = 0) -> Tuple[Any, int]:
+	"""Negamax principal variation search. Returns the best move and its score in PVS units for the side to
+	   play, color 1 if it's the maximizing side and -1 if not. The first move is searched with the full
+	   window; the rest with a null window just above alpha, and again with the full window only if they beat it.
+	   Transposition table entries are in PVS units, so don't share a table with MinimaxRecursive"""
+
+	ctx.cNode += 1
+	if ctx.timeEnd != None and time.perf_counter() > ctx.timeEnd:
+		raise SearchTimeout()
+	if ctx.eventCancel != None and ctx.eventCancel.is_set():
+		raise SearchTimeout()
+
+	stats = ctx.stats
+	fTiming = False
+	if stats != None:
+		stats.mpPlyCNode[ply] += 1
+		if stats.fnNode != None:
+			stats.fnNode(gs, ply, lookahead, alpha, beta)
+		fTiming = stats.fTiming
+
+	scoreFinal = gs.ScoreFinal()
+	if scoreFinal != None:
+		if stats != None:
+			stats.cLeaf += 1
+		return None, color * ScorePvsFinal(scoreFinal, ply)
+
+	if lookahead == 0:
+		if stats != None:
+			stats.cLeaf += 1
+		if fTiming:
+			timeStart = time.perf_counter()
+			score = gs.ScoreEstimate()
+			stats.secScore += time.perf_counter() - timeStart
+			return None, color * ScorePvs(score)
+		return None, color * ScorePvs(gs.ScoreEstimate())
+
+	# Check transposition table, as in MinimaxRecursive; scores are for the side to play, which Key includes
+
+	tt = ctx.tt
+	key,iSym = gs.KeyCanonical() if tt != None else (None, 0)
+	moveTT = None
+	if key != None:
+		entry = tt.Lookup(key)
+		if entry != None:
+			_, depth, score, bound, moveTT, _ = entry
+			if moveTT != None:
+				moveTT = gs.MoveSym(moveTT, iSym, fInverse=True)
+			if depth >= lookahead and ply > 0:
+				score = ScorePvsFromTT(score, ply)
+				if bound == Bound.Exact:
+					return moveTT,score
+				elif bound == Bound.Lower:
+					alpha = max(alpha, score)
+				else:
+					beta = min(beta, score)
+				if alpha >= beta:
+					return moveTT,score
+
+	moveFirst = ctx.moveRoot if ply == 0 and ctx.moveRoot != None else moveTT
+
+	orderer = ctx.orderer
+	if fTiming:
+		timeStart = time.perf_counter()
+	moves = orderer.OrderLazy(gs, ply, moveFirst) if orderer != None else MovesFirst(gs, moveFirst)
+	if fTiming:
+		moves = list(moves)
+		stats.secMoves += time.perf_counter() - timeStart
+
+	alphaOrig = alpha
+	scoreBest = -s_scorePvsInf
+	moveBest = None
+	fCutoff = False
+
+	for iMove,move in enumerate(moves):
+		if fTiming:
+			timeStart = time.perf_counter()
+			gsNext = gs.DoMove(move)
+			stats.secDoMove += time.perf_counter() - timeStart
+		else:
+			gsNext = gs.DoMove(move)
+
+		try:
+			if iMove == 0:
+				score = -PVSRecursive(gsNext, lookahead - 1, -beta, -alpha, -color, ctx, ply + 1)[1]
+			else:
+				score = -PVSRecursive(gsNext, lookahead - 1, -alpha - 1, -alpha, -color, ctx, ply + 1)[1]
+				if alpha < score < beta:
+					if stats != None:
+						stats.cResearch += 1
+					score = -PVSRecursive(gsNext, lookahead - 1, -beta, -score, -color, ctx, ply + 1)[1]
+		finally:
+			if gs.fInPlace:
+				gs.UndoMove(move)
+
+		if score > scoreBest:
+			scoreBest = score
+			moveBest = move
+
+		alpha = max(alpha, score)
+		if alpha >= beta:
+			fCutoff = True
+			break
+
+	if fCutoff and stats != None:
+		stats.mpICutoffC[iMove] += 1
+	if orderer != None:
+		if fCutoff:
+			orderer.Cutoff(gs, move, ply, lookahead, iMove)
+		elif moveBest != None:
+			orderer.NoCutoff()
+
+	if moveBest == None: # no possible moves; the game's over
+		scoreBest = color * ScorePvsFinal(gs.ScoreEstimateNoMoves(), ply)
+
+	if key != None:
+		if moveBest == None:
+			bound = Bound.Exact
+		elif scoreBest <= alphaOrig:
+			bound = Bound.Upper
+		elif scoreBest >= beta:
+			bound = Bound.Lower
+		else:
+			bound = Bound.Exact
+		tt.Store(key, lookahead, ScorePvsToTT(scoreBest, ply), bound, None if moveBest == None else gs.MoveSym(moveBest, iSym))
+
 	return moveBest,scoreBest
 
 
-def Minimax(gs:AbstractGameState, fMax:bool, lookahead:int = 4):
-	"""Returns the best move and estimated score for the game state after lookahead moves"""
+def PVS(gs:AbstractGameState, fMax:bool, lookahead:int = 4, tt:TranspositionTable = None, orderer:MoveOrderer = None,
+		stats:SearchStats = None):
+	"""Same as Minimax, but searched with PVSRecursive. The score is in ScoreEstimate units, higher better for
+	   the maximizing side, and matches Minimax's to within rounding to PVS units"""
+
+	if tt != None:
+		tt.NewSearch()
+
+	color = 1 if fMax else -1
+	ctx = SearchContext(tt, orderer=orderer if orderer != None else MoveOrderer(), stats=stats)
+	move,scorePvs = PVSRecursive(gs, lookahead, -s_scorePvsInf, s_scorePvsInf, color, ctx)
+	return move,ScoreFromPvs(color * scorePvs)
+
+
+def SearchTimedPVS(gs:AbstractGameState, fMax:bool, msBudget:Optional[float], tt:TranspositionTable = None, lookaheadMax:int = 64,
+				   orderer:MoveOrderer = None, eventCancel = None, fnIteration:Callable[[int, Any, float, int], None] = None,
+				   stats:SearchStats = None, scoreAspiration:Optional[float] = 2.0):
+	"""SearchTimed with PVSRecursive. Each iteration after the first searches a window of scoreAspiration
+	   (in ScoreEstimate units) either side of the previous iteration's score; if the score falls outside it,
+	   that side of the window is widened fourfold (or opened fully for a finished game) and the root
+	   searched again. scoreAspiration None always searches the full window. Arguments and results are
+	   as for SearchTimed"""
+
+	timeStart = time.perf_counter()
+	ctx = SearchContext(tt, orderer=orderer if orderer != None else MoveOrderer(), eventCancel=eventCancel, stats=stats)
+	color = 1 if fMax else -1
+	moveBest,scorePvsBest = None,None
+	depth = 0
+
+	if tt != None:
+		tt.NewSearch()
+
+	for lookahead in range(1, lookaheadMax + 1):
+		if scoreAspiration == None or scorePvsBest == None or abs(scorePvsBest) >= s_scorePvsWin:
+			dScore = s_scorePvsInf
+			alpha,beta = -s_scorePvsInf,s_scorePvsInf
+		else:
+			dScore = max(1, round(scoreAspiration * s_scorePvsScale))
+			alpha,beta = scorePvsBest - dScore,scorePvsBest + dScore
+
+		if stats != None:
+			stats.StartIteration()
+		try:
+			while True:
+				move,scorePvs = PVSRecursive(gs, lookahead, alpha, beta, color, ctx)
+				if scorePvs <= alpha and alpha > -s_scorePvsInf:
+					dScore *= 4
+					alpha = -s_scorePvsInf if scorePvs <= -s_scorePvsWin or dScore >= s_scorePvsWin else scorePvs - dScore
+				elif scorePvs >= beta and beta < s_scorePvsInf:
+					dScore *= 4
+					beta = s_scorePvsInf if scorePvs >= s_scorePvsWin or dScore >= s_scorePvsWin else scorePvs + dScore
+				else:
+					break
+				if stats != None:
+					stats.cAspirationFail += 1
+		except SearchTimeout:
+			break
+		if stats != None:
+			stats.EndIteration()
+
+		moveBest,scorePvsBest = move,scorePvs
+		depth = lookahead
+		if fnIteration != None:
+			fnIteration(depth, moveBest, ScoreFromPvs(color * scorePvsBest), ctx.cNode)
+
+		if moveBest == None: # no moves; deeper won't help
+			break
+
+		ctx.moveRoot = moveBest
+		if msBudget != None:
+			ctx.timeEnd = timeStart + msBudget / 1000
+
+	scoreBest = None if scorePvsBest == None else ScoreFromPvs(color * scorePvsBest)
+	return moveBest,scoreBest,SearchInfo(depth, ctx.cNode, time.perf_counter() - timeStart, ctx.stats)
+
+
+# Worker process state for ParallelSearch, set up by _InitWorker
+
+s_valueBound = None # multiprocessing.Value shared by all workers: best root score found so far
+s_searchWorker = None # (iSearch, snapshot, gs, tt, orderer) for the search this worker last helped with
+
+def _InitWorker(valueBound):
+	global s_valueBound
+	s_valueBound = valueBound
+
+def _SearchRootMove(clsState:type, iSearch:int, snapshot:Hashable, movePacked:Hashable, fMax:bool, lookahead:int, fStats:bool):
+	"""Worker side of ParallelSearch: search one root move with the shared bound as window. Returns its
+	   SearchStats if fStats, else None"""
+
+	global s_searchWorker
+
+	if s_searchWorker == None or s_searchWorker[0] != iSearch:
+		tt = s_searchWorker[3] if s_searchWorker != None else TranspositionTable()
+		tt.NewSearch()
+		gsRoot = clsState.FromSnapshot(snapshot)
+		s_searchWorker = (iSearch, snapshot, gsRoot, tt, MoveOrderer())
+	_, _, gsRoot, tt, orderer = s_searchWorker
+
+	# In-place states are restored after each move, so the cached root can be reused;
+	#  others are never modified
+	move = gsRoot.UnpackMove(movePacked)
+	gsNext = gsRoot.DoMove(move)
+
+	bound = s_valueBound.value
+	alpha,beta = (bound, sys.float_info.max) if fMax else (-sys.float_info.max, bound)
+
+	ctx = SearchContext(tt, orderer=orderer, stats=SearchStats() if fStats else None)
+	try:
+		_, score = MinimaxRecursive(gsNext, not fMax, lookahead - 1, alpha, beta, ctx, 1)
+	finally:
+		if gsRoot.fInPlace:
+			gsRoot.UndoMove(move)
+
+	with s_valueBound.get_lock():
+		if (score > s_valueBound.value) if fMax else (score < s_valueBound.value):
+			s_valueBound.value = score
+
+	return movePacked, score, ctx.cNode, ctx.stats
+
+
+class ParallelSearch:
+	"""Minimax that splits the root moves across a process pool. The first root move is searched
+	   here to get a bound (young brothers wait), then the rest go to workers, which share the best
+	   score so far as their alpha (or beta) through shared memory. Positions go to workers as
+	   AbstractGameState.Snapshot() tuples.
+
+	   Starting workers is slow, so keep one of these around between searches (or use with "with")"""
+
+	def __init__(self, cWorker:int = None):
+		self.cWorker = cWorker if cWorker != None else multiprocessing.cpu_count()
+		self.valueBound = multiprocessing.Value('d', 0.0)
+		self.executor = ProcessPoolExecutor(self.cWorker, initializer=_InitWorker, initargs=(self.valueBound,))
+		self.iSearch = 0
+		self.cNode = 0 # for last search, over all processes
+		self.stats:SearchStats = None # likewise, if Search was given one
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.Close()
+
+	def Close(self):
+		self.executor.shutdown()
+
+	def Search(self:ParallelSearch, gs:AbstractGameState, fMax:bool, lookahead:int = 4, stats:SearchStats = None):
+		"""Returns the best move and score, like Minimax. Pass a SearchStats to get the counts of
+		   every process in it"""
+
+		self.iSearch += 1
+		self.stats = stats
+
+		moves = MoveOrderer().Order(gs, 0, None)
+		if not moves:
+			return None, gs.ScoreEstimateNoMoves()
+		if lookahead <= 1 or len(moves) == 1:
+			ctx = SearchContext(orderer=MoveOrderer(), stats=stats)
+			move,score = MinimaxRecursive(gs, fMax, lookahead, -sys.float_info.max, sys.float_info.max, ctx)
+			self.cNode = ctx.cNode
+			return move,score
+
+		# Eldest brother first, here
+
+		moveBest = moves[0]
+		ctx = SearchContext(TranspositionTable(), orderer=MoveOrderer(), stats=stats)
+		gsNext = gs.DoMove(moveBest)
+		try:
+			_, scoreBest = MinimaxRecursive(gsNext, not fMax, lookahead - 1, -sys.float_info.max, sys.float_info.max, ctx, 1)
+		finally:
+			if gs.fInPlace:
+				gs.UndoMove(moveBest)
+		self.cNode = ctx.cNode
+		if stats != None:
+			stats.mpPlyCNode[0] += 1 # the root, which was handled here rather than by MinimaxRecursive
+
+		self.valueBound.value = scoreBest
+
+		# Then the rest in parallel. Results that fail low come back <= the bound, so only a
+		#  strictly better score can replace the best move
+
+		snapshot = gs.Snapshot()
+		mpPackedMove = {gs.PackMove(move):move for move in moves[1:]}
+		futures = [self.executor.submit(_SearchRootMove, type(gs), self.iSearch, snapshot, movePacked, fMax, lookahead, stats != None)
+				   for movePacked in mpPackedMove]
+
+		for future in as_completed(futures):
+			movePacked,score,cNode,statsWorker = future.result()
+			self.cNode += cNode
+			if stats != None:
+				stats.Merge(statsWorker)
+			if (score > scoreBest) if fMax else (score < scoreBest):
+				moveBest,scoreBest = mpPackedMove[movePacked],score
+
+		return moveBest,scoreBest
+
+
+def MinimaxParallel(gs:AbstractGameState, fMax:bool, lookahead:int = 4, cWorker:int = None):
+	"""One-off ParallelSearch; returns the best move and score, like Minimax"""
 
-	return MinimaxRecursive(gs, fMax, lookahead, -sys.float_info.max, sys.float_info.max)
\ No newline at end of file
+	with ParallelSearch(cWorker) as search:
+		return search.Search(gs, fMax, lookahead)
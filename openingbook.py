@@ -0,0 +1,201 @@
+"""Opening book: best moves for early positions, found offline by deep search and looked up before searching
+
+	python openingbook.py --layout bl_Standard --plies 3 --width 4 --ms 10000
+	python openingbook.py --layout bl_5x5_3v3 --plies 4 --lookahead 3
+
+The builder searches the start position, then the `width` most promising moves from each book position
+(always including the best), down to `plies` moves deep. Both colors are covered, so the book helps
+whichever side the engine plays. Rerunning with more plies or width reuses positions already in the book.
+
+Books are files under books/, named for the layout. Each holds a fingerprint of its Board, so a book
+is never used with a different layout or Zobrist table. The file is three sorted columns: 64-bit
+position keys, packed moves (Move.Pack) and scores. Lookup is a binary search on the keys.
+
+Positions that are images of each other under a symmetry of the board share one entry, under
+GameState.KeyCanonical; its move is stored for the canonical image and mapped back on lookup.
+"""
+
+from __future__ import annotations
+
+import argparse
+import array
+import bisect
+import hashlib
+import os
+import struct
+import sys
+import time
+from typing import *
+
+from engine import *
+from minimax import *
+
+
+class OpeningBook:
+	"""Position key -> (best move, score) for one Board"""
+
+	s_magic = b"RBK2" # 2: canonical keys
+	s_structHeader = struct.Struct("<4sQI") # magic, fingerprint, count
+
+	def __init__(self:OpeningBook, fingerprint:int, aEntry:Iterable[Tuple[int,int,float]] = ()):
+		aEntry = sorted(aEntry)
+		self.fingerprint = fingerprint
+		self.keys = array.array("Q", (key for key,_,_ in aEntry))
+		self.movesPacked = array.array("I", (movePacked for _,movePacked,_ in aEntry))
+		self.scores = array.array("d", (score for _,_,score in aEntry))
+
+	def __len__(self):
+		return len(self.keys)
+
+	@staticmethod
+	def Fingerprint(board:Board) -> int:
+		"""Identifies the layout and the Zobrist keys it was built with"""
+
+		digest = hashlib.blake2b(repr((board.boardlayout.Pack(), GameState(board).Key())).encode(), digest_size=8).digest()
+		return int.from_bytes(digest, "little")
+
+	@staticmethod
+	def PathDefault(board:Board) -> str:
+		"""books/<layout name>.book next to this module"""
+
+		layoutPacked = board.boardlayout.Pack()
+		aName = [name for name,layout in MpNameLayout().items() if layout.Pack() == layoutPacked]
+		name = aName[0] if aName else f"{OpeningBook.Fingerprint(board):016x}"
+		return os.path.join(os.path.dirname(os.path.abspath(__file__)), "books", f"{name}.book")
+
+	@staticmethod
+	def Load(path:str, board:Board) -> OpeningBook:
+		"""Reads a book, raising ValueError if it isn't one or was built for another Board"""
+
+		with open(path, "rb") as file:
+			data = file.read()
+
+		cbHeader = OpeningBook.s_structHeader.size
+		if len(data) < cbHeader:
+			raise ValueError(f"{path}: not an opening book")
+		magic,fingerprint,cEntry = OpeningBook.s_structHeader.unpack_from(data)
+		if magic != OpeningBook.s_magic or len(data) != cbHeader + cEntry * (8 + 4 + 8):
+			raise ValueError(f"{path}: not an opening book")
+		if fingerprint != OpeningBook.Fingerprint(board):
+			raise ValueError(f"{path}: built for a different board")
+
+		book = OpeningBook(fingerprint)
+		ib = cbHeader
+		for column,cb in ((book.keys, 8), (book.movesPacked, 4), (book.scores, 8)):
+			column.frombytes(data[ib:ib + cEntry * cb])
+			if sys.byteorder != "little":
+				column.byteswap()
+			ib += cEntry * cb
+		return book
+
+	@staticmethod
+	def LoadDefault(board:Board) -> Optional[OpeningBook]:
+		"""Book at PathDefault, or None if there isn't one"""
+
+		path = OpeningBook.PathDefault(board)
+		if not os.path.exists(path):
+			return None
+		return OpeningBook.Load(path, board)
+
+	def Save(self:OpeningBook, path:str):
+		os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+		with open(path + ".tmp", "wb") as file:
+			file.write(OpeningBook.s_structHeader.pack(OpeningBook.s_magic, self.fingerprint, len(self)))
+			for column in (self.keys, self.movesPacked, self.scores):
+				if sys.byteorder != "little":
+					column = array.array(column.typecode, column)
+					column.byteswap()
+				file.write(column.tobytes())
+		os.replace(path + ".tmp", path) # never leave a half-written book
+
+	def Entries(self:OpeningBook) -> Iterator[Tuple[int,int,float]]:
+		return zip(self.keys, self.movesPacked, self.scores)
+
+	def Lookup(self:OpeningBook, gs:AbstractGameState) -> Optional[Tuple[Move, float]]:
+		"""Best move and its score for gs, or None if gs isn't in the book"""
+
+		key,iSym = gs.KeyCanonical()
+		i = bisect.bisect_left(self.keys, key)
+		if i == len(self.keys) or self.keys[i] != key:
+			return None
+		return gs.MoveSym(Move.Unpack(self.movesPacked[i]), iSym, fInverse=True), self.scores[i]
+
+
+def AMoveCandidates(gs:GameState, cMove:int) -> List[Move]:
+	"""The cMove moves whose resulting positions score best for the side to play"""
+
+	bb = BitboardGameState(gs=gs)
+	fMax = gs.sideToPlay == Side.Red
+	aScoreMove = []
+	for move in list(bb.Moves()):
+		bb.DoMove(move)
+		aScoreMove.append((bb.ScoreEstimate(), move.Pack()))
+		bb.UndoMove(move)
+	aScoreMove.sort(key=lambda scoreMove: -scoreMove[0] if fMax else scoreMove[0])
+	return [Move.Unpack(movePacked) for _,movePacked in aScoreMove[:cMove]]
+
+def Build(board:Board, cPly:int, cWidth:int, msBudget:int = None, lookahead:int = 3, book:OpeningBook = None,
+		  fnSave:Callable[[OpeningBook], None] = None) -> OpeningBook:
+	"""Book for positions up to cPly - 1 moves from the start, branching cWidth ways at each.
+	   Positions already in book aren't searched again. fnSave is called after each ply with the book so far"""
+
+	fingerprint = OpeningBook.Fingerprint(board)
+	mpKeyEntry = {key:(movePacked, score) for key,movePacked,score in book.Entries()} if book != None else {}
+	tt = TranspositionTable()
+
+	aGs = [GameState(board)]
+	for ply in range(cPly):
+		aGsNext = {}
+		for iGs,gs in enumerate(aGs):
+			if gs.sideToPlay == None:
+				continue
+
+			key,iSym = gs.KeyCanonical()
+			if key not in mpKeyEntry:
+				timeStart = time.perf_counter()
+				fMax = gs.sideToPlay == Side.Red
+				if msBudget != None:
+					move,score,info = SearchTimed(BitboardGameState(gs=gs), fMax, msBudget, tt=tt)
+				else:
+					move,score = Minimax(BitboardGameState(gs=gs), fMax, lookahead, tt=tt)
+				if move == None:
+					continue
+				mpKeyEntry[key] = (gs.MoveSym(move, iSym).Pack(), score)
+				print(f"ply {ply} position {iGs + 1}/{len(aGs)}: {move}, {score:.3f} ({time.perf_counter() - timeStart:.1f}s)", flush=True)
+
+			if ply + 1 < cPly:
+				moveBest = gs.MoveSym(Move.Unpack(mpKeyEntry[key][0]), iSym, fInverse=True)
+				aMove = [moveBest] + [move for move in AMoveCandidates(gs, cWidth) if move != moveBest][:cWidth - 1]
+				for move in aMove:
+					gsNext = gs.DoMove(move)
+					aGsNext[gsNext.KeyCanonical()[0]] = gsNext # transpositions and symmetric positions are searched once
+
+		if fnSave != None:
+			fnSave(OpeningBook(fingerprint, ((key, movePacked, score) for key,(movePacked,score) in mpKeyEntry.items())))
+		aGs = list(aGsNext.values())
+
+	return OpeningBook(fingerprint, ((key, movePacked, score) for key,(movePacked,score) in mpKeyEntry.items()))
+
+
+def Main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--layout", default="bl_Standard", choices=list(MpNameLayout()))
+	parser.add_argument("--plies", type=int, default=3, help="book covers positions up to this many moves from the start, minus one")
+	parser.add_argument("--width", type=int, default=4, help="moves followed from each book position")
+	parser.add_argument("--ms", type=int, default=None, help="search time per position; default is a fixed --lookahead")
+	parser.add_argument("--lookahead", type=int, default=3)
+	parser.add_argument("--out", default=None, help="book file (default books/<layout>.book)")
+	parser.add_argument("--fresh", action="store_true", help="ignore positions already in the book")
+	args = parser.parse_args()
+
+	board = Board(MpNameLayout()[args.layout])
+	path = args.out if args.out != None else OpeningBook.PathDefault(board)
+	book = OpeningBook.Load(path, board) if os.path.exists(path) and not args.fresh else None
+
+	timeStart = time.perf_counter()
+	book = Build(board, args.plies, args.width, args.ms, args.lookahead, book, fnSave=lambda book: book.Save(path))
+	print(f"{len(book)} positions in {path} ({time.perf_counter() - timeStart:.1f}s)")
+
+
+if __name__ == "__main__":
+	Main()
@@ -7,373 +7,21 @@ import tkinter.filedialog
 import tkinter.messagebox
 from tkinter import scrolledtext 
 from time import *
-from collections import defaultdict
 import bisect
 from typing import *
 import pyclip
 import math
 import copy
+import queue
+import threading
+import traceback
 
-from enum import Enum,IntEnum
+from engine import *
+from gamerecord import GameRecord
+from openingbook import OpeningBook, AMoveCandidates
+from endgame import EndgameSolver
+from mcts import MCTS
 
-from minimax import *
-
-
-
-class KeyDependentDefaultDict(defaultdict):
-	"""Like DefaultDict, but default_factory takes key as argument"""
-
-	def __missing__(self, key):
-		if self.default_factory is None:
-			raise KeyError(key)
-		else:
-			# BB Do I really want to put new one in dict?
-			#  Is this how a regular defaultdict behaves?
-
-			ret = self[key] = self.default_factory(key)
-			return ret
-		
-def Lerp(a:float, b:float, alpha:float):
-	return (1-alpha) * a + alpha * b
-
-
-
-class Dir(IntEnum):
-	NW = 0
-	NE = 1
-	E = 2
-	SE = 3
-	SW = 4
-	W = 5
-
-
-class Hex:
-	s_mpDirDxDy = [(0,1), (1,1), (1,0), (0,-1), (-1,-1), (-1,0)]
-
-	def __init__(self, x, y):
-		self.x = x  # E from lower left
-		self.y = y  # NW from lower left
-
-	def __repr__(self):
-		return f"Hex{(self.x,self.y)}"
-
-	def __eq__(self, other):
-		if isinstance(other, Hex):
-			return self.x == other.x and self.y == other.y
-		return NotImplemented
-	
-	def __hash__(self):
-		return hash((self.x, self.y))
-
-
-class Side(IntEnum):
-	Red = 0
-	White = 1 # "Ivory" in official rules. Save the elephants!
-
-	def Opposite(self:Side) -> Side:
-		return Side.Red if self==Side.White else Side.White
-
-
-class Viking:
-	def __init__(self, side):
-		self.side = side
-
-
-class BoardLayout():
-	def __init__(self, rowdefs, startingPositions):
-		self.rowdefs:List[Tuple[int]] = rowdefs # for each Y, starting X, number of hexes in row
-		self.startingPositions:List[List[Tuple[int]]] = startingPositions # for each side, list of starting viking coords
-
-
-class Board:
-	def __init__(self:Board, boardlayout:BoardLayout):
-
-		self.boardlayout = boardlayout
-
-		self.mpHexI:Dict[Hex,int] = {}
-		self.hexes:List[Hex] = []
-
-		for y,(xMic,c) in enumerate(boardlayout.rowdefs):
-			for x in range(xMic, xMic + c):
-				hex = Hex(x,y)
-				self.mpHexI[hex] = len(self.hexes)
-				self.hexes.append(hex)
-
-		self.mpIHexIDirNeighbor:List[List[int]] = []
-		self.mpIHexNeighbors:List[List[int]] = []
-		for hex in self.hexes:
-			mpIDirN = []
-			ns = []
-			for dir in Dir:
-				dX,dY = Hex.s_mpDirDxDy[dir]
-				hexOther = Hex(hex.x + dX, hex.y + dY)
-				if hexOther in self.mpHexI:
-					iHexOther = self.mpHexI[hexOther]
-					ns.append(iHexOther)
-					mpIDirN.append(iHexOther)
-				else:
-					mpIDirN.append(None)
-
-			self.mpIHexNeighbors.append(ns)
-			self.mpIHexIDirNeighbor.append(mpIDirN)
-
-	def Hexes(self) -> List[Hex]:
-		return self.hexes
-
-	def Hex(self, iHex:int) -> Hex:
-		return self.hexes[iHex]
-	
-	def IHex(self, hex:Hex) -> int:
-		return self.mpHexI[hex]
-
-	def Neighbor(self, iHex:int, dir:Dir):
-		return self.mpIHexIDirNeighbor[iHex][dir]
-
-	def Neighbors(self, iHex:int):
-		return self.mpIHexNeighbors[iHex]
-
-
-class Move:
-	def __init__(self, vik, iHexFrom, iHexTo, iHexStone):
-		self.vik = vik
-		self.iHexFrom = iHexFrom
-		self.iHexTo = iHexTo
-		self.iHexStone = iHexStone
-
-
-class RegionType(IntEnum):
-	Contested = 0
-	Wild = 1
-	SettledRed = 2
-	SettledWhite = 3
-	Stone = 4
-
-class Region():
-	def __init__(self):
-		self.type = RegionType.Contested
-		self.aiHex = []
-		self.mpSideCVik = [0,0]
-
-
-class GameState(AbstractGameState):
-
-	def __init__(self:GameState, board:Board = None, gsPrev:GameState = None, move:Move = None):
-
-		self.regions: List[Region] = []
-	
-		if board != None:
-			# Set up initial board state
-
-			assert(gsPrev == None)
-			assert(move == None)
-
-			self.board = board
-
-			self.mpIHexVik: Dict[int, Viking] = {}
-
-			for side in Side:
-				for x,y in board.boardlayout.startingPositions[side]:
-					self.mpIHexVik[board.IHex(Hex(x,y))] = Viking(side)
-
-			self.mpIHexType: List[int, RegionType] = [RegionType.Contested] * len(board.Hexes())
-
-			self.sideToPlay:Side = Side.Red # Make this a parameter? Or like chess, red always starts
-
-		elif gsPrev:
-			# Set up from previous board state + move
-
-			assert(move != None)
-
-			assert(move.vik.side == gsPrev.sideToPlay)
-
-			# Copy state
-			# BB better to alter, then undo?
-			self.board = gsPrev.board
-			self.mpIHexVik = copy.copy(gsPrev.mpIHexVik)
-			self.mpIHexType = copy.copy(gsPrev.mpIHexType)
-
-			# Keep uncontested regions from prev; AssignRegions only updates contested ones
-			self.regions = list(filter(lambda region: region.type != RegionType.Contested, gsPrev.regions))
-
-			# Move viking
-			assert(self.mpIHexVik[move.iHexFrom] == move.vik)
-			del(self.mpIHexVik[move.iHexFrom])
-			self.mpIHexVik[move.iHexTo] = move.vik
-
-			# Place stone
-			self.mpIHexType[move.iHexStone] = RegionType.Stone
-
-			# Alternate sides
-			self.sideToPlay = gsPrev.sideToPlay.Opposite()
-
-		# Update regions and score
-		self.AssignRegions()
-	
-	@staticmethod
-	def IHexRoot(mpIHexIHexParent:DefaultDict[int, int], iHex:int) -> int:
-		iHexParent = mpIHexIHexParent[iHex]
-		if iHexParent != iHex:
-			iHexParent = GameState.IHexRoot(mpIHexIHexParent, iHexParent)
-			mpIHexIHexParent[iHex] = iHexParent
-		return iHexParent
-
-	def AssignRegions(self:GameState):
-		"""Update mpIHexType and regions based on connected regions"""
-
-		# Build connectivity graph
-
-		mpIHexIHexParent:DefaultDict[int, int] = KeyDependentDefaultDict(lambda iHex : iHex)
-		for iHex in range(len(self.board.Hexes())):
-			if self.mpIHexType[iHex] != RegionType.Contested:
-				continue
-
-			iHexRoot = GameState.IHexRoot(mpIHexIHexParent, iHex)
-		
-			for iHexOther in self.board.Neighbors(iHex):
-				if self.mpIHexType[iHexOther] != RegionType.Contested:
-					assert(self.mpIHexType[iHexOther] == RegionType.Stone)
-					continue
-				iHexRootOther = GameState.IHexRoot(mpIHexIHexParent, iHexOther)
-				mpIHexIHexParent[iHexRootOther] = iHexRoot
-
-		mpIHexRootRegion:DefaultDict[int,Region] = defaultdict(lambda : Region())
-
-		for iHex,type in enumerate(self.mpIHexType):
-			if type != RegionType.Contested:
-				continue
-			iHexRoot = GameState.IHexRoot(mpIHexIHexParent, iHex)
-
-			region = mpIHexRootRegion[iHexRoot]
-			region.aiHex.append(iHex)
-			
-			if iHex in self.mpIHexVik:
-				vik = self.mpIHexVik[iHex]
-				region.mpSideCVik[vik.side] += 1
-
-		for region in mpIHexRootRegion.values():
-
-			typeNew = None
-
-			if region.mpSideCVik[Side.Red] == 0:
-				if region.mpSideCVik[Side.White] == 0:
-					region.type = RegionType.Wild
-				else:
-					region.type = RegionType.SettledWhite
-			else:
-				if region.mpSideCVik[Side.White] == 0:
-					region.type = RegionType.SettledRed
-				else:
-					assert(region.type == RegionType.Contested)
-			
-			if region.type != RegionType.Contested:
-				for iHex in region.aiHex:
-					self.mpIHexType[iHex] = region.type
-
-			self.regions.append(region)
-
-		self.mpTypeCHex = [0,0,0,0,0]
-		
-		for region in self.regions:
-			self.mpTypeCHex[region.type] += len(region.aiHex)
-
-		if self.mpTypeCHex[RegionType.Contested] == 0:
-			self.sideToPlay = None # done
-
-	def DoMove(self:GameState, move:Move) -> GameState:
-		"""Returns a new game state which is result of making the given move"""
-
-		return GameState(gsPrev=self, move=move)
-	
-	def HexesVisibleFrom(self:GameState, iHex:int, vikIgnore:Viking=None) -> Iterator[Hex]:
-		"""Yields all hexes visible from the given hex"""
-
-		for dir in Dir:
-			iHexNew = self.board.Neighbor(iHex, dir)
-			while iHexNew != None: # off edge
-				if self.mpIHexType[iHexNew] == RegionType.Stone:
-					break
-				if iHexNew in self.mpIHexVik:
-					vik = self.mpIHexVik[iHexNew]
-					if vik != vikIgnore:
-						break
-				yield iHexNew
-				iHexNew = self.board.Neighbor(iHexNew, dir)
-
-	def Moves(self:GameState) -> Iterator[Move]:
-		"""Yields all legal moves from current state"""
-
-		# BB alpha-beta minimax works faster if better moves are yielded first
-		#  My instinct is that moving further is usually better -- sort
-
-		for iHexFrom,vik in self.mpIHexVik.items():
-			# BB consider other structures for keeping track of vikings
-			if vik.side != self.sideToPlay:
-				continue
-			if self.mpIHexType[iHexFrom] != RegionType.Contested:
-				continue
-			
-			for iHexTo in self.HexesVisibleFrom(iHexFrom):
-				for iHexStone in self.HexesVisibleFrom(iHexTo, vikIgnore=vik):
-					yield Move(vik, iHexFrom, iHexTo, iHexStone)
-
-	def ScoreEstimate(self:GameState, gameOver:bool=False) -> float:
-		"""Return a heuristic value of this board position with higher scores being better for Red"""
-
-		# BB more efficient to calculate score in AssignRegions and not keep stuff around?
-
-		mpTypeCHex = [0,0,0,0,0]
-		for region in self.regions:
-			mpTypeCHex[region.type] += len(region.aiHex)
-
-		cHexRed = mpTypeCHex[RegionType.SettledRed]
-		cHexWhite = mpTypeCHex[RegionType.SettledWhite]
-
-		if gameOver or mpTypeCHex[RegionType.Contested] == 0:
-			# game is over
-			# BB This counts win as better than possible larger win,
-			#  and treats all wins as equal. Could tweak to prefer larger wins
-
-			# if cHexMine > cHexTheirs:
-			# 	return sys.float_info.max # win = best possible score
-			# elif cHexTheirs > cHexMine:
-			# 	return -sys.float_info.max # lose = worst possible score
-			# else:
-			# 	return 0 # tie
-
-			return (cHexRed - cHexWhite) * 100000
-
-		cHexMaybe = 0 # + for Red, - for White
-		for region in self.regions:
-			if region.type == RegionType.Contested:
-				# frac = region.mpSideCVik[Side.Red] / sum(region.mpSideCVik)
-
-				# check total number of open positions each side can move to
-				mpSideCHexVis = [0,0]
-				for iHex,vik in self.mpIHexVik.items():
-					# Any faster to have bespoke function?
-					mpSideCHexVis[vik.side] += sum(1 for _ in self.HexesVisibleFrom(iHex))
-
-				if sum(mpSideCHexVis) > 0: # else neither has any moves?
-					# Assign contested hexes based on fraction of open moves
-					# Should maybe make cHex smaller because each following
-					#  move will reduce total possible area by one
-					frac = mpSideCHexVis[Side.Red] / sum(mpSideCHexVis)
-					cHex = len(region.aiHex) - 1
-					cHexMaybe += Lerp(-cHex, cHex, frac)
-
-		return cHexRed - cHexWhite + cHexMaybe
-
-	def ScoreEstimateNoMoves(self:GameState) -> float:
-		return self.ScoreEstimate(gameOver=True)
-
-	def MpSideScore(self:GameState) -> List[int]:
-		mpSideScore = [0,0]
-		for region in self.regions:
-			if region.type == RegionType.SettledRed:
-				mpSideScore[Side.Red] += len(region.aiHex)
-			elif region.type == RegionType.SettledWhite:
-				mpSideScore[Side.White] += len(region.aiHex)
-		return mpSideScore
 
 
 class RagnarokWidget(Frame):
@@ -390,6 +38,30 @@ class RagnarokWidget(Frame):
 		# BB expose this as options
 		self.mpSideFComputer:List[bool] = [False, True]
 
+		# Kept across computer moves; positions repeat between searches as the game goes on
+		self.tt = TranspositionTable()
+		self.msComputerMove = 2000 # BB expose as option too
+		self.book:OpeningBook = OpeningBook.LoadDefault(gs.board) # None if no book built for this layout
+		self.solver = EndgameSolver(gs.board) # exact play once few enough hexes are contested
+		self.fMcts = False # Monte Carlo tree search instead of alpha-beta; "m" switches
+		self.mcts = MCTS() # keeps its tree between moves, like tt
+
+		# Searches run on a background thread, one at a time, so the window stays live. The thread posts
+		#  (idSearch, kind, value) to queueSearch and PollSearch picks them up on the Tk thread; anything
+		#  from a search that's since been cancelled or replaced has an old idSearch and is dropped.
+		#  While the human thinks, the thread ponders: it finds the computer's answer to the human's
+		#  likeliest moves, so if one of them is played the answer is ready at once
+
+		self.queueSearch:queue.Queue = queue.Queue()
+		self.threadSearch:threading.Thread = None
+		self.eventCancel:threading.Event = None
+		self.idSearch = 0
+		self.fPolling = False
+		self.timeSearchStart:float = None # set while searching for a computer move (not while pondering)
+		self.strProgress = ""
+		self.cMovePonder = 3 # human moves to ponder answers to
+		self.mpKeyMovePonder:Dict[int, Move] = {} # gs.Key() -> computer move found while pondering
+
 		self.canvas:Canvas = Canvas(self, width=cX, height=cY, takefocus=True, highlightthickness=0, bg='#c0c0c0')
 		self.canvas.grid(column=0, row=0, sticky=(N, W, E, S))
 
@@ -406,7 +78,7 @@ class RagnarokWidget(Frame):
 
 		self.mpVikIdOval = {}
 
-		self.move:Move = Move(None, None, None, None)
+		self.move:Move = Move(None, None, None) # move being chosen
 		self.hexesVis:List[int] = []
 
 		self.fontSize = 30
@@ -416,14 +88,30 @@ class RagnarokWidget(Frame):
 		for iHex in range(len(self.gs.board.Hexes())):
 			self.mpIHexIdPoly.append(self.CreateHex(iHex))
 
-		self.gsUndoStack:List[GameState] = []
-		self.gsRedoStack:List[GameState] = []
+		# Hover previews of where the viking will go or the stone will land; moved and shown as needed
+		self.idHoverViking:int = self.canvas.create_oval(0, 0, 0, 0, state="hidden")
+		self.idHoverStone:int = self.canvas.create_polygon(0, 0, 0, 0, width=3, outline='#000000', fill='#808080', state="hidden")
+		self.iHexHover:int = None
+
+		self.gsDrawn:GameState = None # what the canvas shows; SetGameState redraws only the differences
+		self.mpVikIHexDrawn:Dict[Viking, int] = {}
+		self.mpSideIdScore:List[int] = [None, None]
+
+		# The game so far, as moves from the start position; undo and redo move self.ply back and forth in it,
+		#  and the record rebuilds the state from a nearby checkpoint
+		self.record = GameRecord(gs.board)
+		self.ply = 0
 		self.SetGameState(gs)
 
-		self.canvas.bind("<Escape>", self.CancelMove)
+		self.canvas.bind("<Escape>", self.Cancel)
 		self.canvas.bind("<<Undo>>", self.Undo)
 		self.canvas.bind("<<Redo>>", self.Redo)
 		self.canvas.bind("c", self.ComputerMove)
+		self.canvas.bind("m", self.ToggleMcts)
+		self.canvas.bind("s", self.SaveRecord)
+		self.canvas.bind("o", self.OpenRecord)
+		self.canvas.bind("<<Copy>>", self.CopyRecord)
+		self.canvas.bind("<<Paste>>", self.PasteRecord)
 
 		self.canvas.bind("<Button-1>", self.HandleMouseDown)
 		self.canvas.bind("<Motion>", self.HandleMouseMove)
@@ -432,6 +120,8 @@ class RagnarokWidget(Frame):
 
 		self.canvas.focus_set()
 
+		self.after_idle(self.AfterMove) # in case the computer plays first
+
 	def PosCenter(self:RagnarokWidget, iHex:int):
 		hex = self.gs.board.Hex(iHex)
 		x = self.xOrigin + (hex.x + 0.5) * self.dXPerX + hex.y * self.dXPerY
@@ -445,17 +135,20 @@ class RagnarokWidget(Frame):
 				x + self.dXVikingDot / 2,
 				y + self.dXVikingDot / 2)
 
+	def XysHex(self:RagnarokWidget, iHex:int) -> List[float]:
+		hex = self.gs.board.Hex(iHex)
+		x = self.xOrigin + hex.x * self.dXPerX + hex.y * self.dXPerY
+		y = self.yOrigin + hex.y * self.dYPerY
+		return [x, y,
+				x + self.dXPerX / 2, y + self.dXSide / 2,
+				x + self.dXPerX, y,
+				x + self.dXPerX, y - self.dXSide,
+				x + self.dXPerX / 2, y - self.dXSide * 1.5,
+				x, y - self.dXSide]
+
 	def CreateHex(self:RagnarokWidget, iHex:int, fill='#FFFFFF', tags=None) -> int:
-			hex = self.gs.board.Hex(iHex)
-			x = self.xOrigin + hex.x * self.dXPerX + hex.y * self.dXPerY
-			y = self.yOrigin + hex.y * self.dYPerY
 			return self.canvas.create_polygon(
-						x, y,
-						x + self.dXPerX / 2, y + self.dXSide / 2,
-						x + self.dXPerX, y,
-						x + self.dXPerX, y - self.dXSide,
-						x + self.dXPerX / 2, y - self.dXSide * 1.5,
-						x, y - self.dXSide,
+						*self.XysHex(iHex),
 						width = 3,
 						outline='#000000',
 						fill=fill,
@@ -482,76 +175,105 @@ class RagnarokWidget(Frame):
 		self.SetHexColor(iHex, color)
 
 	def SetGameState(self, gs:GameState):
+		"""Shows gs, redrawing only what differs from the state shown before"""
+
 		assert(gs.board == self.gs.board)
+		if self.move.iHexFrom != None:
+			self.CancelMove() # partial move belongs to the old state
+		gsDrawn = self.gsDrawn
 		self.gs = gs
 
 		for iHex in range(len(self.mpIHexIdPoly)):
-			self.ResetHexColor(iHex)
+			if gsDrawn == None or gs.mpIHexType[iHex] != gsDrawn.mpIHexType[iHex]:
+				self.ResetHexColor(iHex)
 
-		self.canvas.delete("viking")
+		# Vikings keep their Viking objects from state to state, so each one's oval is just moved.
+		#  States that don't share them (e.g. from GameState.FromSnapshot) get new ovals
+
+		setVik = set(gs.mpIHexVik.values()) # by identity
+		for vik in [vik for vik in self.mpVikIHexDrawn if vik not in setVik]:
+			self.canvas.delete(self.mpVikIdOval.pop(vik))
+			del self.mpVikIHexDrawn[vik]
 
 		for iHex,vik in gs.mpIHexVik.items():
-			self.mpVikIdOval[vik] = self.canvas.create_oval(
-											self.RectViking(iHex),
-											fill=RagnarokWidget.mpSideColor[vik.side],
-											tags="viking")
-			
-		self.canvas.delete("score")
+			iHexDrawn = self.mpVikIHexDrawn.get(vik)
+			if iHexDrawn == None:
+				self.mpVikIdOval[vik] = self.canvas.create_oval(
+												self.RectViking(iHex),
+												fill=RagnarokWidget.mpSideColor[vik.side],
+												tags="viking")
+			elif iHexDrawn != iHex:
+				self.canvas.coords(self.mpVikIdOval[vik], self.RectViking(iHex))
+			self.mpVikIHexDrawn[vik] = iHex
+
 		mpSideScore = gs.MpSideScore()
 		for side in Side:
-			self.canvas.create_text(
-								(70 if side == Side.Red else 580, 400), 
-								text=f"{mpSideScore[side]}", 
-								font=self.fontValue, 
-								fill=RagnarokWidget.mpSideColor[side],
-								tags="score")
-
-	def AppendGameState(self, gs:GameState):
+			if gsDrawn == None:
+				self.mpSideIdScore[side] = self.canvas.create_text(
+												(70 if side == Side.Red else 580, 400), 
+												text=f"{mpSideScore[side]}", 
+												font=self.fontValue, 
+												fill=RagnarokWidget.mpSideColor[side],
+												tags="score")
+			elif mpSideScore[side] != gsDrawn.MpSideScore()[side]:
+				self.canvas.itemconfigure(self.mpSideIdScore[side], text=f"{mpSideScore[side]}")
+
+		self.gsDrawn = gs
+
+	def AppendMove(self, move:Move):
+		"""Plays move, dropping any moves that could have been redone"""
+
 		assert(self.gs != None)
-		self.gsUndoStack.append(self.gs)
+		gs = self.gs.DoMove(move)
+		self.record.Truncate(self.ply)
+		self.record.Append(move, gs)
+		self.ply += 1
 
-		self.gsRedoStack = []
-		
 		self.SetGameState(gs)
+		self.AfterMove()
 
 	def IHexFromEvent(self:RagnarokWidget, event:Event):
-		for iHex,id in enumerate(self.mpIHexIdPoly):
-			xys = self.canvas.coords(id)
-			fInside = True
-			for iXy in range(0,len(xys),2):
-				x,y = xys[iXy],xys[iXy+1]
-				xPrev,yPrev = xys[iXy-2],xys[iXy-1]
-				xNormal,yNormal = y - yPrev, xPrev - x
-				if event.x * xNormal + event.y * yNormal < x * xNormal + y * yNormal:
-					fInside = False
-					break
-			if fInside:
-				return iHex
-		return None
+		"""Hex under the mouse, or None. Inverts PosCenter to fractional hex coordinates and rounds them to
+		   the nearest hex center; the hexes are regular and tile the plane, so that's the hex containing the point"""
+
+		y = (event.y - self.yOrigin + self.dXSide / 2) / self.dYPerY
+		x = (event.x - self.xOrigin - y * self.dXPerY) / self.dXPerX - 0.5
+
+		# Round in cube coordinates (x, -y, y - x), which sum to 0; fix up whichever coordinate rounded furthest
+
+		xRound,yRound,zRound = round(x),round(y),round(y - x)
+		dX,dY,dZ = abs(xRound - x),abs(yRound - y),abs(zRound - (y - x))
+		if dX > dY and dX > dZ:
+			xRound = yRound - zRound
+		elif dY > dZ:
+			yRound = xRound + zRound
+
+		return self.gs.board.mpHexI.get(Hex(xRound, yRound))
 	
 	def UpdateMove(self:RagnarokWidget, move:Move):
 		if move == None:
-			move = Move(None, None, None, None)
+			move = Move(None, None, None)
 
-		self.canvas.delete("move")
+		self.HideHover()
 
-		if self.move.vik != None:
-			id = self.mpVikIdOval[self.move.vik]
+		if self.move.iHexFrom != None:
+			id = self.mpVikIdOval[self.move.Vik(self.gs)]
 			self.canvas.coords(id, self.RectViking(self.move.iHexFrom))
 			self.canvas.itemconfigure(id, outline='#000000', width=1)
 		for iHex in self.hexesVis:
 			self.ResetHexColor(iHex)
 
 		self.move = move
-		if move.vik != None:
-			id = self.mpVikIdOval[move.vik]
+		if move.iHexFrom != None:
+			vik = move.Vik(self.gs)
+			id = self.mpVikIdOval[vik]
 			self.canvas.itemconfigure(id, outline='#8080ff', width=4)
 		  
 			if move.iHexTo != None:
 				self.canvas.coords(id, self.RectViking(move.iHexTo))
-				self.hexesVis = list(self.gs.HexesVisibleFrom(move.iHexTo, move.vik))
+				self.hexesVis = list(self.gs.HexesVisibleFrom(move.iHexTo, vik))
 			else:
-				self.hexesVis = list(self.gs.HexesVisibleFrom(move.iHexFrom, move.vik))
+				self.hexesVis = list(self.gs.HexesVisibleFrom(move.iHexFrom, vik))
 
 			for iHex in self.hexesVis:
 				self.SetHexColor(iHex, '#C0C0ff')
@@ -561,6 +283,10 @@ class RagnarokWidget(Frame):
 
         # print(f"click at {(event.x, event.y)}")
 
+		if self.timeSearchStart != None:
+			self.bell() # computer's turn; Escape or Undo to stop it
+			return
+
 		iHex = self.IHexFromEvent(event)
 		if iHex == None:
 			self.UpdateMove(None)
@@ -572,20 +298,20 @@ class RagnarokWidget(Frame):
 		fCommand = True if (event.state & 0x8) else False
 		# fOption = True if (event.state & 010) else False
 
-		if self.move.vik and iHex in self.hexesVis:
+		if self.move.iHexFrom != None and iHex in self.hexesVis:
 			if self.move.iHexTo != None:
 				# do the move
-				move = Move(self.move.vik, self.move.iHexFrom, self.move.iHexTo, iHex)
+				move = Move(self.move.iHexFrom, self.move.iHexTo, iHex)
 				self.UpdateMove(None)
-				self.AppendGameState(self.gs.DoMove(move))
+				self.AppendMove(move)
 			else:
-				self.UpdateMove(Move(self.move.vik, self.move.iHexFrom, iHex, None))
+				self.UpdateMove(Move(self.move.iHexFrom, iHex, None))
 			return
 
 		if iHex in self.gs.mpIHexVik:
 			vik = self.gs.mpIHexVik[iHex]
 			if vik.side == self.gs.sideToPlay:
-				self.UpdateMove(Move(vik, iHex, None, None))
+				self.UpdateMove(Move(iHex, None, None))
 				return
 			self.bell() # clicked on wrong side's viking
 		
@@ -593,24 +319,32 @@ class RagnarokWidget(Frame):
 
 	def HandleMouseMove(self, event):
 		iHex = self.IHexFromEvent(event)
-		if iHex == None:
+		if iHex == None or iHex == self.iHexHover:
 			return
 		
-		self.canvas.delete("move")
-		if self.move.vik and iHex in self.hexesVis:
+		self.HideHover()
+		if self.move.iHexFrom != None and iHex in self.hexesVis:
 			if self.move.iHexTo == None:
 				# draw viking where we'll move to
-				self.canvas.create_oval(
-								self.RectViking(iHex),
-								fill=RagnarokWidget.mpSideColor[self.move.vik.side],
-								tags="move")
+				self.canvas.coords(self.idHoverViking, self.RectViking(iHex))
+				self.canvas.itemconfigure(self.idHoverViking, fill=RagnarokWidget.mpSideColor[self.move.Vik(self.gs).side], state="normal")
+				self.canvas.tag_raise(self.idHoverViking)
 			else:
 				# draw where we'll place stone
-				self.CreateHex(iHex, fill='#808080', tags="move")
+				self.canvas.coords(self.idHoverStone, self.XysHex(iHex))
+				self.canvas.itemconfigure(self.idHoverStone, state="normal")
+				self.canvas.tag_raise(self.idHoverStone)
+			self.iHexHover = iHex
 			return
 
 		# draw number of hexes in region under?
 
+	def HideHover(self):
+		if self.iHexHover != None:
+			self.canvas.itemconfigure(self.idHoverViking, state="hidden")
+			self.canvas.itemconfigure(self.idHoverStone, state="hidden")
+			self.iHexHover = None
+
 	def HandleMouseDrag(self, event):
 		pass
 
@@ -621,75 +355,272 @@ class RagnarokWidget(Frame):
 		# Clear move in progress
 		self.UpdateMove(None)
 
+	def Cancel(self, *args):
+		"""Escape: stop the computer's search, or clear a partial move"""
+		if self.timeSearchStart != None:
+			self.CancelSearch()
+		else:
+			self.CancelMove()
+
 	def Undo(self, *args):
 		# "undo" while move in progress undoes partial move
-		if self.move.vik:
+		if self.move.iHexFrom != None:
 			self.CancelMove()
 			return
 
-		if len(self.gsUndoStack) == 0:
+		self.CancelSearch()
+
+		if self.ply == 0:
 			self.bell()
 			return
 		
-		self.gsRedoStack.append(self.gs)
-		self.SetGameState(self.gsUndoStack.pop())
+		self.ply -= 1
+		self.SetGameState(self.record.GsAt(self.ply))
+		self.AfterMove()
 
 	def Redo(self, *args):
-		if len(self.gsRedoStack) == 0:
+		if self.ply == len(self.record):
 			self.bell()
 			return
+
+		self.CancelSearch()
 		
-		self.gsUndoStack.append(self.gs)
-		self.SetGameState(self.gsRedoStack.pop())
+		self.ply += 1
+		self.SetGameState(self.record.GsAt(self.ply))
+		self.AfterMove()
+
+	# Game records (see gamerecord.py)
+
+	def SaveRecord(self, *args):
+		path = tkinter.filedialog.asksaveasfilename(parent=self, defaultextension=".txt", filetypes=[("Game records", "*.txt")])
+		if path:
+			self.record.Save(path)
+
+	def OpenRecord(self, *args):
+		path = tkinter.filedialog.askopenfilename(parent=self, filetypes=[("Game records", "*.txt"), ("All files", "*")])
+		if path:
+			try:
+				self.SetRecord(GameRecord.Load(path, self.gs.board))
+			except (OSError, ValueError) as error:
+				tkinter.messagebox.showerror("Can't open game", str(error), parent=self)
+
+	def CopyRecord(self, *args):
+		pyclip.copy(self.record.ToText())
+
+	def PasteRecord(self, *args):
+		try:
+			record = GameRecord.FromText(pyclip.paste(text=True), self.gs.board)
+		except ValueError as error:
+			tkinter.messagebox.showerror("Can't paste game", str(error), parent=self)
+			return
+		self.SetRecord(record)
+
+	def SetRecord(self, record:GameRecord):
+		"""Shows the end of record; its moves can be undone"""
+
+		self.CancelSearch()
+		self.record = record
+		self.ply = len(record)
+		self.SetGameState(record.GsAt(self.ply))
+
+	def AfterMove(self):
+		"""Starts the computer's move if it's the computer's turn; otherwise ponders on the human's time.
+		   Neither while showing an earlier ply (after Undo), since the computer's move would drop the moves to redo"""
+
+		if self.gs.sideToPlay == None or self.ply < len(self.record):
+			return
+		if self.mpSideFComputer[self.gs.sideToPlay]:
+			self.after_idle(self.ComputerMove) # let the board redraw first
+		elif any(self.mpSideFComputer):
+			self.StartPonder()
 
 	def ComputerMove(self, *args):
-		move,score = Minimax(self.gs, self.gs.sideToPlay == Side.Red, lookahead=2)
-		if move == None:
-			self.bell() # no possible moves?
+		"""Starts a background search for the side to play; the move is played when it's found (see PollSearch)"""
+
+		if self.gs.sideToPlay == None or self.timeSearchStart != None:
+			self.bell()
+			return
+		if self.move.iHexFrom != None:
+			self.CancelMove()
+
+		move = self.mpKeyMovePonder.get(self.gs.Key())
+		if move != None:
+			self.CancelSearch()
+			self.AppendMove(move)
+			return
+
+		gs = self.gs.Copy() # the search thread's own; see GameState.Copy
+		msBudget = self.msComputerMove
+		self.StartSearch(lambda eventCancel, fnPost: fnPost("move", self.FindMove(gs, msBudget, eventCancel, fnPost)))
+		self.timeSearchStart = perf_counter()
+		self.strProgress = ""
+		self.ShowProgress()
+
+	def StartPonder(self):
+		"""Searches, in the background, the computer's answer to each of the human's likeliest moves"""
+
+		gs = self.gs.Copy()
+		msBudget = self.msComputerMove
+
+		def Ponder(eventCancel:threading.Event, fnPost:Callable[[str, object], None]):
+			for moveHuman in AMoveCandidates(gs, self.cMovePonder):
+				gsHuman = gs.DoMove(moveHuman)
+				if gsHuman.sideToPlay == None:
+					continue
+				move = self.FindMove(gsHuman, msBudget, eventCancel, None)
+				if eventCancel.is_set():
+					return
+				if move != None:
+					fnPost("ponder", (gsHuman.Key(), move))
+
+		self.mpKeyMovePonder = {}
+		self.StartSearch(Ponder)
+
+	def FindMove(self, gs:GameState, msBudget:int, eventCancel:threading.Event, fnPost:Callable[[str, object], None]) -> Optional[Move]:
+		"""Runs on the search thread: book move, else exact endgame move, else timed search. fnPost, if given, gets progress"""
+
+		entry = self.book.Lookup(gs) if self.book != None else None
+		if entry != None:
+			return entry[0]
+
+		if self.solver.FSolvable(gs):
+			timeStart = perf_counter()
+			try:
+				move,score = self.solver.Solve(gs, msBudget, eventCancel)
+				return move
+			except SearchTimeout:
+				if eventCancel.is_set():
+					return None
+			# The search gets what time the solver left, but at least a tenth of the budget, so the move is only a little late
+			msBudget = max(msBudget - int((perf_counter() - timeStart) * 1000), msBudget // 10)
+
+		strNodes = "playouts" if self.fMcts else "nodes"
+		def Progress(depth:int, move:Move, score:float, cNode:int):
+			fnPost("progress", f"depth {depth}, {cNode} {strNodes}")
+
+		# Search on a bitboard copy; moves are just hexes, so they apply to gs
+		if self.fMcts:
+			move,score,info = self.mcts.Search(BitboardGameState(gs=gs), gs.sideToPlay == Side.Red, msBudget, eventCancel=eventCancel,
+											   fnProgress=Progress if fnPost != None else None)
 		else:
-			self.AppendGameState(self.gs.DoMove(move))
+			move,score,info = SearchTimed(BitboardGameState(gs=gs), gs.sideToPlay == Side.Red, msBudget, tt=self.tt,
+										  eventCancel=eventCancel, fnIteration=Progress if fnPost != None else None)
+		return move
+
+	def ToggleMcts(self, *args):
+		"""Switches the computer between alpha-beta and Monte Carlo tree search, from its next search on"""
+
+		if self.timeSearchStart != None:
+			self.bell() # not while it's thinking
+			return
+		self.fMcts = not self.fMcts
+		self.winfo_toplevel().title("Ragnarocks (MCTS)" if self.fMcts else "Ragnarocks")
+		self.AfterMove() # restarts pondering with the new search
+
+	def StartSearch(self, fnSearch:Callable[[threading.Event, Callable[[str, object], None]], None]):
+		"""Cancels any search in progress and runs fnSearch(eventCancel, fnPost) on a new thread. The new thread
+		   waits for the old one to stop first, so only one at a time uses tt and solver. If fnSearch raises,
+		   ("failed", error) is posted. fnSearch must only touch states it owns (see GameState.Copy)"""
+
+		self.CancelSearch()
+		eventCancel = self.eventCancel = threading.Event()
+		idSearch = self.idSearch
+		threadPrev = self.threadSearch
+
+		def Run():
+			if threadPrev != None:
+				threadPrev.join()
+			if eventCancel.is_set():
+				return
+			fnPost = lambda kind, value: self.queueSearch.put((idSearch, kind, value))
+			try:
+				fnSearch(eventCancel, fnPost)
+			except Exception as error:
+				traceback.print_exc()
+				fnPost("failed", error) # so the widget doesn't stay "thinking"
+
+		self.threadSearch = threading.Thread(target=Run, daemon=True)
+		self.threadSearch.start()
+		if not self.fPolling:
+			self.fPolling = True
+			self.after(RagnarokWidget.s_msPoll, self.PollSearch)
+
+	def CancelSearch(self):
+		"""Stops the search in progress, if any; whatever it still posts is ignored"""
+
+		if self.eventCancel != None:
+			self.eventCancel.set()
+			self.eventCancel = None
+		self.idSearch += 1
+		self.timeSearchStart = None
+		self.canvas.delete("progress")
+
+	s_msPoll = 50
+
+	def PollSearch(self):
+		"""Tk thread: handles what the search thread posted, and keeps polling while it runs"""
+
+		while not self.queueSearch.empty():
+			idSearch,kind,value = self.queueSearch.get()
+			if idSearch != self.idSearch:
+				continue
+			if kind == "progress":
+				self.strProgress = value
+			elif kind == "ponder":
+				key,move = value
+				self.mpKeyMovePonder[key] = move
+			elif kind == "move":
+				self.CancelSearch() # done; also clears the progress display
+				if value == None:
+					self.bell() # no possible moves?
+				else:
+					self.AppendMove(value)
+			elif kind == "failed":
+				self.CancelSearch()
+				self.bell()
 
+		if self.timeSearchStart != None:
+			self.ShowProgress()
 
+		if (self.threadSearch != None and self.threadSearch.is_alive()) or not self.queueSearch.empty():
+			self.after(RagnarokWidget.s_msPoll, self.PollSearch)
+		else:
+			self.fPolling = False
 
-root = Tk()
-root.option_add('*tearOff', False)
-root.columnconfigure(0, weight=1)
-root.rowconfigure(0, weight=1)
+	def ShowProgress(self):
+		self.canvas.delete("progress")
+		self.canvas.create_text(
+							(325, 30),
+							text=f"Thinking {perf_counter() - self.timeSearchStart:.1f}s  {self.strProgress}",
+							font=('Helvetica', 14),
+							tags="progress")
 
-# mainframe = ttk.Frame(root, padding="3 3 12 12")
-mainframe = ttk.Frame(root)
-mainframe.grid(column=0, row=0, sticky=(N, W, E, S))
 
-bl_Standard = BoardLayout(
-				[(0,5), (0,6), (0,7), (0,8), (0,9), (0,10), (0,11), (0,11), (1,10), (2,9)],
-				[[(5,9), (6,9), (7,9)], [(1,0), (2,0), (3,0)]])
 
-bl_5x5_3v3 = BoardLayout([(0,4), (0,5), (0,6), (0,7), (0,8), (1,7), (2,6), (3,5), (4,4)], 
-						  [[(0,0),(7,4),(4,8)], [(3,0),(0,4),(7,8)]])
+# Only start the UI when run directly
 
-# this one is nearly interesting, but starting move is devastating
-bl_4x4_2v2 = BoardLayout([(0,4), (0,5), (0,6), (0,7), (1,6), (2,5), (3,4)], [[(3,6), (6,6)], [(0,0),(3,0)]])
-# this version is much better
-bl_4x4_2v2 = BoardLayout([(0,4), (0,5), (0,6), (0,7), (1,6), (2,5), (3,4)], [[(3,6),(3,0)], [(0,0),(6,6)]])
+if __name__ == "__main__":
+	root = Tk()
+	root.option_add('*tearOff', False)
+	root.columnconfigure(0, weight=1)
+	root.rowconfigure(0, weight=1)
 
-bl_3x4_2v2 = BoardLayout([(0,4), (0,5), (0,6), (1,5), (2,4)], [[(2,4), (5,4)], [(0,0),(3,0)]])
-bl_3x3_2v2 = BoardLayout([(0,3), (0,4), (0,5), (1,4), (2,3)], [[(2,4), (4,4)], [(0,0),(2,0)]])
-bl_3x3_1v1 = BoardLayout([(0,3), (0,4), (0,5), (1,4), (2,3)], [[(2,4)], [(0,0)]])
-bl_2x2_1v1 = BoardLayout([(0,2), (0,3), (1,2)], [[(2,2)], [(0,0)]])
-bl_2x3_1v1 = BoardLayout([(0,3), (0,4), (1,3)], [[(3,2)], [(0,0)]])
+	# mainframe = ttk.Frame(root, padding="3 3 12 12")
+	mainframe = ttk.Frame(root)
+	mainframe.grid(column=0, row=0, sticky=(N, W, E, S))
 
-board = Board(bl_Standard)
-# board = Board(bl_5x5_3v3)
-# board = Board(bl_4x4_2v2)
-# board = Board(bl_3x4_2v2)
-# board = Board(bl_3x3_2v2)
-# board = Board(bl_2x2_1v1)
-# board = Board(bl_2x3_1v1)
+	board = Board(bl_Standard)
+	# board = Board(bl_5x5_3v3)
+	# board = Board(bl_4x4_2v2)
+	# board = Board(bl_3x4_2v2)
+	# board = Board(bl_3x3_2v2)
+	# board = Board(bl_2x2_1v1)
+	# board = Board(bl_2x3_1v1)
 
-RagnarokWidget = RagnarokWidget(mainframe, GameState(board), 650, 550)
-RagnarokWidget.grid(column=0, row=0, sticky=(N, W, E, S))
-RagnarokWidget.winfo_toplevel().title("Ragnarocks")
+	RagnarokWidget = RagnarokWidget(mainframe, GameState(board), 650, 550)
+	RagnarokWidget.grid(column=0, row=0, sticky=(N, W, E, S))
+	RagnarokWidget.winfo_toplevel().title("Ragnarocks")
 
 
 
-root.mainloop()
\ No newline at end of file
+	root.mainloop()
@@ -0,0 +1,242 @@
+"""Engine-vs-engine games without the UI; prints each result and overall throughput
+
+	python selfplay.py --layout bl_5x5_3v3 --games 10 --lookahead 2
+	python selfplay.py --layout bl_Standard --games 2 --ms 1000
+	python selfplay.py --layout bl_4x4_2v2 --engine GameState --seed 7
+	python selfplay.py --layout bl_Standard --search mcts --playouts 2000
+
+Games are deterministic apart from the first few plies, which are played at random from --seed.
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+from typing import *
+
+from engine import *
+from minimax import *
+from openingbook import OpeningBook
+from endgame import EndgameSolver
+from mcts import MCTS, ParallelMCTS
+
+
+s_mpNameClsState = {cls.__name__:cls for cls in (GameState, BitboardGameState)}
+s_aSearch = ("minimax", "mcts")
+
+
+class Player:
+	"""Searches for one side: to a fixed lookahead, or iteratively deepening within msBudget.
+	   Keeps its transposition table from move to move, like RagnarokWidget does.
+	   With search "mcts", runs cPlayout playouts (or as many as fit in msBudget) of Monte Carlo tree
+	   search instead, keeping its tree from move to move, across cWorker processes if more than one.
+	   With fBook, plays from the layout's default OpeningBook while it has the position.
+	   With cHexEndgame, solves exactly once no more than that many hexes are contested"""
+
+	def __init__(self:Player, lookahead:int = 2, msBudget:int = None, clsState:type = BitboardGameState, fBook:bool = False,
+				 cHexEndgame:int = None, search:str = "minimax", cPlayout:int = MCTS.s_cPlayoutDefault, cWorker:int = 1):
+		self.lookahead = lookahead
+		self.msBudget = msBudget
+		self.clsState = clsState
+		self.fBook = fBook
+		self.book:OpeningBook = None # loaded on first move, once we know the board
+		self.cHexEndgame = cHexEndgame
+		self.solver:EndgameSolver = None # likewise
+		self.tt = TranspositionTable()
+		self.search = search
+		self.cPlayout = cPlayout
+		self.cWorker = cWorker
+		self.mcts:Union[MCTS, ParallelMCTS] = None # made on first move
+
+	@staticmethod
+	def FromSpec(spec:str) -> Player:
+		"""Player from "key=value,..." with keys lookahead, ms, engine, book, endgame, search, playouts and workers,
+		   e.g. "ms=500,engine=GameState,book=1,endgame=12" or "search=mcts,playouts=2000,workers=4" """
+
+		player = Player()
+		for item in filter(None, spec.split(",")):
+			key,_,value = item.partition("=")
+			if key == "lookahead":
+				player.lookahead = int(value)
+			elif key == "ms":
+				player.msBudget = int(value)
+			elif key == "engine":
+				if value not in s_mpNameClsState:
+					raise ValueError(f"unknown engine {value!r}; expected one of {list(s_mpNameClsState)}")
+				player.clsState = s_mpNameClsState[value]
+			elif key == "book":
+				player.fBook = value not in ("0", "")
+			elif key == "endgame":
+				player.cHexEndgame = int(value) if value not in ("0", "") else None
+			elif key == "search":
+				if value not in s_aSearch:
+					raise ValueError(f"unknown search {value!r}; expected one of {list(s_aSearch)}")
+				player.search = value
+			elif key == "playouts":
+				player.cPlayout = int(value)
+			elif key == "workers":
+				player.cWorker = int(value)
+			else:
+				raise ValueError(f"unknown player setting {key!r} in {spec!r}")
+		return player
+
+	def __repr__(self):
+		if self.search == "mcts":
+			search = f"mcts, ms={self.msBudget}" if self.msBudget != None else f"mcts, playouts={self.cPlayout}"
+			if self.cWorker > 1:
+				search += f", workers={self.cWorker}"
+		else:
+			search = f"ms={self.msBudget}" if self.msBudget != None else f"lookahead={self.lookahead}"
+		strBook = ", book" if self.fBook else ""
+		strEndgame = f", endgame={self.cHexEndgame}" if self.cHexEndgame != None else ""
+		return f"Player({search}, {self.clsState.__name__}{strBook}{strEndgame})"
+
+	def Close(self:Player):
+		"""Stops the worker processes of a root-parallel MCTS, if any"""
+		if isinstance(self.mcts, ParallelMCTS):
+			self.mcts.Close()
+		self.mcts = None
+
+	def ChooseMove(self:Player, gs:GameState) -> Tuple[Move, int]:
+		"""Best move for gs.sideToPlay (None if it has none), and nodes searched (playouts for MCTS)"""
+
+		if self.fBook:
+			if self.book == None:
+				self.book = OpeningBook.LoadDefault(gs.board)
+				if self.book == None:
+					self.book = OpeningBook(OpeningBook.Fingerprint(gs.board)) # empty
+			entry = self.book.Lookup(gs)
+			if entry != None:
+				return entry[0],0
+
+		if self.cHexEndgame != None:
+			if self.solver == None:
+				self.solver = EndgameSolver(gs.board, self.cHexEndgame)
+			if self.solver.FSolvable(gs):
+				cNodeStart = self.solver.cNode
+				try:
+					move,score = self.solver.Solve(gs, self.msBudget)
+					return move,self.solver.cNode - cNodeStart
+				except SearchTimeout:
+					pass # too big after all; search instead
+
+		gsSearch = gs if self.clsState == GameState else self.clsState(gs=gs)
+		fMax = gs.sideToPlay == Side.Red
+
+		if self.search == "mcts":
+			if self.mcts == None:
+				self.mcts = ParallelMCTS(self.cWorker) if self.cWorker > 1 else MCTS()
+			cPlayout = self.cPlayout if self.msBudget == None else None
+			move,score,info = self.mcts.Search(gsSearch, fMax, self.msBudget, cPlayout)
+			return move,info.cNode
+
+		if self.msBudget != None:
+			move,score,info = SearchTimed(gsSearch, fMax, self.msBudget, tt=self.tt)
+			return move,info.cNode
+
+		self.tt.NewSearch()
+		ctx = SearchContext(self.tt, orderer=MoveOrderer())
+		move,score = MinimaxRecursive(gsSearch, fMax, self.lookahead, -sys.float_info.max, sys.float_info.max, ctx)
+		return move,ctx.cNode
+
+
+class GameResult:
+	"""How one game went. mpSideScore is settled hexes per side when play stopped"""
+
+	def __init__(self, mpSideScore:List[int], cPly:int, cNode:int, sec:float, fStuck:bool):
+		self.mpSideScore = mpSideScore
+		self.cPly = cPly
+		self.cNode = cNode
+		self.sec = sec
+		self.fStuck = fStuck # side to play had no moves before the game was over
+
+	def SideWinner(self) -> Side:
+		"""Winning side, None for a draw"""
+		scoreRed,scoreWhite = self.mpSideScore
+		if scoreRed == scoreWhite:
+			return None
+		return Side.Red if scoreRed > scoreWhite else Side.White
+
+	def __repr__(self):
+		sideWinner = self.SideWinner()
+		strResult = "draw" if sideWinner == None else f"{sideWinner.name} wins"
+		strStuck = ", stuck" if self.fStuck else ""
+		return (f"Red {self.mpSideScore[Side.Red]} White {self.mpSideScore[Side.White]} ({strResult}{strStuck}), "
+				f"{self.cPly} plies, {self.cNode} nodes, {self.sec:.2f}s")
+
+
+def GsOpening(board:Board, rng:random.Random, cPlyRandom:int) -> GameState:
+	"""Start position followed by cPlyRandom random moves (moves sorted by hex, so rng alone decides)"""
+
+	gs = GameState(board)
+	for _ in range(cPlyRandom):
+		moves = sorted(gs.Moves(), key=Move.Pack)
+		if not moves:
+			break
+		gsNext = gs.DoMove(rng.choice(moves))
+		if gsNext.sideToPlay == None:
+			break
+		gs = gsNext
+	return gs
+
+def PlayGame(gs:GameState, mpSidePlayer:List[Player]) -> GameResult:
+	"""Plays gs out with each side's Player"""
+
+	cPly = 0
+	cNode = 0
+	fStuck = False
+	timeStart = time.perf_counter()
+
+	while gs.sideToPlay != None:
+		move,cNodeMove = mpSidePlayer[gs.sideToPlay].ChooseMove(gs)
+		cNode += cNodeMove
+		if move == None:
+			fStuck = True
+			break
+		gs = gs.DoMove(move)
+		cPly += 1
+
+	return GameResult(gs.MpSideScore(), cPly, cNode, time.perf_counter() - timeStart, fStuck)
+
+
+def Main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--layout", default="bl_5x5_3v3", choices=list(MpNameLayout()))
+	parser.add_argument("--games", type=int, default=4)
+	parser.add_argument("--lookahead", type=int, default=2, help="fixed search depth (ignored with --ms)")
+	parser.add_argument("--ms", type=int, default=None, help="time per move in milliseconds, with iterative deepening")
+	parser.add_argument("--engine", default=BitboardGameState.__name__, choices=list(s_mpNameClsState))
+	parser.add_argument("--search", default="minimax", choices=s_aSearch)
+	parser.add_argument("--playouts", type=int, default=MCTS.s_cPlayoutDefault, help="MCTS playouts per move (ignored with --ms)")
+	parser.add_argument("--workers", type=int, default=1, help="processes for root-parallel MCTS")
+	parser.add_argument("--random-plies", type=int, default=2, help="random moves at the start of each game")
+	parser.add_argument("--seed", type=int, default=0)
+	args = parser.parse_args()
+
+	board = Board(MpNameLayout()[args.layout])
+	clsState = s_mpNameClsState[args.engine]
+	rng = random.Random(args.seed)
+
+	aResult = []
+	timeStart = time.perf_counter()
+	for iGame in range(args.games):
+		mpSidePlayer = [Player(args.lookahead, args.ms, clsState, search=args.search, cPlayout=args.playouts, cWorker=args.workers)
+						for side in Side]
+		result = PlayGame(GsOpening(board, rng, args.random_plies), mpSidePlayer)
+		for player in mpSidePlayer:
+			player.Close()
+		aResult.append(result)
+		print(f"game {iGame + 1}: {result}", flush=True)
+	sec = time.perf_counter() - timeStart
+
+	cNode = sum(result.cNode for result in aResult)
+	mpSideCWin = [sum(result.SideWinner() == side for result in aResult) for side in Side]
+	cDraw = len(aResult) - sum(mpSideCWin)
+	print(f"{len(aResult)} games on {args.layout} in {sec:.2f}s: {len(aResult) / sec:.3f} games/sec, {cNode / sec:.0f} nodes/sec")
+	print(f"Red {mpSideCWin[Side.Red]}, White {mpSideCWin[Side.White]}, draws {cDraw}")
+
+
+if __name__ == "__main__":
+	Main()
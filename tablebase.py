@@ -0,0 +1,316 @@
+"""Exhaustive solver for small layouts: the exact value of every reachable position, kept in a file
+
+	python tablebase.py --layout bl_3x3_1v1
+	python tablebase.py --layout bl_3x4_2v2 --check lookahead=2 --positions 200
+
+Values are final settled hexes, Red minus White, with perfect play from both sides; as in
+selfplay.PlayGame, a side to play with no moves ends the game. Positions that are the same up to a
+symmetry of the board share one entry (see GameState.KeyCanonical).
+
+The table is an open-addressed hash table in a memory-mapped file (tablebases/<layout>.tb). A position
+is stored only once all its children are solved, so an interrupted run can simply be rerun: it walks
+the tree again, finds the solved parts in the file and continues from there.
+
+	tb = Tablebase(board)
+	tb.Value(gs) # exact final score
+	tb.MovesBest(gs) # every move that keeps it
+	tb.Loss(gs, move) # points given away by move
+"""
+
+from __future__ import annotations
+
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+from typing import *
+
+from engine import *
+from openingbook import OpeningBook
+
+
+class Tablebase:
+	"""Exact values for one Board in a memory-mapped hash table; see module docstring"""
+
+	s_magic = b"RTB1"
+	s_structHeader = struct.Struct("<4sQIQ") # magic, board fingerprint, log2 of entry count, entries used
+	s_structEntry = struct.Struct("<QhH") # canonical key, value, 1 if used
+	s_cEntryLog2Min = 16
+
+	def __init__(self:Tablebase, board:Board, path:str = None):
+		self.board = board
+		self.path = path if path != None else Tablebase.PathDefault(board)
+		self.fingerprint = OpeningBook.Fingerprint(board)
+
+		self.cNode = 0 # positions solved by this process
+		self.cStoreSinceFlush = 0
+		self.file = None
+		self.mm:mmap.mmap = None
+		self.Open()
+
+	@staticmethod
+	def PathDefault(board:Board) -> str:
+		"""tablebases/<layout name>.tb next to this module"""
+
+		pathBook = OpeningBook.PathDefault(board)
+		name = os.path.splitext(os.path.basename(pathBook))[0]
+		return os.path.join(os.path.dirname(os.path.abspath(__file__)), "tablebases", f"{name}.tb")
+
+	# The table itself
+
+	def Open(self:Tablebase):
+		"""Maps the file, creating it if needed; raises ValueError if it belongs to another Board"""
+
+		if not os.path.exists(self.path):
+			Tablebase.CreateFile(self.path, self.fingerprint, Tablebase.s_cEntryLog2Min)
+
+		self.file = open(self.path, "r+b")
+		self.mm = mmap.mmap(self.file.fileno(), 0)
+		magic,fingerprint,self.cEntryLog2,self.cEntryUsed = Tablebase.s_structHeader.unpack_from(self.mm)
+		if magic != Tablebase.s_magic or fingerprint != self.fingerprint:
+			self.mm.close() # without Flush, which would write our header over theirs
+			self.file.close()
+			self.mm,self.file = None,None
+			raise ValueError(f"{self.path}: " + ("not a tablebase" if magic != Tablebase.s_magic else "built for a different board"))
+		self.maskEntry = (1 << self.cEntryLog2) - 1
+
+	@staticmethod
+	def CreateFile(path:str, fingerprint:int, cEntryLog2:int):
+		os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+		with open(path, "wb") as file:
+			file.write(Tablebase.s_structHeader.pack(Tablebase.s_magic, fingerprint, cEntryLog2, 0))
+			file.truncate(Tablebase.s_structHeader.size + (Tablebase.s_structEntry.size << cEntryLog2))
+
+	def WriteHeader(self:Tablebase):
+		Tablebase.s_structHeader.pack_into(self.mm, 0, Tablebase.s_magic, self.fingerprint, self.cEntryLog2, self.cEntryUsed)
+
+	def Flush(self:Tablebase):
+		self.WriteHeader()
+		self.mm.flush()
+		self.cStoreSinceFlush = 0
+
+	def Close(self:Tablebase):
+		if self.mm != None:
+			self.Flush()
+			self.mm.close()
+			self.mm = None
+		if self.file != None:
+			self.file.close()
+			self.file = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.Close()
+
+	def __len__(self):
+		return self.cEntryUsed
+
+	def Lookup(self:Tablebase, key:int) -> Optional[int]:
+		cbHeader = Tablebase.s_structHeader.size
+		cbEntry = Tablebase.s_structEntry.size
+		iEntry = key & self.maskEntry
+		for _ in range(self.maskEntry + 1): # a full table has no empty slot to stop at
+			keyEntry,value,fUsed = Tablebase.s_structEntry.unpack_from(self.mm, cbHeader + iEntry * cbEntry)
+			if not fUsed:
+				return None
+			if keyEntry == key:
+				return value
+			iEntry = (iEntry + 1) & self.maskEntry
+		return None
+
+	def Store(self:Tablebase, key:int, value:int):
+		cbHeader = Tablebase.s_structHeader.size
+		cbEntry = Tablebase.s_structEntry.size
+		iEntry = key & self.maskEntry
+		for _ in range(self.maskEntry + 1):
+			keyEntry,_,fUsed = Tablebase.s_structEntry.unpack_from(self.mm, cbHeader + iEntry * cbEntry)
+			if not fUsed or keyEntry == key:
+				break
+			iEntry = (iEntry + 1) & self.maskEntry
+		else:
+			self.Grow() # full, which only a wrong cEntryUsed allows; Grow recounts
+			self.Store(key, value)
+			return
+
+		Tablebase.s_structEntry.pack_into(self.mm, cbHeader + iEntry * cbEntry, key, value, 1)
+		if not fUsed:
+			self.cEntryUsed += 1
+			self.WriteHeader() # into the mapped file, so even a killed run leaves the right count
+			if self.cEntryUsed * 10 > (7 << self.cEntryLog2):
+				self.Grow()
+
+		self.cStoreSinceFlush += 1
+		if self.cStoreSinceFlush >= 1 << 16:
+			self.Flush() # so an interrupted run loses little
+
+	def Grow(self:Tablebase):
+		"""Rehashes into a file twice the size, then swaps it in"""
+
+		cbHeader = Tablebase.s_structHeader.size
+		cbEntry = Tablebase.s_structEntry.size
+		cEntryOld = 1 << self.cEntryLog2
+		aKeyValue = []
+		for iEntry in range(cEntryOld):
+			key,value,fUsed = Tablebase.s_structEntry.unpack_from(self.mm, cbHeader + iEntry * cbEntry)
+			if fUsed:
+				aKeyValue.append((key, value))
+
+		cEntryLog2 = self.cEntryLog2 + 1
+		pathGrow = self.path + ".grow"
+		Tablebase.CreateFile(pathGrow, self.fingerprint, cEntryLog2)
+		self.Close()
+
+		self.path,pathFinal = pathGrow,self.path
+		self.Open()
+		for key,value in aKeyValue:
+			iEntry = key & self.maskEntry
+			while Tablebase.s_structEntry.unpack_from(self.mm, cbHeader + iEntry * cbEntry)[2]:
+				iEntry = (iEntry + 1) & self.maskEntry
+			Tablebase.s_structEntry.pack_into(self.mm, cbHeader + iEntry * cbEntry, key, value, 1)
+		self.cEntryUsed = len(aKeyValue)
+		self.Close()
+
+		os.replace(pathGrow, pathFinal) # the old file stays complete until this point
+		self.path = pathFinal
+		self.Open()
+
+	# Solving and queries
+
+	def Solve(self:Tablebase, bb:BitboardGameState) -> int:
+		"""Exact value of bb, solving (and storing) whatever isn't in the table yet. bb is restored afterwards"""
+
+		if bb.sideToPlay == None:
+			cHexRed,cHexWhite = bb.MpSideScore()
+			return cHexRed - cHexWhite
+
+		key,_ = bb.KeyCanonical()
+		value = self.Lookup(key)
+		if value != None:
+			return value
+
+		fMax = bb.sideToPlay == Side.Red
+		value = None
+		for move in list(bb.Moves()):
+			bb.DoMove(move)
+			try:
+				valueChild = self.Solve(bb)
+			finally:
+				bb.UndoMove(move)
+			if value == None or (valueChild > value if fMax else valueChild < value):
+				value = valueChild
+
+		if value == None: # stuck; game over
+			cHexRed,cHexWhite = bb.MpSideScore()
+			value = cHexRed - cHexWhite
+
+		self.Store(key, value)
+		self.cNode += 1
+		return value
+
+	def Value(self:Tablebase, gs:AbstractGameState) -> int:
+		"""Final score, Red minus White settled hexes, with perfect play from gs"""
+		return self.Solve(gs if isinstance(gs, BitboardGameState) else BitboardGameState(gs=gs))
+
+	def MpMoveValue(self:Tablebase, gs:AbstractGameState) -> Dict[Move, int]:
+		"""Value after each legal move"""
+
+		bb = gs if isinstance(gs, BitboardGameState) else BitboardGameState(gs=gs)
+		mpMoveValue = {}
+		for move in list(bb.Moves()):
+			bb.DoMove(move)
+			try:
+				mpMoveValue[move] = self.Solve(bb)
+			finally:
+				bb.UndoMove(move)
+		return mpMoveValue
+
+	def MovesBest(self:Tablebase, gs:AbstractGameState) -> List[Move]:
+		"""Every move that keeps the perfect-play value"""
+
+		value = self.Value(gs)
+		return [move for move,valueMove in self.MpMoveValue(gs).items() if valueMove == value]
+
+	def Loss(self:Tablebase, gs:AbstractGameState, move:Move) -> int:
+		"""Settled hexes move gives away compared with perfect play (0 for a best move)"""
+
+		bb = gs if isinstance(gs, BitboardGameState) else BitboardGameState(gs=gs)
+		value = self.Solve(bb)
+		bb.DoMove(move)
+		try:
+			valueMove = self.Solve(bb)
+		finally:
+			bb.UndoMove(move)
+		return value - valueMove if bb.sideToPlay == Side.Red else valueMove - value
+
+
+def CheckPlayer(tb:Tablebase, spec:str, cPosition:int, seed:int):
+	"""Grades a selfplay.Player's moves against the table on positions from random games"""
+
+	from selfplay import Player
+
+	rng = random.Random(seed)
+	cBest = 0
+	cLossTotal = 0
+	cPositionDone = 0
+	while cPositionDone < cPosition:
+		gs = GameState(tb.board)
+		cPly = rng.randrange(len(tb.board.Hexes()) // 2)
+		for _ in range(cPly):
+			moves = sorted(gs.Moves(), key=Move.Pack)
+			if not moves:
+				break
+			gsNext = gs.DoMove(rng.choice(moves))
+			if gsNext.sideToPlay == None:
+				break
+			gs = gsNext
+
+		player = Player.FromSpec(spec)
+		move,cNode = player.ChooseMove(gs)
+		player.Close()
+		if move == None:
+			continue
+		loss = tb.Loss(gs, move)
+		cBest += loss == 0
+		cLossTotal += loss
+		cPositionDone += 1
+
+	print(f"{spec}: best move in {cBest}/{cPosition} positions, {cLossTotal / cPosition:.2f} hexes lost per move on average")
+
+
+def Main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--layout", default="bl_3x3_1v1", choices=list(MpNameLayout()))
+	parser.add_argument("--file", default=None, help="table file (default tablebases/<layout>.tb)")
+	parser.add_argument("--check", nargs="*", default=[], help="selfplay.Player specs to grade against the table, e.g. lookahead=2")
+	parser.add_argument("--positions", type=int, default=100, help="positions to grade each --check player on")
+	parser.add_argument("--seed", type=int, default=0)
+	args = parser.parse_args()
+
+	board = Board(MpNameLayout()[args.layout])
+	sys.setrecursionlimit(max(sys.getrecursionlimit(), 4 * len(board.Hexes()) + 1000))
+
+	with Tablebase(board, args.file) as tb:
+		cEntryStart = len(tb)
+		timeStart = time.perf_counter()
+		try:
+			value = tb.Value(GameState(board))
+		except KeyboardInterrupt:
+			print(f"interrupted; {len(tb)} positions saved in {tb.path}, rerun to resume")
+			raise
+		sec = time.perf_counter() - timeStart
+
+		print(f"{args.layout}: {len(board.aSym)} symmetries, {len(tb)} positions ({len(tb) - cEntryStart} new, {sec:.1f}s)")
+		print(f"value with perfect play: {value:+d} (Red minus White)")
+		print(f"best first moves: {tb.MovesBest(GameState(board))}")
+
+		for spec in args.check:
+			CheckPlayer(tb, spec, args.positions, args.seed)
+
+
+if __name__ == "__main__":
+	Main()
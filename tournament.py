@@ -0,0 +1,218 @@
+"""Round-robin engine tournament over a process pool; streams games to JSONL and reports win rates
+
+	python tournament.py --players d1:lookahead=1 d2:lookahead=2 --layout bl_4x4_2v2 --openings 20 --out games.jsonl
+	python tournament.py --players t200:ms=200 t500:ms=500 --openings 50 --workers 8 --out t.jsonl
+	python tournament.py --players d1:lookahead=1 d2:lookahead=2 --out games.jsonl --report-only
+
+Each player is "name:settings", with settings as in selfplay.Player.FromSpec. Every pair of players
+plays each opening twice, once with each color. Opening i is --random-plies seeded random moves,
+the same for every pair.
+
+Games are appended to --out as they finish, one JSON object per line. Rerunning the same command
+skips games already in the file, so an interrupted tournament picks up where it stopped.
+"""
+
+from __future__ import annotations
+
+import argparse
+import concurrent.futures
+from collections import defaultdict
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import random
+import time
+from typing import *
+
+from engine import *
+from selfplay import Player, PlayGame, GsOpening
+
+
+def _PlayScheduledGame(nameLayout:str, specRed:str, specWhite:str, seedOpening:str, cPlyRandom:int) -> Dict[str, object]:
+	"""Worker side: plays one game and returns its record (without id and player names)"""
+
+	board = Board.FromPacked(MpNameLayout()[nameLayout].Pack())
+	gs = GsOpening(board, random.Random(seedOpening), cPlyRandom)
+	players = [Player.FromSpec(specRed), Player.FromSpec(specWhite)]
+	try:
+		result = PlayGame(gs, players)
+	finally:
+		for player in players:
+			player.Close()
+	return {
+		"score": result.mpSideScore,
+		"plies": result.cPly,
+		"nodes": result.cNode,
+		"sec": result.sec,
+		"stuck": result.fStuck,
+	}
+
+
+class ScheduledGame:
+	"""One game of the tournament. id is stable across runs, so finished games can be skipped on resume"""
+
+	def __init__(self, nameLayout:str, nameRed:str, specRed:str, nameWhite:str, specWhite:str, iOpening:int, seed:str, cPlyRandom:int):
+		self.nameLayout = nameLayout
+		self.nameRed = nameRed
+		self.specRed = specRed
+		self.nameWhite = nameWhite
+		self.specWhite = specWhite
+		self.iOpening = iOpening
+		self.seedOpening = f"{nameLayout}/{seed}/{iOpening}"
+		self.cPlyRandom = cPlyRandom
+		self.id = f"{nameLayout}|{nameRed}={specRed}|{nameWhite}={specWhite}|{self.seedOpening}|{cPlyRandom}"
+
+	def Record(self, mpKeyValue:Dict[str, object]) -> Dict[str, object]:
+		record = {"id": self.id, "layout": self.nameLayout, "red": self.nameRed, "white": self.nameWhite, "opening": self.iOpening}
+		record.update(mpKeyValue)
+		return record
+
+
+def AGameSchedule(nameLayout:str, mpNameSpec:Dict[str, str], cOpening:int, seed:str, cPlyRandom:int) -> List[ScheduledGame]:
+	"""Every pair plays every opening with both colors; ordered by opening so partial runs stay balanced"""
+
+	aGame = []
+	for iOpening in range(cOpening):
+		for nameA,nameB in itertools.combinations(mpNameSpec, 2):
+			for nameRed,nameWhite in ((nameA, nameB), (nameB, nameA)):
+				aGame.append(ScheduledGame(nameLayout, nameRed, mpNameSpec[nameRed], nameWhite, mpNameSpec[nameWhite], iOpening, seed, cPlyRandom))
+	return aGame
+
+def ARecordRead(path:str) -> List[Dict[str, object]]:
+	"""Records already in path; a line cut short by an interruption is ignored"""
+
+	aRecord = []
+	if not os.path.exists(path):
+		return aRecord
+	with open(path) as file:
+		for line in file:
+			if not line.strip():
+				continue
+			try:
+				aRecord.append(json.loads(line))
+			except json.JSONDecodeError:
+				pass
+	return aRecord
+
+def WilsonInterval(score:float, cGame:int, z:float = 1.96) -> Tuple[float, float]:
+	"""Confidence interval for a win rate (draws as half a win); 95% by default"""
+
+	if cGame == 0:
+		return 0.0, 1.0
+	denom = 1 + z * z / cGame
+	center = (score + z * z / (2 * cGame)) / denom
+	halfWidth = z * math.sqrt(score * (1 - score) / cGame + z * z / (4 * cGame * cGame)) / denom
+	return max(0.0, center - halfWidth), min(1.0, center + halfWidth)
+
+def EloFromScore(score:float) -> float:
+	"""Rating difference implied by a win rate; infinite at 0 or 1"""
+
+	if score <= 0:
+		return -math.inf
+	if score >= 1:
+		return math.inf
+	return -400 * math.log10(1 / score - 1)
+
+def PrintReport(aRecord:List[Dict[str, object]], aName:List[str]):
+	"""Win rate with 95% interval for each player overall and each pair head to head"""
+
+	# mpPairWDL[(name, nameOther)] = [wins, draws, losses] for name against nameOther
+
+	mpPairWDL:DefaultDict[Tuple[str, str], List[int]] = defaultdict(lambda: [0, 0, 0])
+	for record in aRecord:
+		scoreRed,scoreWhite = record["score"]
+		iRed = 0 if scoreRed > scoreWhite else 1 if scoreRed == scoreWhite else 2
+		mpPairWDL[(record["red"], record["white"])][iRed] += 1
+		mpPairWDL[(record["white"], record["red"])][2 - iRed] += 1
+
+	def Line(label:str, wdl:List[int]) -> str:
+		cWin,cDraw,cLoss = wdl
+		cGame = cWin + cDraw + cLoss
+		score = (cWin + cDraw / 2) / cGame if cGame else 0.0
+		low,high = WilsonInterval(score, cGame)
+		return (f"{label:<28} {cGame:>6} {cWin:>6} {cDraw:>6} {cLoss:>6} {score:>7.3f}  [{low:.3f}, {high:.3f}]"
+				f" {EloFromScore(score):>+8.0f}")
+
+	print(f"{'player':<28} {'games':>6} {'wins':>6} {'draws':>6} {'losses':>6} {'score':>7}  95% interval     elo")
+	for name in aName:
+		wdl = [sum(mpPairWDL[(name, nameOther)][i] for nameOther in aName if nameOther != name) for i in range(3)]
+		print(Line(name, wdl))
+
+	print()
+	for nameA,nameB in itertools.combinations(aName, 2):
+		print(Line(f"{nameA} vs {nameB}", mpPairWDL[(nameA, nameB)]))
+
+	cNode = sum(record["nodes"] for record in aRecord)
+	sec = sum(record["sec"] for record in aRecord)
+	if sec > 0:
+		print(f"\n{len(aRecord)} games, {cNode / sec:.0f} nodes/sec per worker")
+
+
+def Main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--players", nargs="+", required=True, help='"name:settings", e.g. "d2:lookahead=2" or "t500:ms=500,engine=GameState"')
+	parser.add_argument("--layout", default="bl_5x5_3v3", choices=list(MpNameLayout()))
+	parser.add_argument("--openings", type=int, default=10, help="openings per pair; each is played with both colors")
+	parser.add_argument("--random-plies", type=int, default=2, help="random moves in each opening")
+	parser.add_argument("--seed", default="0")
+	parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+	parser.add_argument("--out", required=True, help="JSONL file of finished games; appended to and resumed from")
+	parser.add_argument("--report-only", action="store_true", help="just report on games already in --out")
+	args = parser.parse_args()
+
+	mpNameSpec = {}
+	for player in args.players:
+		name,_,spec = player.partition(":")
+		try:
+			Player.FromSpec(spec).Close() # check settings before starting workers
+		except ValueError as error:
+			parser.error(str(error))
+		if name in mpNameSpec:
+			parser.error(f"player {name!r} given twice")
+		mpNameSpec[name] = spec
+	if len(mpNameSpec) < 2:
+		parser.error("need at least two players")
+
+	aGame = AGameSchedule(args.layout, mpNameSpec, args.openings, args.seed, args.random_plies)
+	mpIdGame = {game.id:game for game in aGame}
+
+	# Only count records from this tournament's schedule; others (old settings, other layouts) may share the file
+
+	aRecord = [record for record in ARecordRead(args.out) if record.get("id") in mpIdGame]
+	setIdDone = {record["id"] for record in aRecord}
+	aGamePending = [game for game in aGame if game.id not in setIdDone]
+
+	if not args.report_only and aGamePending:
+		print(f"{len(aGamePending)} of {len(aGame)} games to play on {args.workers} workers", flush=True)
+		timeStart = time.perf_counter()
+		cDone = 0
+
+		with open(args.out, "a") as file, concurrent.futures.ProcessPoolExecutor(args.workers) as executor:
+			if file.tell() > 0:
+				file.write("\n") # in case the last run was cut off mid-line; blank lines are skipped on reading
+			mpFutureGame = {
+				executor.submit(_PlayScheduledGame, game.nameLayout, game.specRed, game.specWhite, game.seedOpening, game.cPlyRandom):game
+				for game in aGamePending}
+			try:
+				for future in concurrent.futures.as_completed(mpFutureGame):
+					record = mpFutureGame[future].Record(future.result())
+					file.write(json.dumps(record) + "\n")
+					file.flush()
+					aRecord.append(record)
+
+					cDone += 1
+					sec = time.perf_counter() - timeStart
+					print(f"{cDone}/{len(aGamePending)} {record['red']} (red) vs {record['white']}: {record['score'][0]}-{record['score'][1]}"
+						  f"  {cDone / sec:.2f} games/sec", flush=True)
+			except KeyboardInterrupt:
+				executor.shutdown(wait=False, cancel_futures=True)
+				print(f"interrupted; {cDone} games saved, rerun to resume")
+				raise
+
+	PrintReport(aRecord, list(mpNameSpec))
+
+
+if __name__ == "__main__":
+	Main()